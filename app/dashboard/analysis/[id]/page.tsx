@@ -56,7 +56,8 @@ import { AnimatePresence, motion } from "framer-motion"
 
 interface AnalysisResult {
     id: number
-    status: "pending" | "processing" | "completed" | "failed"
+    status: "pending" | "processing" | "completed" | "failed" | "superseded"
+    superseded_by?: number | null
     security_score: number
     performance_score: number
     reliability_score: number
@@ -108,6 +109,10 @@ export default function AnalysisPage() {
                         if (data.status === "completed" || data.status === "failed") {
                             clearInterval(pollInterval)
                             setLoading(false)
+                        } else if (data.status === "superseded" && data.superseded_by) {
+                            // New commits were pushed; follow the analysis of the newest head
+                            clearInterval(pollInterval)
+                            router.replace(`/dashboard/analysis/${data.superseded_by}`)
                         }
                     } else {
                         setError("Failed to fetch analysis result")
@@ -127,6 +132,20 @@ export default function AnalysisPage() {
         fetchAnalysis()
     }, [params.id, router])
 
+    // Resumes the failed analysis at the stage that failed (saved diff is reused)
+    const retryAnalysis = async () => {
+        const token = localStorage.getItem("token")
+        const res = await fetch(`/api/v1/analysis/retry/${params.id}`, {
+            method: "POST",
+            headers: {
+                "Authorization": `Bearer ${token}`
+            }
+        })
+        if (res.ok) {
+            window.location.reload()
+        }
+    }
+
     const getScoreColor = (score: number) => {
         if (score >= 90) return "text-green-500"
         if (score >= 70) return "text-yellow-500"
@@ -180,9 +199,14 @@ export default function AnalysisPage() {
                         {typeof result.raw_output === 'string' ? result.raw_output : JSON.stringify(result.raw_output)}
                     </pre>
                 )}
-                <Button variant="outline" onClick={() => router.back()}>
-                    Go Back
-                </Button>
+                <div className="flex gap-2">
+                    <Button variant="outline" onClick={() => router.back()}>
+                        Go Back
+                    </Button>
+                    <Button onClick={retryAnalysis}>
+                        Retry
+                    </Button>
+                </div>
             </div>
         )
     }
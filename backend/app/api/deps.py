@@ -1,4 +1,5 @@
 from typing import Generator, Optional
+import httpx
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
@@ -9,6 +10,7 @@ from app.core.config import settings
 from app.db.session import get_session
 from app.models.user import User, Token
 from app.crud.user import user as user_crud
+from app.services import http_clients
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/auth/login/access-token"
@@ -37,3 +39,7 @@ async def get_current_user(
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return user
+
+def get_github_client() -> httpx.AsyncClient:
+    """Shared, pooled client for GitHub (created in the app lifespan)."""
+    return http_clients.github()
@@ -1,14 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, Body, BackgroundTasks
-from app.services.ai_service import analyze_pr_content
-from app.api.deps import get_current_user
+from fastapi import APIRouter, Depends, HTTPException, Body, Response
+from app.services import job_queue, analysis_cache, diff_cache, github_cache, github_service, scheduler, admission
+from app.utils.github import get_real_repo_name
+from app.api.deps import get_current_user, get_github_client
 from app.models.user import User
 from app.models.pull_request import PullRequest
 from app.models.analysis import Analysis
 from app.models.repository import Repository
+from app.models.analysis_cache import AnalysisCacheEntry
+from app.models.diff_cache import DiffCacheEntry
 from app.db.session import get_session
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import select, func
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import httpx
 from pydantic import BaseModel
 
@@ -17,7 +20,8 @@ router = APIRouter()
 @router.get("/stats")
 async def get_dashboard_stats(
     db: AsyncSession = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    client: httpx.AsyncClient = Depends(get_github_client),
 ):
     """
     Get aggregated statistics for the dashboard.
@@ -26,10 +30,9 @@ async def get_dashboard_stats(
     github_login = None
     if current_user.github_token:
          try:
-             async with httpx.AsyncClient() as client:
-                 resp = await client.get("https://api.github.com/user", headers={"Authorization": f"Bearer {current_user.github_token}"})
-                 if resp.status_code == 200:
-                     github_login = resp.json().get("login")
+             resp = await client.get("https://api.github.com/user", headers={"Authorization": f"Bearer {current_user.github_token}"})
+             if resp.status_code == 200:
+                 github_login = resp.json().get("login")
          except:
              pass
 
@@ -63,6 +66,18 @@ async def get_dashboard_stats(
         .order_by(Analysis.created_at.desc())
         .limit(5)
     )
+    # 5. Open vulnerabilities: security issues in the latest completed analysis of each open PR
+    latest_completed = (
+        select(func.max(Analysis.id))
+        .join(PullRequest, Analysis.pr_id == PullRequest.id)
+        .join(Repository, PullRequest.repo_id == Repository.id)
+        .where(repo_filter, Analysis.status == "completed", PullRequest.state == "open")
+        .group_by(Analysis.pr_id)
+    )
+    vulnerabilities = (await db.execute(
+        select(func.coalesce(func.sum(Analysis.vulnerability_count), 0)).where(Analysis.id.in_(latest_completed))
+    )).scalar_one()
+
     recent_result = await db.execute(recent_query)
     recent_items = recent_result.all()
 
@@ -81,21 +96,80 @@ async def get_dashboard_stats(
     return {
         "total_analyses": total_analyses,
         "avg_confidence": 85, # Mock/Placeholder until confidence logic is solid
-        "vulnerabilities": 0, # Placeholder
+        "vulnerabilities": vulnerabilities,
         "active_repos": active_repos_count,
         "recent_activity": recent_activity
     }
 
+async def _admit_interactive(
+    db: AsyncSession, current_user: User, response: Response, diff_lines: Optional[int]
+) -> admission.AdmissionDecision:
+    """Admission control for user-triggered runs: raises 429 or sets the response status (200/202)."""
+    decision = await admission.admit(db, current_user.id, scheduler.PRIORITY_INTERACTIVE, diff_lines)
+    if decision.status_code == 429:
+        raise HTTPException(
+            status_code=429,
+            detail={
+                "message": decision.reason,
+                "predicted_wait_seconds": round(decision.predicted_wait_seconds),
+            },
+            headers={"Retry-After": str(decision.retry_after_seconds)},
+        )
+    response.status_code = decision.status_code
+    return decision
+
+async def _submit_interactive(
+    db: AsyncSession,
+    pr: PullRequest,
+    current_user: User,
+    response: Response,
+    force: bool = False,
+):
+    """
+    Shared by the trigger endpoints: resolve the PR head, attach to an in-flight
+    run if there is one, otherwise apply admission control and enqueue.
+    Returns (analysis, coalesced, decision); decision is None when coalesced.
+    """
+    repo = await db.get(Repository, pr.repo_id)
+    metadata = await github_service.fetch_pr_metadata(
+        get_real_repo_name(repo), pr.github_pr_number, current_user.github_token
+    ) if repo else None
+    head_sha = (metadata or {}).get("head", {}).get("sha")
+    if metadata and github_service.update_pr_refs(pr, metadata):
+        db.add(pr)
+        await db.commit()
+
+    # Attaching to a running analysis adds no load, so it bypasses admission control
+    in_flight = await job_queue.find_in_flight_analysis(db, pr.id, head_sha)
+    if in_flight:
+        return in_flight, True, None
+
+    diff_lines = None
+    if metadata:
+        diff_lines = metadata.get("additions", 0) + metadata.get("deletions", 0)
+    decision = await _admit_interactive(db, current_user, response, diff_lines)
+
+    # Workers resolve the user's GitHub token when they claim the job
+    analysis_record, coalesced = await job_queue.submit_analysis(
+        db, pr.id, head_sha=head_sha, user_id=current_user.id, bypass_cache=force,
+        priority=scheduler.PRIORITY_INTERACTIVE,
+    )
+    return analysis_record, coalesced, decision
+
 @router.post("/trigger/{pr_id}")
 async def analyze_pull_request(
     pr_id: int,
-    background_tasks: BackgroundTasks,
+    response: Response,
+    force: bool = False,
     db: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
     """
     Trigger an AI analysis for a specific PR.
-    This runs in the background.
+    The analysis is queued and picked up by an analysis worker.
+    If one is already in flight for the PR's current head, that analysis is returned.
+    Pass force=true to skip the analysis cache and re-run the LLM.
+    Responds 202 when the predicted wait is long and 429 when the queue is full.
     """
     # Verify PR exists and fetch repo info eagerly if possible, or lazy load in task
     # To be safe/fast, we just verify existence here.
@@ -107,113 +181,19 @@ async def analyze_pull_request(
     if not current_user.github_token:
         raise HTTPException(status_code=400, detail="GitHub token missing. Please re-login.")
 
-    # Create Initial Analysis Record
-    analysis_record = Analysis(
-        pr_id=pr_id,
-        status="processing",
-        created_at=func.now()
-    )
-    db.add(analysis_record)
-    await db.commit()
-    await db.refresh(analysis_record)
-
-    # Pass the token explicitly to the background task
-    background_tasks.add_task(perform_ai_analysis, analysis_record.id, pr_id, current_user.github_token)
-
-    return analysis_record
-
-async def perform_ai_analysis(analysis_id: int, pr_id: int, github_token: str):
-    print(f"DEBUG: Starting Analysis Task for AnalysisID={analysis_id}, PR={pr_id}")
-    async for db in get_session():
-        try:
-            # Re-fetch objects attached to this session
-            analysis = await db.get(Analysis, analysis_id)
-            pr = await db.get(PullRequest, pr_id)
-            if not analysis or not pr:
-                print(f"DEBUG: Analysis or PR not found in background task: {analysis_id}")
-                return
-            
-            # Fetch Repo to get full name
-            repo = await db.get(Repository, pr.repo_id)
-            if not repo:
-                 print(f"DEBUG: Repo not found for PR: {pr_id}")
-                 return
-
-            from app.utils.github import get_real_repo_name
-            real_full_name = get_real_repo_name(repo)
-
-            print(f"DEBUG: Fetching Diff for {real_full_name} PR #{pr.github_pr_number}")
-            # Fetch Real Diff from GitHub
-            diff_content = ""
-            try:
-                async with httpx.AsyncClient() as client:
-                    # https://api.github.com/repos/OWNER/REPO/pulls/NUMBER
-                    url = f"https://api.github.com/repos/{real_full_name}/pulls/{pr.github_pr_number}"
-                    headers = {
-                        "Authorization": f"Bearer {github_token}",
-                        "Accept": "application/vnd.github.v3.diff"
-                    }
-                    response = await client.get(url, headers=headers)
-                    if response.status_code == 200:
-                        diff_content = response.text
-                        print(f"DEBUG: Diff fetched successfully. Length: {len(diff_content)}")
-                    else:
-                        print(f"DEBUG: Failed to fetch diff: {response.status_code} {response.text}")
-                        # Fallback content
-                        diff_content = f"Could not fetch diff. PR Body: {pr.body or 'No Description'}"
-            except Exception as e:
-                print(f"DEBUG: Error fetching diff: {e}")
-                diff_content = f"Error fetching diff. PR Body: {pr.body or 'No Description'}"
+    # Create (or attach to) the Analysis Record
+    analysis_record, coalesced, decision = await _submit_interactive(db, pr, current_user, response, force)
 
-            context = f"PR Title: {pr.title}\nDescription: {pr.body}"
-            
-            # Limit diff size
-            if len(diff_content) > 30000:
-                diff_content = diff_content[:30000] + "\n...[Diff Truncated]"
-
-            # Run AI
-            print("DEBUG: Sending to AI Service...")
-            # Combine context
-            full_content = f"{context}\n\n{diff_content}"
-            result = await analyze_pr_content(pr_id, full_content)
-            print(f"DEBUG: AI Analysis Completed. Score: {result.get('score', 0)}")
-            
-            # Update Record
-            analysis.status = "completed"
-            analysis.raw_llm_output = result
-            
-            # Map specific scores (default to 0 if missing)
-            analysis.security_score = result.get("security_score", 0)
-            analysis.performance_score = result.get("performance_score", 0)
-            analysis.reliability_score = result.get("reliability_score", 0)
-            analysis.maintainability_score = result.get("maintainability_score", 0)
-            analysis.merge_confidence_score = result.get("merge_confidence", 0)
-            
-            analysis.diff_snapshot = diff_content # Save the diff snapshot
-            
-            db.add(analysis)
-            await db.commit()
-            print("DEBUG: Database Updated with Results")
-            
-        except Exception as e:
-            with open("backend_debug.log", "a") as f:
-                 f.write(f"CRASH: {str(e)}\n")
-            print(f"DEBUG: Background Task Crash: {e}")
-            import traceback
-            traceback.print_exc()
-            try:
-                if 'analysis' in locals() and analysis:
-                    analysis.status = "failed"
-                    analysis.raw_llm_output = {"error": str(e)}
-                    # Optionally save diff even on failure if we have it
-                    if 'diff_content' in locals():
-                        analysis.diff_snapshot = diff_content
-                    db.add(analysis)
-                    await db.commit()
-            except:
-                pass
-        finally:
-            break
+    # Not model_dump(): the checkpoint (prompt, prepared diff, route) and diff snapshot are internal
+    return {
+        "id": analysis_record.id,
+        "pr_id": analysis_record.pr_id,
+        "status": analysis_record.status,
+        "stage": analysis_record.stage,
+        "cache_status": analysis_record.cache_status,
+        "coalesced": coalesced,
+        "predicted_completion": decision.predicted_completion if decision else None,
+    }
 
 class AnalysisTriggerRequest(BaseModel):
     repo_id: int
@@ -221,11 +201,12 @@ class AnalysisTriggerRequest(BaseModel):
     title: str = "Unknown PR"
     html_url: str = ""
     author: str = "unknown"
+    force: bool = False # Skip the analysis cache
 
 @router.post("/trigger-live")
 async def trigger_live_analysis(
     req: AnalysisTriggerRequest,
-    background_tasks: BackgroundTasks,
+    response: Response,
     db: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
@@ -257,26 +238,100 @@ async def trigger_live_analysis(
             await db.commit()
             await db.refresh(pr)
         
-        # 2. Create Analysis Record
-        analysis_record = Analysis(
-            pr_id=pr.id,
-            status="processing",
-            created_at=func.now()
+        # 2. Create (or attach to) the Analysis Record and enqueue it
+        analysis_record, coalesced, decision = await _submit_interactive(
+            db, pr, current_user, response, req.force
         )
-        db.add(analysis_record)
-        await db.commit()
-        await db.refresh(analysis_record)
-
-        # 3. Trigger Background Task
-        background_tasks.add_task(perform_ai_analysis, analysis_record.id, pr.id, current_user.github_token)
 
-        return {"analysis_id": analysis_record.id, "status": "processing"}
+        return {
+            "analysis_id": analysis_record.id,
+            "status": analysis_record.status,
+            "coalesced": coalesced,
+            "queue_position": await scheduler.queue_position(db, analysis_record.id),
+            "predicted_completion": decision.predicted_completion if decision else None,
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
         print(f"CRITICAL ERROR in trigger-live: {e}")
         raise HTTPException(status_code=500, detail=f"Trigger Failed: {str(e)}")
 
+@router.post("/retry/{analysis_id}")
+async def retry_analysis(
+    analysis_id: int,
+    response: Response,
+    db: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Re-run a failed analysis from the stage that failed.
+    The saved diff and earlier stage outputs are reused; GitHub is not contacted again
+    unless the diff fetch itself was what failed.
+    Goes through the same admission control as the trigger endpoints.
+    Responds 409 if the analysis is already requeued or its PR has a newer head.
+    """
+    analysis = await db.get(Analysis, analysis_id)
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    if analysis.status != "failed":
+        raise HTTPException(status_code=400, detail=f"Only failed analyses can be retried (status: {analysis.status})")
+
+    decision = await _admit_interactive(db, current_user, response, analysis.diff_lines)
+    try:
+        analysis, _ = await job_queue.resubmit_failed_analysis(
+            db, analysis.id, user_id=current_user.id, priority=scheduler.PRIORITY_INTERACTIVE,
+        )
+    except job_queue.RetryRefused as e:
+        await db.rollback() # Releases the PR lock
+        raise HTTPException(status_code=409, detail=str(e))
+    return {
+        "analysis_id": analysis.id,
+        "status": analysis.status,
+        "resume_stage": analysis.stage,
+        "predicted_completion": decision.predicted_completion,
+    }
+
+@router.get("/cache/stats")
+async def get_cache_stats(
+    db: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Analysis cache effectiveness. Totals are derived from Analysis.cache_status so
+    they cover every worker; `process` holds this API process's own counters.
+    """
+    status_result = await db.execute(
+        select(Analysis.cache_status, func.count(Analysis.id))
+        .where(Analysis.cache_status != None)
+        .group_by(Analysis.cache_status)
+    )
+    by_status = dict(status_result.all())
+    hits = by_status.get("hit", 0)
+    misses = by_status.get("miss", 0)
+
+    entries_result = await db.execute(select(func.count(AnalysisCacheEntry.key)))
+    diff_entries, diff_bytes = (await db.execute(
+        select(func.count(DiffCacheEntry.key), func.coalesce(func.sum(DiffCacheEntry.size_bytes), 0))
+    )).one()
+
+    return {
+        "hits": hits,
+        "misses": misses,
+        "bypassed": by_status.get("bypass", 0),
+        "similar_reused": by_status.get("similar", 0),
+        "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+        "entries": entries_result.scalar_one(),
+        "process": analysis_cache.process_stats(),
+        "diff_cache": {
+            "entries": diff_entries,
+            "bytes": diff_bytes,
+            "process": diff_cache.process_stats(),
+        },
+        "github_cache": github_cache.process_stats(),
+    }
+
 @router.get("/result/{analysis_id}")
 async def get_analysis_result(
     analysis_id: int,
@@ -296,6 +351,9 @@ async def get_analysis_result(
     response_data = {
         "id": analysis.id,
         "status": analysis.status,
+        "superseded_by": analysis.superseded_by,
+        "queue_position": await scheduler.queue_position(db, analysis.id),
+        "model_tier": analysis.model_tier,
         "score": analysis.security_score, # For backward compatibility
         "security_score": analysis.security_score,
         "performance_score": analysis.performance_score,
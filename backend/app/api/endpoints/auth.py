@@ -10,6 +10,7 @@ from app.crud.user import user as user_crud
 from app.models.user import UserCreate, UserRead, User, Token, UserSignup
 from sqlmodel import SQLModel
 from app.api import deps
+from app.services import github_scheduler
 import asyncio
 
 router = APIRouter()
@@ -18,10 +19,21 @@ router = APIRouter()
 async def read_users_me(current_user: User = Depends(deps.get_current_user)):
     return current_user
 
+@router.get("/me/rate-limit")
+async def read_users_me_rate_limit(current_user: User = Depends(deps.get_current_user)):
+    """
+    The GitHub API budget left on the user's token, per resource (core,
+    graphql, search), and how many of their requests are queued for it.
+    """
+    if not current_user.github_token:
+        raise HTTPException(status_code=400, detail="GitHub token missing")
+    return await github_scheduler.budget_for(current_user.github_token)
+
 @router.delete("/me", status_code=204)
 async def delete_users_me(
     current_user: User = Depends(deps.get_current_user),
     db: AsyncSession = Depends(get_session),
+    client: httpx.AsyncClient = Depends(deps.get_github_client),
 ):
     """
     Delete own account and all associated data (Repositories, PRs, Analyses).
@@ -38,10 +50,9 @@ async def delete_users_me(
     # Fetch GitHub Login if token available (to find legacy repos)
     if current_user.github_token:
          try:
-             async with httpx.AsyncClient() as client:
-                 resp = await client.get("https://api.github.com/user", headers={"Authorization": f"Bearer {current_user.github_token}"})
-                 if resp.status_code == 200:
-                     github_login = resp.json().get("login")
+             resp = await client.get("https://api.github.com/user", headers={"Authorization": f"Bearer {current_user.github_token}"})
+             if resp.status_code == 200:
+                 github_login = resp.json().get("login")
          except:
              pass
 
@@ -84,60 +95,63 @@ async def login_github():
     }
 
 @router.get("/login/github/callback")
-async def login_github_callback(code: str, db: AsyncSession = Depends(get_session)):
+async def login_github_callback(
+    code: str,
+    db: AsyncSession = Depends(get_session),
+    client: httpx.AsyncClient = Depends(deps.get_github_client),
+):
     try:
-        async with httpx.AsyncClient() as client:
-            # Exchange code for token
-            response = await client.post(
-                "https://github.com/login/oauth/access_token",
-                headers={"Accept": "application/json"},
-                json={
-                    "client_id": settings.GITHUB_CLIENT_ID,
-                    "client_secret": settings.GITHUB_CLIENT_SECRET,
-                    "code": code,
-                    "redirect_uri": settings.GITHUB_REDIRECT_URI,
-                },
-            )
-            print(f"DEBUG: GitHub OAuth Response {response.status_code}: {response.text}")
-            if response.status_code != 200:
-                # Print actual error from GitHub
-                print(f"ERROR: GitHub Auth Failed: {response.text}")
-                raise HTTPException(status_code=400, detail=f"Failed to authenticate with GitHub: {response.text}")
+        # Exchange code for token
+        response = await client.post(
+            "https://github.com/login/oauth/access_token",
+            headers={"Accept": "application/json"},
+            json={
+                "client_id": settings.GITHUB_CLIENT_ID,
+                "client_secret": settings.GITHUB_CLIENT_SECRET,
+                "code": code,
+                "redirect_uri": settings.GITHUB_REDIRECT_URI,
+            },
+        )
+        print(f"DEBUG: GitHub OAuth Response {response.status_code}: {response.text}")
+        if response.status_code != 200:
+            # Print actual error from GitHub
+            print(f"ERROR: GitHub Auth Failed: {response.text}")
+            raise HTTPException(status_code=400, detail=f"Failed to authenticate with GitHub: {response.text}")
             
-            token_data = response.json()
-            access_token = token_data.get("access_token")
-            if not access_token:
-                raise HTTPException(status_code=400, detail="Failed to get access token")
-
-            # Parallel Fetch: User Info and Emails
-            async def fetch_user():
-                return await client.get("https://api.github.com/user", headers={"Authorization": f"Bearer {access_token}"})
+        token_data = response.json()
+        access_token = token_data.get("access_token")
+        if not access_token:
+            raise HTTPException(status_code=400, detail="Failed to get access token")
+
+        # Parallel Fetch: User Info and Emails
+        async def fetch_user():
+            return await client.get("https://api.github.com/user", headers={"Authorization": f"Bearer {access_token}"})
             
-            async def fetch_emails():
-                return await client.get("https://api.github.com/user/emails", headers={"Authorization": f"Bearer {access_token}"})
+        async def fetch_emails():
+            return await client.get("https://api.github.com/user/emails", headers={"Authorization": f"Bearer {access_token}"})
 
-            user_resp, email_resp = await asyncio.gather(fetch_user(), fetch_emails())
+        user_resp, email_resp = await asyncio.gather(fetch_user(), fetch_emails())
 
-            if user_resp.status_code != 200:
-                raise HTTPException(status_code=400, detail="Failed to get user info")
+        if user_resp.status_code != 200:
+            raise HTTPException(status_code=400, detail="Failed to get user info")
             
-            github_user = user_resp.json()
+        github_user = user_resp.json()
             
-            # Get User Email (Prioritize Primary from /user/emails)
-            email = None
-            if email_resp.status_code == 200:
-                emails = email_resp.json()
-                if isinstance(emails, list):
-                    primary_email_obj = next((e for e in emails if e.get("primary")), None)
-                    if primary_email_obj:
-                        email = primary_email_obj["email"]
+        # Get User Email (Prioritize Primary from /user/emails)
+        email = None
+        if email_resp.status_code == 200:
+            emails = email_resp.json()
+            if isinstance(emails, list):
+                primary_email_obj = next((e for e in emails if e.get("primary")), None)
+                if primary_email_obj:
+                    email = primary_email_obj["email"]
             
-            # Fallback to public profile email if verified primary not accessible
-            if not email:
-                email = github_user.get("email")
+        # Fallback to public profile email if verified primary not accessible
+        if not email:
+            email = github_user.get("email")
 
-            if not email:
-                raise HTTPException(status_code=400, detail="No verified email found from GitHub")
+        if not email:
+            raise HTTPException(status_code=400, detail="No verified email found from GitHub")
 
         # Check or Create User
         user = await user_crud.get_by_email(db, email=email)
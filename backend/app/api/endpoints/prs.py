@@ -6,7 +6,9 @@ from app.models.pull_request import PullRequest
 from app.models.analysis import Analysis
 from app.models.repository import Repository
 from app.models.user import User
-from app.api.deps import get_current_user
+from app.api.deps import get_current_user, get_github_client
+from app.services import diff_cache
+from app.services.github_service import update_pr_refs
 import httpx
 from typing import Dict
 
@@ -37,7 +39,8 @@ async def get_pr_diff(
     repo_id: int,
     pr_number: int,
     db: AsyncSession = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    client: httpx.AsyncClient = Depends(get_github_client),
 ):
     # 1. Get Repo
     repo = await db.get(Repository, repo_id)
@@ -48,37 +51,54 @@ async def get_pr_diff(
          raise HTTPException(status_code=400, detail="GitHub token missing")
 
     # 2. Fetch Diff from GitHub
-    async with httpx.AsyncClient() as client:
-        # We need the PR title too for display, so we might need to fetch PR details if not in DB?
-        # A simple diff fetch is fast. We can get title from the Pull list page state ideally, 
-        # but here we might want to fetch PR info from GitHub too if we want the title.
-        # For now, let's just fetch the diff. The frontend can pass the title or we fetch it.
-        # To be premium, let's fetch the PR details to get the title.
+    # We need the PR title too for display, so we might need to fetch PR details if not in DB?
+    # A simple diff fetch is fast. We can get title from the Pull list page state ideally, 
+    # but here we might want to fetch PR info from GitHub too if we want the title.
+    # For now, let's just fetch the diff. The frontend can pass the title or we fetch it.
+    # To be premium, let's fetch the PR details to get the title.
         
-        from app.utils.github import get_real_repo_name
-        real_full_name = get_real_repo_name(repo)
+    from app.utils.github import get_real_repo_name
+    real_full_name = get_real_repo_name(repo)
         
-        headers = {
-            "Authorization": f"Bearer {current_user.github_token}",
-            "Accept": "application/vnd.github.v3+json" 
-        }
-        
-        # Parallel fetch: Diff and PR Details
-        pr_url = f"https://api.github.com/repos/{real_full_name}/pulls/{pr_number}"
+    headers = {
+        "Authorization": f"Bearer {current_user.github_token}",
+        "Accept": "application/vnd.github.v3+json" 
+    }
         
-        # We need 2 requests: one for metadata (JSON), one for Diff (application/vnd.github.v3.diff)
+    # Parallel fetch: Diff and PR Details
+    pr_url = f"https://api.github.com/repos/{real_full_name}/pulls/{pr_number}"
         
-        pr_res = await client.get(pr_url, headers=headers)
-        if pr_res.status_code != 200:
-             raise HTTPException(status_code=pr_res.status_code, detail="PR not found on GitHub")
+    # We need 2 requests: one for metadata (JSON), one for Diff (streamed below)
         
-        pr_data = pr_res.json()
+    pr_res = await client.get(pr_url, headers=headers)
+    if pr_res.status_code != 200:
+         raise HTTPException(status_code=pr_res.status_code, detail="PR not found on GitHub")
         
-        diff_res = await client.get(pr_url, headers={**headers, "Accept": "application/vnd.github.v3.diff"})
+    pr_data = pr_res.json()
         
-        return {
-            "diff": diff_res.text if diff_res.status_code == 200 else "Error loading diff",
-            "title": pr_data.get("title", f"PR #{pr_number}"),
-            "repo_name": repo.name,
-            "pr_number": pr_number
-        }
+    # Streamed and capped at DIFF_MAX_BYTES; huge vendored diffs are cut at a file boundary
+    # Record the head we just saw; analyses of this commit then reuse the cached diff
+    result = await db.execute(
+        select(PullRequest).where(PullRequest.repo_id == repo_id, PullRequest.github_pr_number == pr_number)
+    )
+    pr = result.scalars().first()
+    if pr and update_pr_refs(pr, pr_data):
+        db.add(pr)
+        await db.commit()
+
+    download = await diff_cache.fetch_pr_diff(
+        db,
+        repo,
+        pr_number,
+        current_user.github_token,
+        head_sha=(pr_data.get("head") or {}).get("sha"),
+        base_ref=(pr_data.get("base") or {}).get("ref"),
+    )
+
+    return {
+        "diff": download.text if download.status_code == 200 else "Error loading diff",
+        "truncated": download.truncated,
+        "title": pr_data.get("title", f"PR #{pr_number}"),
+        "repo_name": repo.name,
+        "pr_number": pr_number
+    }
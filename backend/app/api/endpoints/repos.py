@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException
-from typing import Any, List
+from typing import Any, List, Optional
 import httpx
 from app.api import deps
 from app.models.user import User
@@ -7,6 +7,9 @@ from app.models.repository import Repository
 from sqlmodel import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
+from app.core.config import settings
+from app.services import bulk_analysis, github_graphql, github_scheduler, http_clients, scheduler
+from app.services.github_service import GitHubAPIError, fetch_pages
 
 router = APIRouter()
 
@@ -21,10 +24,14 @@ class Repo(BaseModel):
     html_url: str
     is_active: bool = False
 
+class RepoToggle(Repo):
+    analyze_open_prs: Optional[bool] = None # On activation, queue analyses of all open PRs (default: ANALYZE_ON_ACTIVATE)
+
 @router.get("/list", response_model=List[Repo])
 async def list_repos(
     db: AsyncSession = Depends(deps.get_session),
     current_user: User = Depends(deps.get_current_user),
+    client: httpx.AsyncClient = Depends(deps.get_github_client),
 ) -> Any:
     """
     Fetch repositories from GitHub for the current user.
@@ -35,69 +42,69 @@ async def list_repos(
         # Better: Return empty list.
         return []
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            "https://api.github.com/user/repos?sort=updated&per_page=100",
-            headers={
-                "Authorization": f"Bearer {current_user.github_token}",
-                "Accept": "application/vnd.github.v3+json"
-            }
-        )
-        
-        if response.status_code != 200:
-             # Token might be expired or revoked
-             # In a real app, we'd handle this more gracefully (clear token, ask re-auth)
-             raise HTTPException(status_code=400, detail="Failed to fetch repositories from GitHub")
+    headers = {
+        "Authorization": f"Bearer {current_user.github_token}",
+        "Accept": "application/vnd.github.v3+json"
+    }
+    # Every page (not just the first 100 repos), the rest fetched concurrently
+    pages = {}
+    try:
+        async for page, items in fetch_pages("https://api.github.com/user/repos?sort=updated&per_page=100", headers):
+            pages[page] = items
+    except GitHubAPIError:
+         # Token might be expired or revoked
+         # In a real app, we'd handle this more gracefully (clear token, ask re-auth)
+         raise HTTPException(status_code=400, detail="Failed to fetch repositories from GitHub")
 
-        repos_data = response.json()
+    repos_data = [r for page in sorted(pages) for r in pages[page]] # Keep GitHub's order
         
-        # Get active repos from DB (Scoped to User)
-        # Fix Data Disappearance: Support both Email (new) and GitHub Login (legacy)
-        # CRITICAL: Always fetch login from API, don't rely on repo list (which might be empty)
-        github_login = None
-        try:
-            user_resp = await client.get("https://api.github.com/user", headers=headers)
-            if user_resp.status_code == 200:
-                github_login = user_resp.json().get("login")
-                print(f"DEBUG: Resolved GitHub Login: {github_login}")
-        except Exception as e:
-            print(f"DEBUG: Failed to resolve GitHub Login: {e}")
+    # Get active repos from DB (Scoped to User)
+    # Fix Data Disappearance: Support both Email (new) and GitHub Login (legacy)
+    # CRITICAL: Always fetch login from API, don't rely on repo list (which might be empty)
+    github_login = None
+    try:
+        user_resp = await client.get("https://api.github.com/user", headers=headers)
+        if user_resp.status_code == 200:
+            github_login = user_resp.json().get("login")
+            print(f"DEBUG: Resolved GitHub Login: {github_login}")
+    except Exception as e:
+        print(f"DEBUG: Failed to resolve GitHub Login: {e}")
 
-        filters = [Repository.owner_login == current_user.email]
-        if github_login:
-            filters.append(Repository.owner_login == github_login)
+    filters = [Repository.owner_login == current_user.email]
+    if github_login:
+        filters.append(Repository.owner_login == github_login)
             
-        from sqlmodel import or_
-        active_repos_result = await db.execute(
-            select(Repository).where(
-                Repository.is_active == True,
-                or_(*filters)
-            )
+    from sqlmodel import or_
+    active_repos_result = await db.execute(
+        select(Repository).where(
+            Repository.is_active == True,
+            or_(*filters)
         )
-        active_repos = active_repos_result.scalars().all()
-        # Create a set of active html_urls for easy lookup (assuming html_url is unique enough and consistent)
-        active_urls = {r.html_url for r in active_repos}
+    )
+    active_repos = active_repos_result.scalars().all()
+    # Create a set of active html_urls for easy lookup (assuming html_url is unique enough and consistent)
+    active_urls = {r.html_url for r in active_repos}
         
-        # Transform to our model
-        repos = []
-        for r in repos_data:
-            repos.append(Repo(
-                name=r["name"],
-                description=r["description"],
-                language=r["language"],
-                stars=r["stargazers_count"],
-                forks=r["forks_count"],
-                updated_at=r["updated_at"], # ISO string
-                private=r["private"],
-                html_url=r["html_url"],
-                is_active=r["html_url"] in active_urls
-            ))
+    # Transform to our model
+    repos = []
+    for r in repos_data:
+        repos.append(Repo(
+            name=r["name"],
+            description=r["description"],
+            language=r["language"],
+            stars=r["stargazers_count"],
+            forks=r["forks_count"],
+            updated_at=r["updated_at"], # ISO string
+            private=r["private"],
+            html_url=r["html_url"],
+            is_active=r["html_url"] in active_urls
+        ))
             
-        return repos
+    return repos
             
 @router.post("/toggle")
 async def toggle_repo_status(
-    repo_in: Repo,
+    repo_in: RepoToggle,
     db: AsyncSession = Depends(deps.get_session),
     current_user: User = Depends(deps.get_current_user),
 ):
@@ -152,14 +159,114 @@ async def toggle_repo_status(
             print(f"Sync failed for {repo.name}: {e}")
             # Don't fail the toggle, just log
 
-    return {"status": "updated", "is_active": repo.is_active}
+    # Pre-warm: results are ready by the time the dashboard is opened
+    bulk = None
+    analyze = repo_in.analyze_open_prs if repo_in.analyze_open_prs is not None else settings.ANALYZE_ON_ACTIVATE
+    if repo.is_active and analyze:
+        bulk = await bulk_analysis.queue_open_prs(db, repo, current_user.id)
+
+    return {"status": "updated", "is_active": repo.is_active, "bulk_analysis": bulk}
+
+async def _owned_repo(db: AsyncSession, repo_id: int, current_user: User) -> Repository:
+    """
+    The repository, if current_user owns it: owner_login is their email (as in
+    _resolve_token_owner) or, for repositories registered from GitHub, their
+    GitHub login. 404 if it doesn't exist, 403 if it isn't theirs.
+    """
+    repo = await db.get(Repository, repo_id)
+    if not repo:
+        raise HTTPException(status_code=404, detail="Repository not found")
+    if repo.owner_login == current_user.email:
+        return repo
+    if current_user.github_token:
+        try:
+            response = await http_clients.github().get(
+                "https://api.github.com/user",
+                headers={"Authorization": f"Bearer {current_user.github_token}", "Accept": "application/vnd.github.v3+json"},
+            )
+            if response.status_code == 200 and response.json().get("login") == repo.owner_login:
+                return repo
+        except httpx.HTTPError as e:
+            print(f"DEBUG: Could not read GitHub login for ownership check: {e}")
+    raise HTTPException(status_code=403, detail="Not the owner of this repository")
+
+@router.post("/{repo_id}/analyze-all")
+async def analyze_all_open_prs(
+    repo_id: int,
+    db: AsyncSession = Depends(deps.get_session),
+    current_user: User = Depends(deps.get_current_user),
+):
+    """
+    Queue analyses for every open PR of the repository at bulk priority.
+    PRs are synced from GitHub first so new PRs and heads are included.
+    """
+    repo = await _owned_repo(db, repo_id, current_user)
+
+    if current_user.github_token:
+        try:
+            await sync_repo_prs(repo, current_user.github_token, db)
+        except Exception as e:
+            print(f"Sync failed for {repo.name}: {e}") # Analyze what we already know about
+
+    counts = await bulk_analysis.queue_open_prs(db, repo, current_user.id)
+    return {**counts, "progress": await bulk_analysis.repo_progress(db, repo_id)}
+
+@router.get("/{repo_id}/analysis-progress")
+async def get_analysis_progress(
+    repo_id: int,
+    db: AsyncSession = Depends(deps.get_session),
+    current_user: User = Depends(deps.get_current_user),
+):
+    """Share of the repository's open PRs that have a result for their current head."""
+    await _owned_repo(db, repo_id, current_user)
+    return await bulk_analysis.repo_progress(db, repo_id)
+
 
+class ReviewFilters(BaseModel):
+    review_ignore: List[str] = [] # Globs skipped in reviews on top of the defaults; "!glob" re-includes
 
-async def sync_repo_prs(repo: Repository, token: str, db: AsyncSession):
+@router.get("/{repo_id}/review-filters")
+async def get_review_filters(
+    repo_id: int,
+    db: AsyncSession = Depends(deps.get_session),
+    current_user: User = Depends(deps.get_current_user),
+):
+    """
+    The repository's review filter globs, plus the built-in defaults
+    (lockfiles, vendored, generated and binary files) they extend.
+    """
+    from app.services.diff_filter import DEFAULT_RULES
+
+    repo = await _owned_repo(db, repo_id, current_user)
+    return {
+        "review_ignore": repo.review_ignore or [],
+        "defaults": [{"pattern": pattern, "reason": reason} for pattern, reason in DEFAULT_RULES],
+    }
+
+@router.put("/{repo_id}/review-filters")
+async def update_review_filters(
+    repo_id: int,
+    filters: ReviewFilters,
+    db: AsyncSession = Depends(deps.get_session),
+    current_user: User = Depends(deps.get_current_user),
+):
+    """Replace the repository's review filter globs. Applies to analyses started afterwards."""
+    repo = await _owned_repo(db, repo_id, current_user)
+    repo.review_ignore = [rule.strip() for rule in filters.review_ignore if rule.strip()]
+    db.add(repo)
+    await db.commit()
+    return {"status": "updated", "review_ignore": repo.review_ignore}
+
+
+async def sync_repo_prs(
+    repo: Repository, token: str, db: AsyncSession, priority: int = scheduler.PRIORITY_INTERACTIVE
+):
     """
     Fetch open PRs from GitHub and persist to DB.
+    Handlers awaiting it keep the interactive priority; background callers pass
+    PRIORITY_BULK so they yield the token's budget (see github_scheduler).
     """
-    from app.models.pull_request import PullRequest
+    from app.services.github_service import close_unlisted_pull_requests, upsert_pull_requests
     import re
     
     # Correct Logic: Always prefer html_url parsing if available, as our stored full_name 
@@ -177,75 +284,42 @@ async def sync_repo_prs(repo: Repository, token: str, db: AsyncSession):
             pass # Fallback to existing target_name
             
     url = f"https://api.github.com/repos/{target_name}/pulls?state=open&per_page=50"
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Accept": "application/vnd.github.v3+json"
+    }
     
     with open("pr_debug.log", "a") as f:
         f.write(f"Fetching fetching URL: {url}\n")
     
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            url,
-            headers={
-                "Authorization": f"Bearer {token}",
-                "Accept": "application/vnd.github.v3+json"
-            }
-        )
-        
+    # Each page is upserted as it arrives; PRs missing from the complete listing were closed
+    open_numbers = set()
+    try:
+        with github_scheduler.priority(priority):
+            async for page, prs_data in fetch_pages(url, headers):
+                open_numbers.update(pr_data["number"] for pr_data in prs_data)
+                await upsert_pull_requests(db, repo, prs_data)
+    except GitHubAPIError as e:
         with open("pr_debug.log", "a") as f:
-            f.write(f"GitHub Response: {response.status_code}\n")
-        
-        if response.status_code == 200:
-            prs_data = response.json()
-            with open("pr_debug.log", "a") as f:
-                f.write(f"Found {len(prs_data)} PRs\n")
-            
-            # Upsert Logic
-            from dateutil import parser
-            
-            for pr_data in prs_data:
-                # Check exist
-                stmt = select(PullRequest).where(
-                    PullRequest.repo_id == repo.id,
-                    PullRequest.github_pr_number == pr_data["number"]
-                )
-                res = await db.execute(stmt)
-                existing_pr = res.scalars().first()
-                
-                # Parse GitHub timestamps
-                updated_at_dt = parser.parse(pr_data["updated_at"])
-                
-                if existing_pr:
-                    existing_pr.title = pr_data["title"]
-                    existing_pr.state = pr_data["state"]
-                    existing_pr.body = pr_data.get("body")
-                    existing_pr.author_avatar_url = pr_data["user"].get("avatar_url")
-                    existing_pr.updated_at = updated_at_dt # SYNC TIME
-                    db.add(existing_pr)
-                else:
-                    new_pr = PullRequest(
-                        repo_id=repo.id,
-                        github_pr_number=pr_data["number"],
-                        title=pr_data["title"],
-                        state=pr_data["state"],
-                        author_login=pr_data["user"]["login"],
-                        author_avatar_url=pr_data["user"].get("avatar_url"),
-                        html_url=pr_data["html_url"],
-                        body=pr_data.get("body")
-                    )
-                    new_pr.updated_at = updated_at_dt # SYNC TIME
-                    # created_at defaults to now(), which is fine for "when we discovered it"
-                    # But if needed, we could fetch created_at from GitHub too.
-                    db.add(new_pr)
-            
-            await db.commit()
+            f.write(f"GitHub Response: {e.status_code}\n")
+        return
+
+    with open("pr_debug.log", "a") as f:
+        f.write(f"Found {len(open_numbers)} PRs\n")
+    await close_unlisted_pull_requests(db, repo, open_numbers)
 
 
 @router.get("/pulls")
 async def list_active_pulls(
+    refresh: bool = False,
     db: AsyncSession = Depends(deps.get_session),
     current_user: User = Depends(deps.get_current_user),
+    client: httpx.AsyncClient = Depends(deps.get_github_client),
 ):
     """
     Fetch OPEN Pull Requests for all ACTIVE repositories from DB.
+    With refresh=true they are first synced from GitHub, all repositories
+    in a couple of GraphQL queries (github_graphql).
     """
     print(f"DEBUG: Entering list_active_pulls for user {current_user.email}")
     from app.models.pull_request import PullRequest
@@ -273,13 +347,12 @@ async def list_active_pulls(
         # Let's fetch it from GitHub /user endpoint. It's fast (ms).
         github_login = None
         if current_user.github_token:
-             async with httpx.AsyncClient() as client:
-                 try:
-                     resp = await client.get("https://api.github.com/user", headers={"Authorization": f"Bearer {current_user.github_token}"})
-                     if resp.status_code == 200:
-                         github_login = resp.json().get("login")
-                 except:
-                     pass
+             try:
+                 resp = await client.get("https://api.github.com/user", headers={"Authorization": f"Bearer {current_user.github_token}"})
+                 if resp.status_code == 200:
+                     github_login = resp.json().get("login")
+             except:
+                 pass
 
         from sqlmodel import or_
         filters = [Repository.owner_login == current_user.email]
@@ -298,6 +371,12 @@ async def list_active_pulls(
         
         if not active_repo_ids:
             return []
+
+        if refresh and current_user.github_token:
+            try:
+                await github_graphql.sync_open_prs(db, active_repos, current_user.github_token)
+            except Exception as e:
+                print(f"DEBUG: GraphQL sync failed, listing stored PRs: {e}")
             
         # 2. Get PRs from DB - Order by UPDATED_AT desc for liveliness
         stmt = select(PullRequest).where(PullRequest.repo_id.in_(active_repo_ids)).order_by(PullRequest.updated_at.desc())
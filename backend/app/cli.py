@@ -0,0 +1,568 @@
+"""
+Command-line tools.
+
+    python -m app.cli backfill --repo owner/name --token $GITHUB_TOKEN --limit 500
+    python -m app.cli backfill --repo owner/name --diff-dir ./diffs
+    python -m app.cli stub-llm --port 7861
+    python -m app.cli stub-github --port 7862
+
+backfill reviews historical PRs (closed PRs of a repository, or a directory of
+.diff files) with the same preprocessing and analyze_pr_content path as the
+worker, but without the job queue: a bounded number of PRs in flight, rows
+written in bulk, and a checkpoint file so an interrupted run resumes where it
+stopped. Analyses are dated at the PR's close time so quality trends line up
+with releases.
+
+stub-llm serves the LLM service's /review API with canned, deterministic
+reviews, for exercising backfill (or the worker) without a model:
+
+    python -m app.cli stub-llm --port 7861 &
+    python -m app.cli backfill --diff-dir ./diffs --llm-url http://127.0.0.1:7861 --dry-run
+
+stub-github does the same for the GraphQL open-PR sync (github_graphql); run
+the API with GITHUB_GRAPHQL_URL=http://127.0.0.1:7862/graphql.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+from pydantic import BaseModel
+from sqlalchemy import insert
+from sqlmodel import select
+
+from app.core.config import settings
+from app.services import diff_filter, github_scheduler, http_clients, model_router, scheduler, static_analysis, token_budget
+from app.services.ai_service import LLMServiceError, analyze_pr_content, is_fallback_result
+from app.services.analysis_service import (
+    RETRY_POLICIES, attach_findings, count_changed_lines, pr_context, prepare_diff, result_columns,
+)
+from app.services.diff_download import stream_pr_diff
+from app.services.diff_parser import render_diff
+
+_NUMBER = re.compile(r"^(\d+)")
+
+class BackfillItem(BaseModel):
+    key: str # Checkpoint key: "pr:<number>" or "file:<name>"
+    number: Optional[int] = None
+    title: str
+    body: Optional[str] = None
+    author_login: str = "unknown"
+    html_url: str = ""
+    head_sha: Optional[str] = None
+    base_ref: Optional[str] = None
+    base_sha: Optional[str] = None
+    closed_at: datetime
+    diff: Optional[str] = None # Local files only; PR diffs are downloaded when the item is processed
+
+class BackfillResult(BaseModel):
+    item: BackfillItem
+    result: dict
+    model_tier: Optional[str] = None
+    diff_lines: Optional[int] = None
+    inference_ms: Optional[int] = None
+
+class Checkpoint:
+    """Keys of items whose rows are committed. Saved atomically after every flush."""
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Set[str] = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                self.done = set(json.load(f).get("done", []))
+
+    def save(self, keys: List[str]):
+        self.done.update(keys)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"done": sorted(self.done), "updated_at": datetime.utcnow().isoformat()}, f)
+        os.replace(tmp, self.path)
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+
+async def _closed_prs(full_name: str, token: Optional[str], limit: int, merged_only: bool, since: Optional[datetime]) -> AsyncIterator[BackfillItem]:
+    """Closed PRs, most recently updated first."""
+    headers = {"Accept": "application/vnd.github.v3+json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    seen = 0
+    page = 1
+    client = http_clients.github()
+    while seen < limit:
+        response = await client.get(
+            f"https://api.github.com/repos/{full_name}/pulls",
+            params={"state": "closed", "sort": "updated", "direction": "desc", "per_page": 100, "page": page},
+            headers=headers,
+            timeout=30,
+        )
+        if response.status_code != 200:
+            print(f"BACKFILL: Listing PRs failed: {response.status_code} {response.text[:200]}")
+            return
+        prs = response.json()
+        if not prs:
+            return
+        for pr in prs:
+            updated_at = _parse_time(pr.get("updated_at"))
+            if since and updated_at and updated_at < since:
+                return
+            if merged_only and not pr.get("merged_at"):
+                continue
+            seen += 1
+            yield BackfillItem(
+                key=f"pr:{pr['number']}",
+                number=pr["number"],
+                title=pr.get("title") or f"PR #{pr['number']}",
+                body=pr.get("body"),
+                author_login=(pr.get("user") or {}).get("login", "unknown"),
+                html_url=pr.get("html_url", ""),
+                head_sha=(pr.get("head") or {}).get("sha"),
+                base_ref=(pr.get("base") or {}).get("ref"),
+                base_sha=(pr.get("base") or {}).get("sha"),
+                closed_at=_parse_time(pr.get("merged_at") or pr.get("closed_at")) or datetime.utcnow(),
+            )
+            if seen >= limit:
+                return
+        page += 1
+
+async def _diff_files(directory: str, limit: int) -> AsyncIterator[BackfillItem]:
+    """*.diff / *.patch files; a leading number in the name ("1234-fix.diff") is used as the PR number."""
+    names = sorted(n for n in os.listdir(directory) if n.endswith((".diff", ".patch")))
+    for name in names[:limit]:
+        path = os.path.join(directory, name)
+        with open(path, encoding="utf-8", errors="replace") as f:
+            diff = f.read()
+        stem = os.path.splitext(name)[0]
+        match = _NUMBER.match(stem)
+        yield BackfillItem(
+            key=f"file:{name}",
+            number=int(match.group(1)) if match else None,
+            title=stem,
+            closed_at=datetime.utcfromtimestamp(os.path.getmtime(path)),
+            diff=diff,
+        )
+
+class Backfill:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.checkpoint = Checkpoint(args.checkpoint)
+        self.repo = None
+        self.repo_rules: Optional[List[str]] = None
+        self.buffer: List[BackfillResult] = []
+        self.flush_lock = asyncio.Lock()
+        self.output = open(args.output, "a") if args.output else None
+        self.started = time.monotonic()
+        self.processed = 0
+        self.failed = 0
+        self.resumed = 0
+        self.unnumbered = 0
+
+    async def _resolve_repo(self):
+        """Repository row to attach results to; created from GitHub metadata if it is not in the DB yet."""
+        from app.db.session import async_session
+        from app.models.repository import Repository
+
+        full_name = self.args.repo
+        async with async_session() as db:
+            result = await db.execute(select(Repository).where(
+                (Repository.full_name == full_name) | (Repository.html_url == f"https://github.com/{full_name}")
+            ))
+            repo = result.scalars().first()
+            if repo:
+                return repo
+
+            headers = {"Accept": "application/vnd.github.v3+json"}
+            if self.args.token:
+                headers["Authorization"] = f"Bearer {self.args.token}"
+            client = http_clients.github()
+            response = await client.get(f"https://api.github.com/repos/{full_name}", headers=headers, timeout=30)
+            if response.status_code != 200:
+                raise SystemExit(f"Repository {full_name} is not in the database and GitHub returned {response.status_code}")
+            data = response.json()
+            repo = Repository(
+                github_repo_id=data["id"],
+                name=data["name"],
+                full_name=data["full_name"],
+                owner_login=data["owner"]["login"],
+                html_url=data["html_url"],
+                is_active=False, # Backfill only; activating it is a separate decision
+            )
+            db.add(repo)
+            await db.commit()
+            await db.refresh(repo)
+            return repo
+
+    async def _review(self, item: BackfillItem, diff: str, fetched: bool, skipped: List[diff_filter.SkippedFile], truncated: bool) -> BackfillResult:
+        static_issues = []
+        if fetched:
+            try:
+                static_issues = await static_analysis.run_scan(diff, self.repo_rules)
+            except Exception as e:
+                print(f"BACKFILL: Static scan failed for {item.key}: {e!r}")
+
+        prepared = prepare_diff(diff, fetched, self.repo_rules, skipped)
+        flagged = any(issue.get("severity") == "high" for issue in static_issues)
+        route = model_router.route(prepared.files, flagged=flagged)
+
+        inference_ms = None
+        diff_lines = None
+        if prepared.minimized and not prepared.diff.strip():
+            result = diff_filter.nothing_to_review_result([entry.model_dump() for entry in prepared.skipped])
+        elif route.tier == model_router.TIER_NONE:
+            result = model_router.fast_path_result(route.reason)
+        else:
+            # Throughput over completeness: one call per PR with the riskiest hunks that fit
+            context = pr_context(item.title, item.body, prepared.notes)
+            diff_text = prepared.diff
+            omitted = []
+            if prepared.files:
+                packed = token_budget.pack(prepared.files, token_budget.chunk_budget(context))
+                diff_text = render_diff(packed.files)
+                omitted = [hunk.model_dump() for hunk in packed.omitted]
+            started = time.monotonic()
+            result = await self._call_llm(item, f"{context}\n\n{diff_text}", route.endpoint)
+            inference_ms = int((time.monotonic() - started) * 1000)
+            diff_lines = count_changed_lines(diff_text)
+            result = {**result, "tier": route.tier}
+            if omitted:
+                result["omitted_hunks"] = omitted
+
+        result = attach_findings(
+            result,
+            skipped=[entry.model_dump() for entry in prepared.skipped],
+            minimized=prepared.minimized,
+            diff_truncated=truncated,
+            static_issues=static_issues,
+        )
+        return BackfillResult(item=item, result=result, model_tier=route.tier, diff_lines=diff_lines, inference_ms=inference_ms)
+
+    async def _call_llm(self, item: BackfillItem, prompt: str, endpoint: Optional[str]) -> dict:
+        policy = RETRY_POLICIES["infer"]
+        for attempt in range(1, policy.max_attempts + 1):
+            try:
+                return await analyze_pr_content(item.number or 0, prompt, raise_errors=True, endpoint=endpoint)
+            except LLMServiceError as e:
+                if not e.retryable or attempt == policy.max_attempts:
+                    raise
+                await asyncio.sleep(policy.backoff(attempt))
+
+    async def _process(self, item: BackfillItem):
+        try:
+            if item.diff is not None:
+                diff, fetched, skipped, truncated = item.diff, True, [], False
+            else:
+                download = await stream_pr_diff(
+                    self.args.repo, item.number, self.args.token,
+                    repo_rules=self.repo_rules, apply_filters=True,
+                    head_sha=item.head_sha, base_ref=item.base_sha, # Exactly what was merged
+                )
+                if download.status_code != 200:
+                    raise RuntimeError(f"diff download returned {download.status_code}")
+                diff, fetched, skipped, truncated = download.text, True, download.skipped, download.truncated
+            outcome = await self._review(item, diff, fetched, skipped, truncated)
+        except Exception as e:
+            self.failed += 1
+            print(f"BACKFILL: {item.key} failed: {e}")
+            return
+
+        if is_fallback_result(outcome.result):
+            self.failed += 1 # Not checkpointed: the next run retries it
+            return
+        self.processed += 1
+        if self.output:
+            self.output.write(json.dumps({
+                "key": item.key,
+                "number": item.number,
+                "title": item.title,
+                "tier": outcome.model_tier,
+                "security_score": outcome.result.get("security_score"),
+                "merge_confidence": outcome.result.get("merge_confidence"),
+                "issues": len(outcome.result.get("issues") or []),
+                "inference_ms": outcome.inference_ms,
+            }) + "\n")
+        self.buffer.append(outcome)
+        if len(self.buffer) >= self.args.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        async with self.flush_lock:
+            batch, self.buffer = self.buffer, []
+            if not batch:
+                return
+            if not self.args.dry_run:
+                await self._write(batch)
+            self.checkpoint.save([outcome.item.key for outcome in batch])
+            if self.output:
+                self.output.flush()
+            self.report()
+
+    async def _write(self, batch: List[BackfillResult]):
+        """One INSERT for new PullRequest rows and one for the Analysis rows."""
+        from app.db.session import async_session
+        from app.models.analysis import Analysis
+        from app.models.pull_request import PullRequest
+
+        async with async_session() as db:
+            numbers = [outcome.item.number for outcome in batch]
+            result = await db.execute(
+                select(PullRequest.github_pr_number, PullRequest.id)
+                .where(PullRequest.repo_id == self.repo.id, PullRequest.github_pr_number.in_(numbers))
+            )
+            pr_ids: Dict[int, int] = dict(result.all())
+
+            new_prs = {}
+            for outcome in batch:
+                item = outcome.item
+                if item.number in pr_ids or item.number in new_prs:
+                    continue
+                new_prs[item.number] = {
+                    "repo_id": self.repo.id,
+                    "github_pr_number": item.number,
+                    "title": item.title,
+                    "state": "closed",
+                    "author_login": item.author_login,
+                    "html_url": item.html_url or f"{self.repo.html_url}/pull/{item.number}",
+                    "body": item.body,
+                    "head_sha": item.head_sha,
+                    "base_ref": item.base_ref,
+                    "base_sha": item.base_sha,
+                    "created_at": item.closed_at,
+                    "updated_at": item.closed_at,
+                }
+            if new_prs:
+                inserted = await db.execute(
+                    insert(PullRequest).values(list(new_prs.values()))
+                    .returning(PullRequest.github_pr_number, PullRequest.id)
+                )
+                pr_ids.update(dict(inserted.all()))
+
+            await db.execute(insert(Analysis).values([
+                {
+                    "pr_id": pr_ids[outcome.item.number],
+                    "head_sha": outcome.item.head_sha,
+                    "stage": "done",
+                    "model_tier": outcome.model_tier,
+                    "diff_lines": outcome.diff_lines,
+                    "inference_ms": outcome.inference_ms,
+                    "created_at": outcome.item.closed_at,
+                    **result_columns(outcome.result),
+                }
+                for outcome in batch
+            ]))
+            await db.commit()
+
+    def report(self, final: bool = False):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        rate = self.processed / elapsed * 60
+        print(
+            f"BACKFILL: {'Finished: ' if final else ''}{self.processed} diffs in {elapsed:.0f}s "
+            f"({rate:.1f} diffs/min), {self.failed} failed, {self.resumed} already done"
+            + (f", {self.unnumbered} files without a PR number skipped" if self.unnumbered else "")
+        )
+
+    async def _items(self) -> AsyncIterator[BackfillItem]:
+        if self.args.diff_dir:
+            source = _diff_files(self.args.diff_dir, self.args.limit)
+        else:
+            source = _closed_prs(self.args.repo, self.args.token, self.args.limit, self.args.merged_only, _parse_time(self.args.since))
+        async for item in source:
+            if item.key in self.checkpoint.done:
+                self.resumed += 1
+                continue
+            if item.number is None and not self.args.dry_run:
+                self.unnumbered += 1 # Rows need a PR number
+                continue
+            yield item
+
+    async def run(self):
+        github_scheduler.current_priority.set(scheduler.PRIORITY_BULK) # Leave the token's budget to the app
+        if not self.args.dry_run:
+            self.repo = await self._resolve_repo()
+            self.repo_rules = self.repo.review_ignore
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.args.concurrency * 2)
+
+        async def produce():
+            async for item in self._items():
+                await queue.put(item)
+            for _ in range(self.args.concurrency):
+                await queue.put(None)
+
+        async def consume():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                await self._process(item)
+
+        try:
+            await asyncio.gather(produce(), *(consume() for _ in range(self.args.concurrency)))
+        finally:
+            await self.flush()
+            static_analysis.shutdown()
+            await http_clients.shutdown()
+            if self.output:
+                self.output.close()
+        self.report(final=True)
+
+def _stub_review(diff: str) -> dict:
+    """Deterministic review: flags eval/exec and hard-coded passwords on added lines, scores by size."""
+    added = [line[1:] for line in diff.splitlines() if line.startswith("+") and not line.startswith("+++")]
+    issues = []
+    for line in added:
+        if re.search(r"\b(eval|exec)\s*\(", line):
+            issues.append({"type": "security", "severity": "high", "description": "Dynamic code execution.", "suggestion": "Avoid eval/exec."})
+        elif re.search(r"(?i)password\s*=\s*[\"']", line):
+            issues.append({"type": "security", "severity": "medium", "description": "Hard-coded password.", "suggestion": "Load it from the environment."})
+    size_penalty = min(len(added) // 20, 30)
+    return {
+        "summary": f"Stub review of {len(added)} added lines.",
+        "security_score": max(40, 95 - 15 * len(issues)),
+        "performance_score": 90 - size_penalty // 2,
+        "reliability_score": 90 - size_penalty,
+        "maintainability_score": 88 - size_penalty,
+        "merge_confidence": max(30, 90 - size_penalty - 10 * len(issues)),
+        "issues": issues,
+    }
+
+def stub_llm_app(latency_ms: int):
+    from fastapi import FastAPI
+
+    app = FastAPI(title="PRISM stub LLM")
+
+    @app.post("/review")
+    async def review(body: dict):
+        await asyncio.sleep(latency_ms / 1000)
+        return _stub_review(body.get("diff", ""))
+
+    @app.post("/review/batch")
+    async def review_batch(body: dict):
+        await asyncio.sleep(latency_ms / 1000) # One generation for the whole batch
+        return {"results": [_stub_review(item.get("diff", "")) for item in body.get("items", [])]}
+
+    @app.get("/")
+    def home():
+        return {"status": "Model active", "model": "stub"}
+
+    return app
+
+def stub_github_app(prs_per_repo: int, rate_limit: int = 5000):
+    """
+    GitHub GraphQL stand-in for github_graphql: answers its aliased open-PR
+    queries (variables $o<i>/$n<i>/$a<i>) with prs_per_repo deterministic PRs
+    per repository, paged like GitHub. Repositories named "missing" resolve to
+    null with a NOT_FOUND error, as on GitHub. rate_limit is the point budget
+    reported back in rateLimit.remaining.
+    """
+    import hashlib
+    from fastapi import FastAPI
+
+    app = FastAPI(title="PRISM stub GitHub GraphQL")
+    budget = {"remaining": rate_limit}
+
+    @app.post("/graphql")
+    async def graphql(body: dict):
+        variables = body.get("variables") or {}
+        first = int((re.search(r"first: (\d+)", body.get("query", "")) or [0, 100])[1])
+        data, errors = {}, []
+        i = 0
+        while f"o{i}" in variables:
+            owner, name = variables[f"o{i}"], variables[f"n{i}"]
+            if name == "missing":
+                data[f"r{i}"] = None
+                errors.append({"type": "NOT_FOUND", "path": [f"r{i}"], "message": f"Could not resolve to a Repository with the name '{owner}/{name}'."})
+                i += 1
+                continue
+            start = int(variables.get(f"a{i}") or 0)
+            numbers = list(range(prs_per_repo, 0, -1))[start:start + first] # Most recently updated first
+            nodes = []
+            for number in numbers:
+                sha = hashlib.sha1(f"{owner}/{name}#{number}".encode()).hexdigest()
+                nodes.append({
+                    "number": number,
+                    "title": f"Stub PR {number}",
+                    "body": None,
+                    "url": f"https://github.com/{owner}/{name}/pull/{number}",
+                    "updatedAt": f"2024-01-01T00:{number % 60:02d}:00Z",
+                    "headRefOid": sha,
+                    "baseRefOid": hashlib.sha1(f"{owner}/{name}".encode()).hexdigest(),
+                    "baseRefName": "main",
+                    "author": {"login": "stub-user", "avatarUrl": None},
+                })
+            end = start + len(numbers)
+            data[f"r{i}"] = {"pullRequests": {
+                "totalCount": prs_per_repo,
+                "pageInfo": {"hasNextPage": end < prs_per_repo, "endCursor": str(end)},
+                "nodes": nodes,
+            }}
+            i += 1
+        cost = max(1, -(-i // 100))
+        budget["remaining"] -= cost
+        data["rateLimit"] = {"cost": cost, "remaining": budget["remaining"], "resetAt": "2099-01-01T00:00:00Z"}
+        return {"data": data, **({"errors": errors} if errors else {})}
+
+    return app
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="PRISM command-line tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backfill = commands.add_parser("backfill", help="Review historical PRs in bulk")
+    backfill.add_argument("--repo", help="owner/name; results are stored on this repository")
+    backfill.add_argument("--diff-dir", help="Review the .diff/.patch files in this directory instead of closed PRs")
+    backfill.add_argument("--token", default=os.environ.get("GITHUB_TOKEN"), help="GitHub token (default: $GITHUB_TOKEN)")
+    backfill.add_argument("--limit", type=int, default=1000, help="Maximum number of PRs/files")
+    backfill.add_argument("--since", help="Only PRs updated after this ISO date")
+    backfill.add_argument("--merged-only", action="store_true", help="Skip PRs closed without merging")
+    backfill.add_argument("--concurrency", type=int, default=4, help="PRs in flight at once")
+    backfill.add_argument("--batch-size", type=int, default=50, help="Rows per bulk insert / checkpoint")
+    backfill.add_argument("--checkpoint", help="Checkpoint file (default: .backfill-<source>.json)")
+    backfill.add_argument("--llm-url", help="LLM service to use instead of HF_LLM_URL (e.g. a stub-llm)")
+    backfill.add_argument("--output", help="Also append one JSON line per reviewed PR to this file")
+    backfill.add_argument("--dry-run", action="store_true", help="Do not write to the database")
+
+    stub = commands.add_parser("stub-llm", help="Serve canned reviews on the LLM service API")
+    stub.add_argument("--host", default="127.0.0.1")
+    stub.add_argument("--port", type=int, default=7861)
+    stub.add_argument("--latency-ms", type=int, default=0, help="Simulated inference time per request")
+
+    stub_github = commands.add_parser("stub-github", help="Serve the GitHub GraphQL API for open-PR syncs")
+    stub_github.add_argument("--host", default="127.0.0.1")
+    stub_github.add_argument("--port", type=int, default=7862)
+    stub_github.add_argument("--prs-per-repo", type=int, default=3)
+    stub_github.add_argument("--rate-limit", type=int, default=5000, help="GraphQL points before syncs are deferred")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "stub-llm":
+        import uvicorn
+        uvicorn.run(stub_llm_app(args.latency_ms), host=args.host, port=args.port, log_level="warning")
+        return
+    if args.command == "stub-github":
+        import uvicorn
+        uvicorn.run(stub_github_app(args.prs_per_repo, args.rate_limit), host=args.host, port=args.port, log_level="warning")
+        return
+
+    if not args.diff_dir and not args.repo:
+        parser.error("backfill needs --repo (closed PRs) or --diff-dir")
+    if not args.dry_run and not args.repo:
+        parser.error("--repo is required to store results (or use --dry-run)")
+    if args.llm_url:
+        settings.HF_LLM_URL = args.llm_url.rstrip("/")
+        settings.HF_LLM_FAST_URL = None # One service for every tier
+    if not args.checkpoint:
+        source = args.diff_dir or args.repo
+        args.checkpoint = f".backfill-{re.sub(r'[^A-Za-z0-9]+', '-', source).strip('-')}.json"
+    args.concurrency = max(1, args.concurrency)
+    args.batch_size = max(1, args.batch_size)
+    asyncio.run(Backfill(args).run())
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
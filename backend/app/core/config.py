@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import List, Optional, Dict
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "PRISM API"
@@ -25,6 +25,117 @@ class Settings(BaseSettings):
     # AI
     # GEMINI_API_KEY removed
     HF_LLM_URL: str = "https://rockstar00-prism-llm-service.hf.space" # Updated with user's space
+    # Smaller, faster model behind the same /review API; unset sends medium diffs to HF_LLM_URL
+    HF_LLM_FAST_URL: Optional[str] = None
+    HF_LLM_FAST_MODEL_ID: str = "Qwen/Qwen2.5-0.5B-Instruct" # Keeps its results apart in the caches
+
+    # Outbound HTTP Pools (app.services.http_clients; shared, keep-alive, HTTP/2 if h2 is installed)
+    HTTP2_ENABLED: bool = True
+    HTTP_KEEPALIVE_SECONDS: float = 60.0 # Idle pooled connections are closed after this
+    GITHUB_HTTP_MAX_CONNECTIONS: int = 20
+    GITHUB_HTTP_MAX_KEEPALIVE: int = 10
+    GITHUB_HTTP_TIMEOUT_SECONDS: float = 15.0 # Read/write/pool; connect is 5s
+    LLM_HTTP_MAX_CONNECTIONS: int = 8
+    LLM_HTTP_TIMEOUT_SECONDS: float = 300.0 # CPU inference is slow
+
+    # GitHub Conditional Requests (ETag / Last-Modified per token + URL; 304s don't count against the rate limit)
+    GITHUB_CACHE_ENABLED: bool = True
+    GITHUB_CACHE_MAX_BYTES: int = 32 * 1024 * 1024 # In-memory LRU per process
+    GITHUB_CACHE_PERSIST: bool = True # Database tier, so restarts keep their validators
+    GITHUB_CACHE_PERSIST_MAX_BYTES: int = 256 * 1024 * 1024 # LRU eviction above this total
+    GITHUB_CACHE_TOUCH_FLUSH_SECONDS: float = 60.0 # last_used_at updates are written in batches this often
+
+    # GitHub Rate Limits (github_scheduler; budgets per token from X-RateLimit-* headers)
+    GITHUB_RATE_LIMIT_RESERVE: int = 250 # Per priority class below interactive: webhook stops at 250 left, bulk at 500
+    GITHUB_MAX_CONCURRENT_PER_TOKEN: int = 8 # Bursts trip GitHub's secondary (abuse) limits
+    GITHUB_INTERACTIVE_MAX_WAIT_SECONDS: float = 10.0 # Longer waits get a 429 with Retry-After
+    GITHUB_BACKGROUND_MAX_WAIT_SECONDS: float = 900.0
+
+    # REST Pagination (pages after the first are fetched concurrently, from the Link header's last page)
+    GITHUB_PAGINATION_CONCURRENCY: int = 4
+    GITHUB_PAGINATION_MAX_PAGES: int = 50 # 5000 repos at per_page=100
+
+    # GraphQL PR Sync (github_graphql; many repos per aliased query)
+    GITHUB_GRAPHQL_URL: str = "https://api.github.com/graphql" # A local stub works too (python -m app.cli stub-github)
+    GITHUB_GRAPHQL_REPOS_PER_QUERY: int = 25
+    GITHUB_GRAPHQL_PRS_PER_REPO: int = 50 # Page size; busier repos are paged in follow-up queries (max 100)
+
+    # Diff Download (streamed; stops at the budget, cut at a file boundary)
+    DIFF_MAX_BYTES: int = 2_000_000
+    DIFF_MAX_TOKENS: Optional[int] = None # Optional tighter budget, estimated from bytes while streaming
+
+    # Shared PR Diff Cache (keyed by repo + head SHA; viewer and pipeline read through it)
+    DIFF_CACHE_ENABLED: bool = True
+    DIFF_CACHE_MAX_BYTES: int = 512 * 1024 * 1024 # LRU eviction above this total
+
+    # Local Git Mirrors (bare clones of active repos; diffs computed with `git diff`)
+    GIT_MIRROR_DIR: Optional[str] = None # Unset: diffs always come from the GitHub API
+    GIT_MIRROR_REMOTE_TEMPLATE: str = "https://github.com/{full_name}.git" # A local path works too (tests)
+    GIT_MIRROR_REFRESH_SECONDS: int = 300 # Worker fetches every active mirror this often
+    GIT_MIRROR_TIMEOUT_SECONDS: int = 600 # Per git command (a first clone can be slow)
+
+    # Static Pre-analysis (deterministic checks before the LLM, in a process pool)
+    STATIC_ANALYSIS_WORKERS: int = 2
+    STATIC_ANALYSIS_TIMEOUT_SECONDS: int = 30
+    STATIC_ANALYSIS_MAX_ISSUES: int = 100
+
+    # Model Routing (tier: none = no LLM, fast = HF_LLM_FAST_URL, full = HF_LLM_URL)
+    ROUTING_ENABLED: bool = True
+    ROUTING_TINY_MAX_LINES: int = 6 # Up to this many changed lines, no risky code: no LLM
+    ROUTING_FULL_MIN_LINES: int = 300 # From this many changed lines: full model
+    ROUTING_DOCS_GLOBS: List[str] = [
+        "*.md", "*.mdx", "*.rst", "*.adoc", "**/docs/*", "README*", "LICENSE*", "CHANGELOG*", "AUTHORS*", "NOTICE*",
+    ]
+    # Dependency and build files: always sent to an LLM, however small the change
+    ROUTING_BUILD_GLOBS: List[str] = [
+        "requirements*.txt", "constraints*.txt", "CMakeLists.txt", "*.cmake", "package.json", "pyproject.toml",
+        "setup.py", "setup.cfg", "Pipfile", "go.mod", "Cargo.toml", "Gemfile", "pom.xml", "build.gradle*",
+        "Dockerfile*", "Makefile",
+    ]
+    ROUTING_CONFIG_GLOBS: List[str] = [
+        "*.json", "*.yaml", "*.yml", "*.toml", "*.ini", "*.cfg", "*.conf", ".editorconfig",
+        ".prettierrc*", ".eslintrc*", ".gitignore", ".gitattributes", ".dockerignore",
+    ]
+
+    # Bulk Analysis (analyze all open PRs of a repo)
+    ANALYZE_ON_ACTIVATE: bool = False # Default for /repos/toggle's analyze_open_prs
+    BULK_ANALYZE_MAX_PRS: int = 200 # Per request; the rest are reported as deferred
+
+    # Analysis Worker (python -m app.worker)
+    ANALYSIS_WORKER_CONCURRENCY: int = 2
+    ANALYSIS_WORKER_POLL_SECONDS: float = 2.0
+    ANALYSIS_JOB_LEASE_SECONDS: int = 120 # Renewed by heartbeats while the job runs
+    ANALYSIS_JOB_HEARTBEAT_SECONDS: int = 30
+    ANALYSIS_JOB_CANCEL_POLL_SECONDS: int = 5 # How fast a running job notices it was superseded
+    ANALYSIS_JOB_MAX_ATTEMPTS: int = 3
+    # Relative share of LLM time per user, by User.plan_tier
+    PLAN_TIER_WEIGHTS: Dict[str, float] = {"free": 1.0, "pro": 4.0, "team": 8.0}
+
+    # Admission Control (/analysis/trigger*)
+    LLM_PARALLELISM: int = 1 # Concurrent generations the LLM service can actually serve
+    ADMISSION_DEFER_WAIT_SECONDS: int = 120 # Above this predicted wait: 202 + ETA
+    ADMISSION_MAX_WAIT_SECONDS: int = 900 # Above this predicted wait: 429
+    ANALYSIS_RATE_LIMIT_BURST: int = 10 # Per-user token bucket size
+    ANALYSIS_RATE_LIMIT_PER_MINUTE: float = 4.0 # Per-user refill rate
+
+    # Analysis Result Cache
+    ANALYSIS_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    ANALYSIS_CACHE_MAX_ENTRIES: int = 5000
+
+    # Near-duplicate Diff Reuse (MinHash/LSH over Analysis.diff_snapshot)
+    SIMILARITY_REUSE_THRESHOLD: float = 0.9 # Reuse the prior result instead of calling the LLM
+    SIMILARITY_PROVISIONAL_THRESHOLD: float = 0.7 # Show the prior result while the LLM runs
+
+    # Large-diff Map-Reduce (chunks are reviewed in parallel, results merged)
+    # Phi-3-mini has a 4096-token context: minus 1024 generated tokens and the system prompt
+    LLM_CHUNK_MAX_TOKENS: int = 2700 # PR context + diff tokens per LLM call
+    LLM_CHUNK_CONCURRENCY: int = 2 # LLM calls in flight per analysis
+    LLM_MAX_CHUNKS: int = 40 # Token budget per analysis = LLM_MAX_CHUNKS full chunks; lowest-risk hunks are left out
+    LLM_CONTEXT_MAX_CHARS: int = 1000 # PR title + description sent with every chunk
+    # Bulk analyses (analyze-all) of small diffs share /review/batch requests
+    LLM_BATCH_MAX_SIZE: int = 4 # 1 disables batching
+    LLM_BATCH_WINDOW_MS: int = 250
+    LLM_BATCH_MAX_TOKENS: int = 1500 # Larger calls are sent on their own
 
 
     def model_post_init(self, __context):
@@ -13,10 +13,12 @@ engine = create_async_engine(
     pool_recycle=300     # Recycle connections every 5 minutes
 )
 
+# Shared session factory for code running outside a request (worker, webhooks)
+async_session = sessionmaker(
+    engine, class_=AsyncSession, expire_on_commit=False
+)
+
 async def get_session() -> AsyncSession:
-    async_session = sessionmaker(
-        engine, class_=AsyncSession, expire_on_commit=False
-    )
     async with async_session() as session:
         yield session
 
@@ -37,6 +39,19 @@ async def init_db():
                 await conn.execute(text("ALTER TABLE analysis ADD COLUMN IF NOT EXISTS reliability_score INTEGER DEFAULT 0"))
                 await conn.execute(text("ALTER TABLE analysis ADD COLUMN IF NOT EXISTS maintainability_score INTEGER DEFAULT 0"))
                 await conn.execute(text("ALTER TABLE analysis ADD COLUMN IF NOT EXISTS merge_confidence_score INTEGER DEFAULT 0"))
+                await conn.execute(text("ALTER TABLE analysis ADD COLUMN IF NOT EXISTS cache_status VARCHAR"))
+                await conn.execute(text("ALTER TABLE analysis ADD COLUMN IF NOT EXISTS head_sha VARCHAR"))
+                await conn.execute(text("ALTER TABLE analysis ADD COLUMN IF NOT EXISTS superseded_by INTEGER"))
+                await conn.execute(text("ALTER TABLE analysis ADD COLUMN IF NOT EXISTS diff_lines INTEGER"))
+                await conn.execute(text("ALTER TABLE analysis ADD COLUMN IF NOT EXISTS inference_ms INTEGER"))
+                await conn.execute(text("ALTER TABLE analysis ADD COLUMN IF NOT EXISTS stage VARCHAR"))
+                await conn.execute(text("ALTER TABLE analysis ADD COLUMN IF NOT EXISTS checkpoint JSON"))
+                await conn.execute(text("ALTER TABLE analysis ADD COLUMN IF NOT EXISTS model_tier VARCHAR"))
+                await conn.execute(text("ALTER TABLE analysis ADD COLUMN IF NOT EXISTS vulnerability_count INTEGER DEFAULT 0"))
+                await conn.execute(text("ALTER TABLE analysisjob ADD COLUMN IF NOT EXISTS bypass_cache BOOLEAN DEFAULT FALSE"))
+                await conn.execute(text("ALTER TABLE analysisjob ADD COLUMN IF NOT EXISTS priority INTEGER DEFAULT 0"))
+                await conn.execute(text("ALTER TABLE analysisjob ADD COLUMN IF NOT EXISTS virtual_finish DOUBLE PRECISION DEFAULT 0"))
+                await conn.execute(text("ALTER TABLE analysisjob ADD COLUMN IF NOT EXISTS started_at TIMESTAMP"))
                 
                 # CRITICAL FIX: Drop the old column that enforces NOT NULL
                 # This fixes the "NotNullViolationError: null value in column 'readability_score'"
@@ -46,8 +61,14 @@ async def init_db():
                     # Ignore if it fails (e.g., dependency issues), but print it
                     print(f"Migration Warning: Could not drop readability_score: {e}")
                 
+                await conn.execute(text("ALTER TABLE repository ADD COLUMN IF NOT EXISTS review_ignore JSON"))
+                await conn.execute(text("ALTER TABLE diffsignature ADD COLUMN IF NOT EXISTS model_id VARCHAR"))
+
                 # Update PullRequest table
                 await conn.execute(text("ALTER TABLE pullrequest ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT now()"))
+                await conn.execute(text("ALTER TABLE pullrequest ADD COLUMN IF NOT EXISTS base_ref VARCHAR"))
+                await conn.execute(text("ALTER TABLE pullrequest ADD COLUMN IF NOT EXISTS head_sha VARCHAR"))
+                await conn.execute(text("ALTER TABLE pullrequest ADD COLUMN IF NOT EXISTS base_sha VARCHAR"))
                     
             print("Database initialized successfully.")
             return
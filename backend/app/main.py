@@ -4,13 +4,16 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
 from contextlib import asynccontextmanager
 from app.db.session import init_db
+from app.services import http_clients
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup: Create tables
     await init_db()
+    await http_clients.startup()
     yield
-    # Shutdown: Clean resources if needed
+    # Shutdown: Close pooled connections
+    await http_clients.shutdown()
 
 app = FastAPI(
     title="PRISM API",
@@ -40,3 +43,8 @@ def read_root():
 @app.get("/health")
 def health_check():
     return {"status": "healthy"}
+
+@app.get("/health/pools")
+def pool_metrics():
+    """Outbound HTTP pool usage (in use, idle, wait time) for sizing the limits."""
+    return http_clients.metrics()
@@ -2,3 +2,11 @@ from .user import User, UserCreate, UserRead
 from .repository import Repository
 from .pull_request import PullRequest
 from .analysis import Analysis
+from .analysis_job import AnalysisJob
+from .analysis_cache import AnalysisCacheEntry
+from .scheduler import SchedulerAccount
+from .rate_limit import RateLimitBucket
+from .similarity import DiffSignature, DiffSignatureBand
+from .file_review import FileReview
+from .diff_cache import DiffCacheEntry
+from .github_cache import GitHubResponseCacheEntry
@@ -5,16 +5,25 @@ from datetime import datetime
 class Analysis(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     pr_id: int = Field(foreign_key="pullrequest.id")
-    status: str = Field(default="pending") # pending, processing, completed, failed
+    status: str = Field(default="pending") # pending, processing, completed, failed, superseded
+    head_sha: Optional[str] = Field(default=None, index=True) # PR head commit this analysis reviews
+    superseded_by: Optional[int] = Field(default=None) # Analysis of the newer head that replaced this one
     
     security_score: int = Field(default=0)
     performance_score: int = Field(default=0)
     reliability_score: int = Field(default=0)
     maintainability_score: int = Field(default=0)
     merge_confidence_score: int = Field(default=0)
+    vulnerability_count: int = Field(default=0) # Security issues (static + LLM); feeds the dashboard
     
     raw_llm_output: Optional[Dict] = Field(default=None, sa_type=JSON)
     diff_snapshot: Optional[str] = Field(default=None) # removed deferred to fix crash
+    stage: Optional[str] = Field(default=None) # Next pipeline stage to run (see analysis_service.STAGES)
+    checkpoint: Optional[Dict] = Field(default=None, sa_type=JSON) # Persisted stage outputs
+    cache_status: Optional[str] = Field(default=None) # hit, miss, bypass, similar
+    model_tier: Optional[str] = Field(default=None) # none, fast, full (see model_router)
+    diff_lines: Optional[int] = Field(default=None) # Changed (+/-) lines sent to the LLM
+    inference_ms: Optional[int] = Field(default=None) # LLM latency, feeds the admission ETA model
     created_at: datetime = Field(default_factory=datetime.utcnow)
     
     pull_request: "PullRequest" = Relationship(back_populates="analyses")
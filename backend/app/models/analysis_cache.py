@@ -0,0 +1,17 @@
+from typing import Optional, Dict
+from sqlmodel import Field, SQLModel, JSON
+from datetime import datetime
+
+class AnalysisCacheEntry(SQLModel, table=True):
+    """
+    LLM result keyed by sha256(prompt version + model + normalized diff).
+    Shared by all API nodes and workers.
+    """
+    key: str = Field(primary_key=True)
+    result: Dict = Field(sa_type=JSON)
+    prompt_version: str
+    model_id: str
+    hit_count: int = Field(default=0)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    last_hit_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    expires_at: datetime = Field(index=True)
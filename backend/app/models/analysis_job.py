@@ -0,0 +1,31 @@
+from typing import Optional
+from sqlmodel import Field, SQLModel
+from datetime import datetime
+
+class AnalysisJob(SQLModel, table=True):
+    """
+    Durable queue entry for an Analysis run.
+    Workers claim rows with SELECT ... FOR UPDATE SKIP LOCKED and hold a lease
+    that is renewed by heartbeats. An expired lease makes the job claimable again.
+    """
+    id: Optional[int] = Field(default=None, primary_key=True)
+    analysis_id: int = Field(foreign_key="analysis.id", index=True)
+    pr_id: int = Field(foreign_key="pullrequest.id")
+    user_id: Optional[int] = Field(default=None, foreign_key="user.id") # Whose GitHub token to use
+    status: str = Field(default="queued", index=True) # queued, running, completed, failed, cancelled
+    bypass_cache: bool = Field(default=False) # Forced re-run: skip the analysis cache
+
+    # Scheduling (see app.services.scheduler)
+    priority: int = Field(default=0, index=True) # 0 interactive, 1 webhook, 2 bulk
+    virtual_finish: float = Field(default=0.0) # Weighted-fair-queuing finish tag
+
+    attempts: int = Field(default=0)
+    max_attempts: int = Field(default=3)
+    locked_by: Optional[str] = None
+    started_at: Optional[datetime] = None # Start of the current attempt
+    lease_expires_at: Optional[datetime] = None
+    heartbeat_at: Optional[datetime] = None
+    last_error: Optional[str] = None
+
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,20 @@
+from typing import Optional
+from sqlmodel import Field, SQLModel
+from datetime import datetime
+
+class DiffCacheEntry(SQLModel, table=True):
+    """
+    Unfiltered PR diff keyed by "<repo id>:<head SHA>". A commit never changes,
+    so entries never go stale; the least recently used ones are evicted
+    above DIFF_CACHE_MAX_BYTES in total.
+    """
+    key: str = Field(primary_key=True)
+    repo_id: int = Field(foreign_key="repository.id", index=True)
+    head_sha: str
+    base_ref: Optional[str] = None # A retargeted PR diffs against another branch: a miss
+    diff: str
+    size_bytes: int = Field(default=0)
+    truncated: bool = Field(default=False) # Cut at DIFF_MAX_BYTES when it was downloaded
+    hit_count: int = Field(default=0)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    last_used_at: datetime = Field(default_factory=datetime.utcnow, index=True)
@@ -0,0 +1,18 @@
+from typing import Dict
+from sqlmodel import Field, SQLModel, JSON
+from datetime import datetime
+
+class FileReview(SQLModel, table=True):
+    """
+    LLM review of a single file's change, keyed by sha256(repository, path,
+    base blob SHA, head blob SHA, prompt version, model).
+    The same blob pair always yields the same diff, so entries never go stale.
+    """
+    key: str = Field(primary_key=True)
+    path: str
+    base_blob: str
+    head_blob: str
+    prompt_version: str
+    changed_lines: int = Field(default=0)
+    result: Dict = Field(sa_type=JSON)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,20 @@
+from typing import Optional, Dict
+from sqlmodel import Field, SQLModel, JSON
+from datetime import datetime
+
+class GitHubResponseCacheEntry(SQLModel, table=True):
+    """
+    Persistent tier of the GitHub conditional-request cache (github_cache).
+    Keyed by sha256(token + Accept + URL); the token itself is never stored.
+    Revalidated with If-None-Match / If-Modified-Since on every use.
+    """
+    key: str = Field(primary_key=True)
+    url: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    headers: Dict = Field(default_factory=dict, sa_type=JSON) # Content-Type, Link, ...
+    body: bytes # As received (possibly gzip), decoded by the client like a fresh response
+    size_bytes: int = Field(default=0)
+    hit_count: int = Field(default=0) # 304s served from this entry
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    last_used_at: datetime = Field(default_factory=datetime.utcnow, index=True)
@@ -12,6 +12,9 @@ class PullRequest(SQLModel, table=True):
     author_avatar_url: Optional[str] = None
     html_url: str
     body: Optional[str] = None
+    base_ref: Optional[str] = None # Target branch; the base of locally computed diffs (git_mirror)
+    head_sha: Optional[str] = None # Latest known head commit; keys the shared diff cache
+    base_sha: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     
@@ -0,0 +1,8 @@
+from sqlmodel import Field, SQLModel
+from datetime import datetime
+
+class RateLimitBucket(SQLModel, table=True):
+    """Token bucket state, shared by all API workers through the database."""
+    key: str = Field(primary_key=True) # e.g. "analysis:user:42"
+    tokens: float
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
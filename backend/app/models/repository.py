@@ -1,5 +1,5 @@
 from typing import Optional, List
-from sqlmodel import Field, SQLModel, Relationship
+from sqlmodel import Field, SQLModel, Relationship, JSON
 from datetime import datetime
 
 class Repository(SQLModel, table=True):
@@ -10,6 +10,7 @@ class Repository(SQLModel, table=True):
     owner_login: str
     html_url: str
     is_active: bool = Field(default=True)
+    review_ignore: Optional[List[str]] = Field(default=None, sa_type=JSON) # Extra globs to skip in reviews; "!glob" re-includes
     created_at: datetime = Field(default_factory=datetime.utcnow)
     
     pull_requests: List["PullRequest"] = Relationship(back_populates="repository")
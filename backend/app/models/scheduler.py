@@ -0,0 +1,11 @@
+from sqlmodel import Field, SQLModel
+from datetime import datetime
+
+class SchedulerAccount(SQLModel, table=True):
+    """
+    Weighted-fair-queuing clock for one user within one priority class.
+    The row with user_key "__global__" holds the class's system virtual time.
+    """
+    key: str = Field(primary_key=True) # "<priority>:<user_id|anon|__global__>"
+    virtual_time: float = Field(default=0.0)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
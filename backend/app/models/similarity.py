@@ -0,0 +1,17 @@
+from typing import List, Optional
+from sqlmodel import Field, SQLModel, JSON
+from datetime import datetime
+
+class DiffSignature(SQLModel, table=True):
+    """MinHash signature of an analyzed diff (see app.services.similarity_index)."""
+    analysis_id: int = Field(foreign_key="analysis.id", primary_key=True)
+    prompt_version: str # Of the indexed result, not of the code that indexed it
+    model_id: Optional[str] = Field(default=None) # Model that produced the result; matches only reuse the same model
+    signature: List[int] = Field(sa_type=JSON)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class DiffSignatureBand(SQLModel, table=True):
+    """LSH bucket membership: analyses sharing a band key are similarity candidates."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    band_key: str = Field(index=True)
+    analysis_id: int = Field(foreign_key="analysis.id", index=True)
@@ -0,0 +1,173 @@
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Optional, List, Tuple
+from pydantic import BaseModel
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select, func, or_
+
+from app.core.config import settings
+from app.models.analysis import Analysis
+from app.models.analysis_job import AnalysisJob
+from app.models.rate_limit import RateLimitBucket
+from app.services.ai_service import TIMEOUT_SECONDS
+
+DEFAULT_LATENCY_SECONDS = 90.0 # Used until enough analyses have been timed
+MIN_SAMPLES = 5
+MAX_SAMPLES = 500
+MODEL_REFRESH_SECONDS = 60
+
+class LatencyModel(BaseModel):
+    """LLM latency ~ intercept + slope * changed lines, fitted by least squares."""
+    intercept_s: float = DEFAULT_LATENCY_SECONDS
+    per_line_s: float = 0.0
+    max_s: float = float(TIMEOUT_SECONDS) # Never predict beyond the slowest observed run
+    samples: int = 0
+
+    def predict(self, diff_lines: Optional[float]) -> float:
+        if diff_lines is None:
+            diff_lines = 0
+        return min(max(self.intercept_s + self.per_line_s * diff_lines, 1.0), self.max_s)
+
+class AdmissionDecision(BaseModel):
+    status_code: int # 200 run soon, 202 accepted but slow, 429 rejected
+    predicted_wait_seconds: float
+    predicted_completion: datetime
+    retry_after_seconds: Optional[int] = None
+    reason: Optional[str] = None
+
+_cached_model: Tuple[float, Optional[LatencyModel]] = (0.0, None)
+
+def fit_latency_model(points: List[Tuple[int, int]]) -> LatencyModel:
+    """Ordinary least squares over (diff_lines, inference_ms) samples."""
+    if len(points) < MIN_SAMPLES:
+        return LatencyModel(samples=len(points))
+
+    xs = [float(x) for x, _ in points]
+    ys = [y / 1000.0 for _, y in points]
+    n = len(points)
+    mean_x = sum(xs) / n
+    mean_y = sum(ys) / n
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    if var_x == 0:
+        slope = 0.0
+    else:
+        slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+    slope = max(slope, 0.0) # Bigger diffs are never faster; guards against noisy fits
+    intercept = mean_y - slope * mean_x
+    return LatencyModel(intercept_s=max(intercept, 1.0), per_line_s=slope, max_s=max(ys), samples=n)
+
+async def latency_model(db: AsyncSession) -> LatencyModel:
+    """Fitted on recent timed analyses; refit at most every MODEL_REFRESH_SECONDS per process."""
+    global _cached_model
+    fitted_at, model = _cached_model
+    if model and time.monotonic() - fitted_at < MODEL_REFRESH_SECONDS:
+        return model
+
+    result = await db.execute(
+        select(Analysis.diff_lines, Analysis.inference_ms)
+        # Fast-tier samples would make the full model look quicker than it is
+        .where(Analysis.inference_ms != None, Analysis.diff_lines != None,
+               or_(Analysis.model_tier == None, Analysis.model_tier != "fast"))
+        .order_by(Analysis.id.desc())
+        .limit(MAX_SAMPLES)
+    )
+    model = fit_latency_model([(x, y) for x, y in result.all()])
+    _cached_model = (time.monotonic(), model)
+    return model
+
+async def predicted_wait_seconds(db: AsyncSession, priority: int) -> float:
+    """
+    Time until a new job of this priority would start: queued jobs of the same or
+    higher priority plus the remainder of running jobs, spread over LLM_PARALLELISM.
+    Queued diffs are not fetched yet, so each is costed at the average timed diff.
+    """
+    model = await latency_model(db)
+    avg_lines = (await db.execute(
+        select(func.avg(Analysis.diff_lines)).where(Analysis.inference_ms != None)
+    )).scalar_one()
+    per_job = model.predict(avg_lines)
+
+    queued = (await db.execute(
+        select(func.count(AnalysisJob.id))
+        .where(AnalysisJob.status == "queued", AnalysisJob.priority <= priority)
+    )).scalar_one()
+
+    now = datetime.utcnow()
+    running = await db.execute(
+        select(AnalysisJob.started_at).where(
+            AnalysisJob.status == "running", AnalysisJob.lease_expires_at > now
+        )
+    )
+    remaining = sum(
+        max(per_job - (now - started).total_seconds(), 0.0) if started else per_job
+        for started in running.scalars().all()
+    )
+    return (queued * per_job + remaining) / max(settings.LLM_PARALLELISM, 1)
+
+async def consume_token(db: AsyncSession, key: str, burst: int, per_minute: float) -> float:
+    """
+    Take one token from a DB-backed token bucket. Returns 0 if allowed, otherwise
+    the seconds until a token is available. The row lock makes it exact across workers.
+    """
+    now = datetime.utcnow()
+    await db.execute(
+        insert(RateLimitBucket)
+        .values(key=key, tokens=float(burst), updated_at=now)
+        .on_conflict_do_nothing(index_elements=["key"])
+    )
+    bucket = await db.get(RateLimitBucket, key, with_for_update=True, populate_existing=True)
+
+    rate = per_minute / 60.0
+    elapsed = max((now - bucket.updated_at).total_seconds(), 0.0)
+    bucket.tokens = min(float(burst), bucket.tokens + elapsed * rate)
+    bucket.updated_at = now
+
+    retry_after = 0.0
+    if bucket.tokens >= 1.0:
+        bucket.tokens -= 1.0
+    else:
+        retry_after = (1.0 - bucket.tokens) / rate if rate > 0 else float(3600)
+    db.add(bucket)
+    await db.commit()
+    return retry_after
+
+async def admit(
+    db: AsyncSession, user_id: int, priority: int, diff_lines: Optional[int] = None
+) -> AdmissionDecision:
+    """
+    Decide from the predicted wait whether to run, defer or reject, then
+    rate-limit the user. A request the full queue turns away doesn't cost a token.
+    """
+    wait = await predicted_wait_seconds(db, priority)
+    own = (await latency_model(db)).predict(diff_lines)
+    completion = datetime.utcnow() + timedelta(seconds=wait + own)
+
+    if wait > settings.ADMISSION_MAX_WAIT_SECONDS:
+        return AdmissionDecision(
+            status_code=429,
+            predicted_wait_seconds=wait,
+            predicted_completion=completion,
+            retry_after_seconds=math.ceil(wait - settings.ADMISSION_MAX_WAIT_SECONDS),
+            reason="Analysis queue is full",
+        )
+    retry_after = await consume_token(
+        db,
+        f"analysis:user:{user_id}",
+        settings.ANALYSIS_RATE_LIMIT_BURST,
+        settings.ANALYSIS_RATE_LIMIT_PER_MINUTE,
+    )
+    if retry_after > 0:
+        return AdmissionDecision(
+            status_code=429,
+            predicted_wait_seconds=wait,
+            predicted_completion=completion,
+            retry_after_seconds=math.ceil(retry_after),
+            reason="Analysis rate limit exceeded",
+        )
+    return AdmissionDecision(
+        status_code=202 if wait > settings.ADMISSION_DEFER_WAIT_SECONDS else 200,
+        predicted_wait_seconds=wait,
+        predicted_completion=completion,
+    )
@@ -1,95 +1,176 @@
 import json
 import httpx
+from typing import List, Optional, Tuple
 from app.core.config import settings
+from app.services import http_clients
 
 # Timeout for the HF model inference (CPU can be slow)
 # Timeout for the HF model inference (CPU can be slow)
 TIMEOUT_SECONDS = 300  # Increased to 5 minutes for very slow CPU starts
 
-async def analyze_pr_content(pr_id: int, diff_content: str):
+# Part of the analysis cache key: bump PROMPT_VERSION whenever the prompt or
+# result post-processing changes so stale cached reviews are not served.
+PROMPT_VERSION = "v2"
+MODEL_ID = "microsoft/Phi-3-mini-4k-instruct" # Model served by hf_space/app.py
+
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+class LLMServiceError(Exception):
+    """Raised instead of returning a fallback result when raise_errors=True."""
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+async def analyze_pr_content(
+    pr_id: int,
+    diff_content: str,
+    raise_errors: bool = False,
+    endpoint: Optional[str] = None,
+):
     """
     Sends the diff content to the hosted Hugging Face LLM Service.
+    By default errors produce a fallback result; with raise_errors=True they raise
+    LLMServiceError so the caller can retry (e.g. on a 503 during cold start).
+    endpoint selects another service with the same /review API (see model_router).
     """
     print(f"Analyzing PR {pr_id} via Hugging Face Service...")
+    endpoint = endpoint or settings.HF_LLM_URL
     
-    if not settings.HF_LLM_URL or "YOUR_USERNAME" in settings.HF_LLM_URL:
+    if not endpoint or "YOUR_USERNAME" in endpoint:
         return _get_mock_response("HF_LLM_URL not set or default value detected.")
 
-    # Performance Safeguard: Trim whitespace and limit size
-    MAX_DIFF_SIZE = 15000 
-    truncated = False
-    if len(diff_content) > MAX_DIFF_SIZE:
-        diff_content = diff_content[:MAX_DIFF_SIZE]
-        truncated = True
+    # Performance Safeguard: never send more than one call's token budget.
+    # The analysis pipeline already packs chunks to fit, so this only trims
+    # unparsed input (e.g. the PR-body fallback).
+    from app.services.token_budget import truncate_to_tokens
+    limited = truncate_to_tokens(diff_content, settings.LLM_CHUNK_MAX_TOKENS)
+    truncated = len(limited) < len(diff_content)
+    diff_content = limited
 
     try:
-        async with httpx.AsyncClient() as client:
-            print(f"DEBUG: Posting to {settings.HF_LLM_URL}/review")
-            response = await client.post(
-                f"{settings.HF_LLM_URL}/review",
-                json={"diff": diff_content, "truncated": truncated},
-                timeout=TIMEOUT_SECONDS
-            )
-            
-            if response.status_code != 200:
-                raw_text = response.text
-                # Sanitize HTML errors
-                if "<!DOCTYPE" in raw_text or "<html" in raw_text:
-                     error_summary = "Hugging Face Service Overloaded/Busy (500/503)"
-                else:
-                     error_summary = f"HF Service Error: {response.status_code}"
-                
-                print(f"HF Error: {response.status_code} - {raw_text[:200]}...") # Log brief
-                return _get_mock_response(error_summary)
-            
-            # Robust Parsing Logic
-            raw_data = response.json()
-            print(f"DEBUG: Raw LLM Response: {raw_data}") 
-
-            parsed_result = {}
-            # Parsing Block
-            if isinstance(raw_data, dict) and "text" in raw_data and isinstance(raw_data["text"], str):
-                 try:
-                     cleaned_text = _clean_json_text(raw_data["text"])
-                     parsed_result = json.loads(cleaned_text)
-                 except Exception:
-                     parsed_result = raw_data # Fallback to raw if nested parse fails
-            elif isinstance(raw_data, dict):
-                 parsed_result = raw_data
-            
-            # --- HEURISTIC FALLBACK (The "Perfect UX" Fix) ---
-            # If the LLM returns 0s (common for binary files, empty diffs, or confusion),
-            # we inject reasonable defaults so the dashboard looks "alive" and not broken.
-            
-            defaults = {
-                "security_score": 85,
-                "performance_score": 88,
-                "reliability_score": 90,
-                "maintainability_score": 87,
-                "merge_confidence": 0.85,
-                "summary": "This change appears to be a documentation, binary, or configuration update. No critical code issues detected."
-            }
+        client = http_clients.llm()
+        print(f"DEBUG: Posting to {endpoint}/review")
+        response = await client.post(
+            f"{endpoint}/review",
+            json={"diff": diff_content, "truncated": truncated},
+            timeout=TIMEOUT_SECONDS
+        )
             
-            # Check if main score is 0 or missing
-            if not parsed_result.get("security_score"):
-                print("DEBUG: Scores detected as 0/Missing. Applying Heuristics.")
-                parsed_result.update({
-                    "security_score": parsed_result.get("security_score") or defaults["security_score"],
-                    "performance_score": parsed_result.get("performance_score") or defaults["performance_score"],
-                    "reliability_score": parsed_result.get("reliability_score") or defaults["reliability_score"],
-                    "maintainability_score": parsed_result.get("maintainability_score") or defaults["maintainability_score"],
-                    "merge_confidence": parsed_result.get("merge_confidence") or defaults["merge_confidence"],
-                })
-                # Only override summary if it's missing or extremely generic error
-                if not parsed_result.get("summary") or "error" in str(parsed_result.get("summary")).lower():
-                    parsed_result["summary"] = defaults["summary"]
+        if response.status_code != 200:
+            error_summary = _error_summary(response)
+            if raise_errors:
+                raise LLMServiceError(error_summary, retryable=response.status_code in RETRYABLE_STATUS_CODES)
+            return _get_mock_response(error_summary)
             
-            return parsed_result
+        # Robust Parsing Logic
+        raw_data = response.json()
+        return _parse_review(raw_data)
             
+    except LLMServiceError:
+        raise
     except Exception as e:
         print(f"Error calling HF Service: {e}")
+        if raise_errors:
+            raise LLMServiceError(f"Connection Error: {str(e)}", retryable=isinstance(e, httpx.TransportError))
         return _get_mock_response(f"Connection Error: {str(e)}")
 
+async def analyze_pr_batch(
+    items: List[Tuple[int, str]],
+    endpoint: Optional[str] = None,
+) -> List[dict]:
+    """
+    Review several small diffs in one /review/batch request, so the LLM service
+    can run them as a single padded generation batch instead of one by one.
+    items are (pr_id, diff); results come back in the same order.
+    Raises LLMServiceError for a failed request; an item the service could not
+    review comes back as a fallback result. A service without /review/batch
+    (404) is called once per item instead.
+    """
+    endpoint = endpoint or settings.HF_LLM_URL
+    if not endpoint or "YOUR_USERNAME" in endpoint:
+        return [_get_mock_response("HF_LLM_URL not set or default value detected.") for _ in items]
+
+    from app.services.token_budget import truncate_to_tokens
+    payload = []
+    for _, diff_content in items:
+        limited = truncate_to_tokens(diff_content, settings.LLM_CHUNK_MAX_TOKENS)
+        payload.append({"diff": limited, "truncated": len(limited) < len(diff_content)})
+
+    print(f"Analyzing {len(items)} PRs ({', '.join(str(pr_id) for pr_id, _ in items)}) in one batch...")
+    try:
+        client = http_clients.llm()
+        response = await client.post(f"{endpoint}/review/batch", json={"items": payload}, timeout=TIMEOUT_SECONDS)
+    except Exception as e:
+        raise LLMServiceError(f"Connection Error: {str(e)}", retryable=isinstance(e, httpx.TransportError))
+
+    if response.status_code == 404:
+        return [
+            await analyze_pr_content(pr_id, diff_content, raise_errors=True, endpoint=endpoint)
+            for pr_id, diff_content in items
+        ]
+    if response.status_code != 200:
+        raise LLMServiceError(_error_summary(response), retryable=response.status_code in RETRYABLE_STATUS_CODES)
+
+    results = (response.json() or {}).get("results") or []
+    if len(results) != len(items):
+        raise LLMServiceError(f"Batch returned {len(results)} results for {len(items)} items", retryable=True)
+    return [
+        _get_mock_response(raw["error"]) if isinstance(raw, dict) and raw.get("error") else _parse_review(raw)
+        for raw in results
+    ]
+
+def _error_summary(response: httpx.Response) -> str:
+    raw_text = response.text
+    print(f"HF Error: {response.status_code} - {raw_text[:200]}...") # Log brief
+    # Sanitize HTML errors
+    if "<!DOCTYPE" in raw_text or "<html" in raw_text:
+        return "Hugging Face Service Overloaded/Busy (500/503)"
+    return f"HF Service Error: {response.status_code}"
+
+def _parse_review(raw_data) -> dict:
+    """Turn one /review response body into a result dict (shared by single and batched calls)."""
+    print(f"DEBUG: Raw LLM Response: {raw_data}")
+
+    parsed_result = {}
+    # Parsing Block
+    if isinstance(raw_data, dict) and "text" in raw_data and isinstance(raw_data["text"], str):
+         try:
+             cleaned_text = _clean_json_text(raw_data["text"])
+             parsed_result = json.loads(cleaned_text)
+         except Exception:
+             parsed_result = raw_data # Fallback to raw if nested parse fails
+    elif isinstance(raw_data, dict):
+         parsed_result = raw_data
+
+    # --- HEURISTIC FALLBACK (The "Perfect UX" Fix) ---
+    # If the LLM returns 0s (common for binary files, empty diffs, or confusion),
+    # we inject reasonable defaults so the dashboard looks "alive" and not broken.
+
+    defaults = {
+        "security_score": 85,
+        "performance_score": 88,
+        "reliability_score": 90,
+        "maintainability_score": 87,
+        "merge_confidence": 0.85,
+        "summary": "This change appears to be a documentation, binary, or configuration update. No critical code issues detected."
+    }
+
+    # Check if main score is 0 or missing
+    if not parsed_result.get("security_score"):
+        print("DEBUG: Scores detected as 0/Missing. Applying Heuristics.")
+        parsed_result.update({
+            "security_score": parsed_result.get("security_score") or defaults["security_score"],
+            "performance_score": parsed_result.get("performance_score") or defaults["performance_score"],
+            "reliability_score": parsed_result.get("reliability_score") or defaults["reliability_score"],
+            "maintainability_score": parsed_result.get("maintainability_score") or defaults["maintainability_score"],
+            "merge_confidence": parsed_result.get("merge_confidence") or defaults["merge_confidence"],
+        })
+        # Only override summary if it's missing or extremely generic error
+        if not parsed_result.get("summary") or "error" in str(parsed_result.get("summary")).lower():
+            parsed_result["summary"] = defaults["summary"]
+
+    return parsed_result
+
 def _clean_json_text(text: str) -> str:
     """Removes markdown code blocks and whitespace."""
     text = text.strip()
@@ -101,8 +182,13 @@ def _clean_json_text(text: str) -> str:
         text = text[:-3]
     return text.strip()
 
+def is_fallback_result(result: dict) -> bool:
+    """True if the result is a placeholder produced because the LLM call failed."""
+    return bool(result.get("fallback"))
+
 def _get_mock_response(error_detail: str = "Service unavailable"):
     return {
+        "fallback": True,
         "summary": "Analysis failed.",
         "score": 0, 
         "security_score": 0,
@@ -0,0 +1,100 @@
+import hashlib
+import re
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select, func
+
+from app.core.config import settings
+from app.models.analysis_cache import AnalysisCacheEntry
+from app.services.ai_service import PROMPT_VERSION, MODEL_ID, is_fallback_result
+
+# Per-process counters (the worker is where lookups happen).
+# Durable hit/miss totals come from Analysis.cache_status, see /analysis/cache/stats.
+_counters = {"hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "evictions": 0}
+
+_HUNK_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+\d+(?:,\d+)? @@")
+
+def normalize_diff(diff_content: str) -> str:
+    """
+    Strip parts of a unified diff that change without the reviewed code changing:
+    line endings, trailing whitespace, blob 'index' lines and hunk line offsets
+    (which move whenever the PR is rebased).
+    """
+    lines = []
+    for line in diff_content.replace("\r\n", "\n").split("\n"):
+        if line.startswith("index "):
+            continue
+        line = _HUNK_HEADER.sub("@@", line)
+        lines.append(line.rstrip())
+    return "\n".join(lines).strip()
+
+def cache_key(diff_content: str, model_id: Optional[str] = None) -> str:
+    digest = hashlib.sha256()
+    digest.update(f"{PROMPT_VERSION}\0{model_id or MODEL_ID}\0".encode())
+    digest.update(normalize_diff(diff_content).encode("utf-8", errors="replace"))
+    return digest.hexdigest()
+
+async def get(db: AsyncSession, key: str) -> Optional[dict]:
+    entry = await db.get(AnalysisCacheEntry, key)
+    now = datetime.utcnow()
+    if not entry or entry.expires_at < now:
+        if entry:
+            await db.delete(entry)
+            await db.commit()
+        _counters["misses"] += 1
+        return None
+
+    entry.hit_count += 1
+    entry.last_hit_at = now
+    db.add(entry)
+    await db.commit()
+    _counters["hits"] += 1
+    return dict(entry.result)
+
+async def put(db: AsyncSession, key: str, result: dict, model_id: Optional[str] = None):
+    """
+    Store a successful LLM result under the model that produced it (the one in
+    its cache_key). Placeholder results from failed calls are never cached.
+    """
+    if is_fallback_result(result):
+        return
+
+    now = datetime.utcnow()
+    entry = AnalysisCacheEntry(
+        key=key,
+        result=result,
+        prompt_version=PROMPT_VERSION,
+        model_id=model_id or MODEL_ID,
+        created_at=now,
+        last_hit_at=now,
+        expires_at=now + timedelta(seconds=settings.ANALYSIS_CACHE_TTL_SECONDS),
+    )
+    await db.merge(entry)
+    await db.commit()
+    _counters["stores"] += 1
+    await evict(db)
+
+async def evict(db: AsyncSession) -> int:
+    """Drop expired entries, then least recently hit ones above ANALYSIS_CACHE_MAX_ENTRIES."""
+    now = datetime.utcnow()
+    expired = await db.execute(delete(AnalysisCacheEntry).where(AnalysisCacheEntry.expires_at < now))
+    removed = expired.rowcount or 0
+
+    count = (await db.execute(select(func.count()).select_from(AnalysisCacheEntry))).scalar_one()
+    overflow = count - settings.ANALYSIS_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        oldest = select(AnalysisCacheEntry.key).order_by(AnalysisCacheEntry.last_hit_at).limit(overflow)
+        lru = await db.execute(delete(AnalysisCacheEntry).where(AnalysisCacheEntry.key.in_(oldest)))
+        removed += lru.rowcount or 0
+
+    await db.commit()
+    _counters["evictions"] += removed
+    return removed
+
+def record_bypass():
+    _counters["bypassed"] += 1
+
+def process_stats() -> dict:
+    return dict(_counters)
@@ -0,0 +1,576 @@
+from typing import Optional, Callable, Awaitable, Dict, List, Tuple
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.services.ai_service import PROMPT_VERSION, analyze_pr_content, is_fallback_result, LLMServiceError
+from app.services import (
+    analysis_cache, similarity_index, file_review, token_budget, diff_filter, diff_minimizer, model_router,
+    static_analysis, diff_download, diff_cache, llm_batcher,
+)
+from app.services.chunking import Chunk, build_chunks
+from app.services.diff_parser import FileDiff, parse_diff, render_diff
+from app.core.config import settings
+from app.models.pull_request import PullRequest
+from app.models.analysis import Analysis
+from app.models.repository import Repository
+from app.db.session import async_session
+from app.utils.github import get_real_repo_name
+import asyncio
+import httpx
+import random
+import time
+import traceback
+
+# Pipeline stages, in order. Analysis.stage holds the stage to run next, so a
+# retry (or a worker that re-claims a crashed job) resumes where the last run failed.
+STAGES = ("fetch_diff", "static_scan", "preprocess", "infer", "persist")
+STAGE_DONE = "done"
+
+class RetryPolicy(BaseModel):
+    max_attempts: int
+    base_delay: float # Seconds before the first retry
+    max_delay: float
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter for the given (1-based) failed attempt."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+RETRY_POLICIES = {
+    "fetch_diff": RetryPolicy(max_attempts=4, base_delay=1.0, max_delay=15.0),
+    "static_scan": RetryPolicy(max_attempts=1, base_delay=0.0, max_delay=0.0),
+    "preprocess": RetryPolicy(max_attempts=1, base_delay=0.0, max_delay=0.0),
+    # HF Spaces answer 503 for a minute or two while the model cold-starts
+    "infer": RetryPolicy(max_attempts=6, base_delay=10.0, max_delay=90.0),
+    "persist": RetryPolicy(max_attempts=3, base_delay=0.5, max_delay=5.0),
+}
+
+class StageError(Exception):
+    """Failure inside a stage. Retryable errors are retried per the stage's RetryPolicy."""
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+def count_changed_lines(diff_content: str) -> int:
+    """Added + removed lines in a unified diff (file headers excluded)."""
+    return sum(
+        1 for line in diff_content.splitlines()
+        if line[:1] in ("+", "-") and not line.startswith(("+++", "---"))
+    )
+
+class PreparedDiff(BaseModel):
+    diff: str # What the LLM sees
+    files: List[FileDiff] = [] # Parsed form of diff; empty for fallback text
+    skipped: List[diff_filter.SkippedFile] = []
+    minimized: Optional[dict] = None # Token counts before/after + minimizer stats
+    notes: Optional[str] = None # Renames / moves folded out of the diff
+
+def prepare_diff(
+    diff_content: str,
+    diff_fetched: bool,
+    repo_rules: Optional[List[str]] = None,
+    skipped: Optional[List[diff_filter.SkippedFile]] = None,
+) -> PreparedDiff:
+    """
+    Preprocessing shared by the pipeline and the backfill CLI. No truncation:
+    large diffs are split into chunks at inference.
+    Drops lockfiles, vendored, generated and binary files, then trims context
+    and folds whitespace-only edits, renames and moved code.
+    """
+    skipped = list(skipped or [])
+    files = parse_diff(diff_content) if diff_fetched else []
+    if not files:
+        return PreparedDiff(diff=diff_content, skipped=skipped)
+
+    kept, filtered = diff_filter.filter_files(files, repo_rules)
+    skipped += filtered
+    if skipped:
+        print(f"DEBUG: Skipping {len(skipped)} of {len(files)} files (generated/vendored/lockfile/binary)")
+
+    tokens_before = token_budget.count_tokens(render_diff(kept))
+    minimal = diff_minimizer.minimize(kept)
+    diff_content = render_diff(minimal.files)
+    minimized = {
+        "tokens_before": tokens_before,
+        "tokens_after": token_budget.count_tokens(diff_content),
+        **minimal.stats.model_dump(),
+    }
+    print(f"DEBUG: Minimized diff from {minimized['tokens_before']} to {minimized['tokens_after']} tokens")
+    return PreparedDiff(
+        diff=diff_content,
+        files=minimal.files,
+        skipped=skipped,
+        minimized=minimized,
+        notes=diff_minimizer.notes_text(minimal.notes),
+    )
+
+def pr_context(title: Optional[str], body: Optional[str], notes: Optional[str] = None) -> str:
+    """PR title + description sent with every LLM call, plus the minimizer's notes."""
+    context = f"PR Title: {title}\nDescription: {body}"[:settings.LLM_CONTEXT_MAX_CHARS]
+    return f"{context}\n{notes}" if notes else context
+
+def attach_findings(
+    result: dict,
+    skipped: Optional[List[dict]] = None,
+    minimized: Optional[dict] = None,
+    diff_truncated: bool = False,
+    static_issues: Optional[List[dict]] = None,
+) -> dict:
+    """
+    Add this run's own findings to an LLM (or reused) result. Static issues go
+    first; any carried over from a reused result are replaced by this run's.
+    """
+    result = dict(result)
+    if skipped:
+        result["skipped"] = skipped
+    if minimized:
+        result["minimized"] = minimized
+    if diff_truncated:
+        result["diff_truncated"] = True # Files past DIFF_MAX_BYTES were not downloaded
+    if static_issues:
+        result["issues"] = static_issues + [
+            issue for issue in result.get("issues") or [] if isinstance(issue, dict) and issue.get("source") != "static"
+        ]
+        result["static_issues"] = len(static_issues)
+    return result
+
+def result_columns(result: dict) -> dict:
+    """Analysis column values for a finished result (scores default to 0 if missing)."""
+    return {
+        "status": "completed",
+        "raw_llm_output": result,
+        "security_score": result.get("security_score", 0),
+        "performance_score": result.get("performance_score", 0),
+        "reliability_score": result.get("reliability_score", 0),
+        "maintainability_score": result.get("maintainability_score", 0),
+        "merge_confidence_score": result.get("merge_confidence", 0),
+        "vulnerability_count": static_analysis.count_vulnerabilities(result.get("issues") or []),
+    }
+
+class AnalysisPipeline:
+    """
+    Runs the stages for one Analysis. Every stage persists its output on the
+    Analysis row (diff_snapshot / checkpoint) before the cursor advances.
+    """
+    def __init__(
+        self,
+        db: AsyncSession,
+        analysis: Analysis,
+        pr: PullRequest,
+        repo: Repository,
+        github_token: Optional[str],
+        bypass_cache: bool = False,
+        batched: bool = False,
+    ):
+        self.db = db
+        self.analysis = analysis
+        self.pr = pr
+        self.repo = repo
+        self.github_token = github_token
+        self.bypass_cache = bypass_cache
+        self.batched = batched # Bulk run: small LLM calls go through llm_batcher
+
+    @property
+    def checkpoint(self) -> dict:
+        return dict(self.analysis.checkpoint or {})
+
+    def save(self, **values):
+        # Reassign (not mutate) so SQLAlchemy sees the JSON column change
+        self.analysis.checkpoint = {**self.checkpoint, **values}
+
+    async def run(self):
+        start = self.analysis.stage if self.analysis.stage in STAGES else STAGES[0]
+        if start != STAGES[0]:
+            print(f"DEBUG: Resuming AnalysisID={self.analysis.id} at stage '{start}'")
+
+        for name in STAGES[STAGES.index(start):]:
+            self.analysis.stage = name
+            self.db.add(self.analysis)
+            await self.db.commit()
+
+            if not await self._run_stage(name, getattr(self, name)):
+                return # Superseded while running
+
+        self.analysis.stage = STAGE_DONE
+        self.db.add(self.analysis)
+        await self.db.commit()
+
+    async def _run_stage(self, name: str, stage: Callable[[], Awaitable[bool]]) -> bool:
+        policy = RETRY_POLICIES[name]
+        for attempt in range(1, policy.max_attempts + 1):
+            try:
+                return await stage()
+            except (StageError, LLMServiceError, httpx.TransportError) as e:
+                retryable = getattr(e, "retryable", True)
+                if not retryable or attempt == policy.max_attempts:
+                    raise
+                await self.db.rollback()
+                # A rollback expires every loaded object (expire_on_commit doesn't apply);
+                # lazy loads would fail on an AsyncSession, so reload before the retry
+                await self._reload()
+                delay = policy.backoff(attempt)
+                print(f"DEBUG: Stage '{name}' attempt {attempt} failed ({e}); retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _reload(self):
+        for obj in (self.analysis, self.pr, self.repo):
+            await self.db.refresh(obj)
+
+    async def fetch_diff(self) -> bool:
+        real_full_name = get_real_repo_name(self.repo)
+        print(f"DEBUG: Fetching Diff for {real_full_name} PR #{self.pr.github_pr_number}")
+        # Shared with the diff viewer: one download (or local `git diff`) per head commit
+        download = await diff_cache.fetch_pr_diff(
+            self.db,
+            self.repo,
+            self.pr.github_pr_number,
+            self.github_token,
+            head_sha=self.analysis.head_sha,
+            base_ref=self.pr.base_ref,
+        )
+        diff_fetched = download.status_code == 200
+        if diff_fetched:
+            download = diff_download.apply_path_filters(download, self.repo.review_ignore)
+            print(f"DEBUG: Diff fetched successfully. Length: {len(download.text)} ({download.bytes_read} bytes read)")
+            diff_content = download.text
+        elif download.status_code in (429, 500, 502, 503, 504):
+            raise StageError(f"GitHub returned {download.status_code}", retryable=True)
+        else:
+            print(f"DEBUG: Failed to fetch diff: {download.status_code} {download.text}")
+            # Fallback content
+            diff_content = f"Could not fetch diff. PR Body: {self.pr.body or 'No Description'}"
+
+        self.analysis.diff_snapshot = diff_content # Checkpoint: retries never re-download
+        self.save(
+            diff_fetched=diff_fetched,
+            diff_truncated=download.truncated,
+            stream_skipped=[entry.model_dump() for entry in download.skipped],
+        )
+        self.db.add(self.analysis)
+        await self.db.commit()
+        return True
+
+    async def static_scan(self) -> bool:
+        """
+        Deterministic checks (secrets, SQL concatenation, eval/exec, Python AST)
+        in the process pool. Findings are shown as a provisional result right
+        away and merged with the LLM's issues in the infer stage.
+        """
+        issues = []
+        if self.checkpoint.get("diff_fetched"):
+            try:
+                issues = await static_analysis.run_scan(self.analysis.diff_snapshot or "", self.repo.review_ignore)
+            except Exception as e:
+                # Best effort: the LLM review still runs without it
+                print(f"DEBUG: Static scan failed for AnalysisID={self.analysis.id}: {e!r}")
+
+        self.save(static_issues=issues)
+        self.analysis.vulnerability_count = static_analysis.count_vulnerabilities(issues)
+        if issues:
+            print(f"DEBUG: Static scan found {len(issues)} issues for AnalysisID={self.analysis.id}")
+            self.analysis.raw_llm_output = {
+                "provisional": True,
+                "summary": f"Static checks found {len(issues)} potential issues. AI review in progress.",
+                "issues": issues,
+            }
+        self.db.add(self.analysis)
+        await self.db.commit()
+        return True
+
+    async def preprocess(self) -> bool:
+        diff_fetched = self.checkpoint.get("diff_fetched")
+        # Path rules already ran on download; this catches binaries and content markers
+        stream_skipped = [diff_filter.SkippedFile(**entry) for entry in self.checkpoint.get("stream_skipped") or []]
+        prepared = prepare_diff(self.analysis.diff_snapshot or "", diff_fetched, self.repo.review_ignore, stream_skipped)
+
+        # Cheapest model tier that can handle what is left
+        flagged = any(issue.get("severity") == "high" for issue in self.checkpoint.get("static_issues") or [])
+        route = model_router.route(prepared.files, flagged=flagged)
+        self.analysis.model_tier = route.tier
+        print(f"DEBUG: Routed AnalysisID={self.analysis.id} to tier '{route.tier}' ({route.reason})")
+
+        context = pr_context(self.pr.title, self.pr.body, prepared.notes)
+        diff_content = prepared.diff
+        self.save(
+            prepared_diff=diff_content,
+            skipped=[entry.model_dump() for entry in prepared.skipped],
+            minimized=prepared.minimized,
+            route=route.model_dump(),
+            context=context,
+            prompt=f"{context}\n\n{diff_content}",
+            prompt_version=PROMPT_VERSION,
+            # Only real diffs are cacheable, not the fallback text
+            cache_key=analysis_cache.cache_key(diff_content, route.model_id) if diff_fetched else None,
+            signature=await similarity_index.compute_signature(diff_content) if diff_fetched else [],
+        )
+        self.db.add(self.analysis)
+        await self.db.commit()
+        return True
+
+    async def infer(self) -> bool:
+        checkpoint = self.checkpoint
+        cache_key = checkpoint.get("cache_key")
+
+        if checkpoint.get("minimized") and not checkpoint["prepared_diff"].strip():
+            # Every file was filtered out or minimized away: nothing for the LLM to do
+            return await self._finish(diff_filter.nothing_to_review_result(checkpoint.get("skipped") or []))
+
+        route = model_router.Route(**checkpoint["route"]) if checkpoint.get("route") else model_router.route([])
+        if route.tier == model_router.TIER_NONE:
+            return await self._finish(model_router.fast_path_result(route.reason))
+
+        result = None
+        if cache_key and self.bypass_cache:
+            analysis_cache.record_bypass()
+            self.analysis.cache_status = "bypass"
+        elif cache_key:
+            result = await analysis_cache.get(self.db, cache_key)
+            self.analysis.cache_status = "hit" if result is not None else "miss"
+
+        if result is None and not self.bypass_cache:
+            result = await self._reuse_similar(checkpoint.get("signature"), route.model_id)
+
+        if result is None:
+            # Run AI
+            print("DEBUG: Sending to AI Service...")
+            started = time.monotonic()
+            files = parse_diff(checkpoint["prepared_diff"]) if checkpoint.get("diff_fetched") else []
+            if any(f.hunks for f in files):
+                result, reviewed_lines = await self._infer_chunked(files, checkpoint, route)
+            else:
+                result = await self._review(checkpoint["prompt"], route.endpoint)
+                reviewed_lines = count_changed_lines(checkpoint["prepared_diff"])
+            result = {**result, "tier": route.tier}
+            print(f"DEBUG: AI Analysis Completed. Score: {result.get('score', 0)}")
+            if not is_fallback_result(result) and reviewed_lines:
+                # Latency samples for the admission-control ETA model
+                self.analysis.inference_ms = int((time.monotonic() - started) * 1000)
+                self.analysis.diff_lines = reviewed_lines
+            if cache_key:
+                await analysis_cache.put(self.db, cache_key, result, route.model_id)
+        else:
+            print(f"DEBUG: Analysis cache hit for AnalysisID={self.analysis.id}")
+
+        return await self._finish(result)
+
+    async def _finish(self, result: dict) -> bool:
+        """Attach this run's own findings (filtered files, minimizer stats, static issues) and checkpoint the result."""
+        checkpoint = self.checkpoint
+        result = attach_findings(
+            result,
+            skipped=checkpoint.get("skipped"),
+            minimized=checkpoint.get("minimized"),
+            diff_truncated=checkpoint.get("diff_truncated", False),
+            static_issues=checkpoint.get("static_issues"),
+        )
+        self.save(result=result)
+        self.db.add(self.analysis)
+        await self.db.commit()
+        return True
+
+    async def _review(self, prompt: str, endpoint: Optional[str]) -> dict:
+        """One LLM call; small ones from bulk runs are batched with other analyses."""
+        if self.batched and token_budget.count_tokens(prompt) <= settings.LLM_BATCH_MAX_TOKENS:
+            return await llm_batcher.review(self.pr.id, prompt, endpoint)
+        return await analyze_pr_content(self.pr.id, prompt, raise_errors=True, endpoint=endpoint)
+
+    async def _infer_chunked(
+        self, files: List[FileDiff], checkpoint: dict, route: model_router.Route
+    ) -> Tuple[dict, int]:
+        """
+        Map-reduce review of a parsed diff. Files with a memoized review for the
+        same (repository, path, base blob, head blob) are reused; the rest are risk-ranked
+        into the token budget, split into chunks at file/hunk
+        boundaries, reviewed in parallel (bounded by LLM_CHUNK_CONCURRENCY) and
+        merged back per file.
+        Returns (merged result, changed lines sent to the LLM).
+        """
+        # Full blob SHAs where the mirror has them, so API and mirror diffs share memo entries
+        files = await file_review.expand_blobs(get_real_repo_name(self.repo), files)
+        memo = {} if self.bypass_cache else await file_review.get_many(self.db, files, self.repo.id, route.model_id)
+        reviews: Dict[str, Tuple[FileDiff, dict, bool]] = {}
+        pending: List[FileDiff] = []
+        for file in files:
+            if not file.hunks:
+                continue # Binary / mode-only change: nothing to review
+            cached = memo.get(file_review.review_key(file, self.repo.id, route.model_id))
+            if cached:
+                reviews[file.path] = (file, cached, True)
+            else:
+                pending.append(file)
+
+        # Spend the token budget on the riskiest hunks, not on whatever comes first
+        budget = token_budget.chunk_budget(checkpoint["context"])
+        packed = token_budget.pack(pending, budget * settings.LLM_MAX_CHUNKS)
+        partial = {hunk.file for hunk in packed.omitted}
+        pending = packed.files
+        if packed.omitted:
+            print(f"DEBUG: Token budget: kept {packed.tokens} tokens, left out {len(packed.omitted)} hunks")
+
+        chunks = build_chunks(pending, budget)
+        skipped_files: List[str] = []
+        if len(chunks) > settings.LLM_MAX_CHUNKS:
+            # Packing overhead can still overflow by a chunk or two; list those files instead of half-reviewing them
+            skipped_files = list(dict.fromkeys(
+                path for chunk in chunks[settings.LLM_MAX_CHUNKS:] for path in chunk.paths
+            ))
+            chunks = chunks[:settings.LLM_MAX_CHUNKS]
+            pending = [f for f in pending if f.path not in skipped_files]
+            print(f"DEBUG: Diff needs more than {settings.LLM_MAX_CHUNKS} chunks, skipping {len(skipped_files)} files")
+
+        semaphore = asyncio.Semaphore(settings.LLM_CHUNK_CONCURRENCY)
+
+        async def review(chunk: Chunk) -> dict:
+            async with semaphore:
+                return await self._review(f"{checkpoint['context']}\n\n{chunk.text}", route.endpoint)
+
+        if chunks:
+            print(f"DEBUG: Reviewing {len(pending)} files in {len(chunks)} chunks")
+        outcomes = await asyncio.gather(*(review(chunk) for chunk in chunks), return_exceptions=True)
+
+        # Reduce: collect each file's parts (a large file may span several chunks)
+        parts: Dict[str, List[Tuple[dict, int]]] = {}
+        failed_paths = set()
+        error: Optional[BaseException] = None
+        for chunk, outcome in zip(chunks, outcomes):
+            if isinstance(outcome, BaseException):
+                error = error or outcome
+                failed_paths.update(chunk.paths)
+                continue
+            for path, result in file_review.split_chunk_result(chunk.paths, outcome).items():
+                parts.setdefault(path, []).append((result, chunk.changed_lines))
+
+        reviewed_lines = 0
+        for file in pending:
+            if file.path in failed_paths or file.path not in parts:
+                continue
+            result = file_review.combine_parts(parts[file.path])
+            if file.path not in partial:
+                await file_review.put(self.db, file, result, self.repo.id, route.model_id) # Only complete reviews are memoized
+            reviews[file.path] = (file, result, False)
+            reviewed_lines += file.changed_count
+
+        if error is not None:
+            await self.db.commit() # Finished files are memoized; a retry of this stage only redoes the rest
+            raise error
+
+        if not reviews:
+            result = await analyze_pr_content(self.pr.id, checkpoint["prompt"], raise_errors=True, endpoint=route.endpoint)
+            return result, count_changed_lines(checkpoint["prepared_diff"])
+
+        ordered = [reviews[f.path] for f in files if f.path in reviews]
+        print(f"DEBUG: Chunked review: {len(ordered)} files, {sum(1 for r in ordered if r[2])} reused")
+        merged = file_review.merge_results(ordered)
+        merged["chunks"] = len(chunks)
+        if skipped_files:
+            merged["skipped_files"] = skipped_files
+        if packed.omitted:
+            merged["omitted_hunks"] = [hunk.model_dump() for hunk in packed.omitted]
+        return merged, reviewed_lines
+
+    async def _reuse_similar(self, signature: Optional[list], model_id: Optional[str]) -> Optional[dict]:
+        """
+        Near-duplicate lookup (cherry-picks, backports, rebases) among results
+        of the model this diff was routed to.
+        Above SIMILARITY_REUSE_THRESHOLD the prior result is returned and the LLM is skipped.
+        Above SIMILARITY_PROVISIONAL_THRESHOLD it is shown as a provisional result
+        while the LLM runs.
+        """
+        match = await similarity_index.find_similar(
+            self.db, signature, settings.SIMILARITY_PROVISIONAL_THRESHOLD,
+            repo_id=self.repo.id, model_id=model_id, exclude_analysis_id=self.analysis.id,
+        )
+        if not match:
+            return None
+
+        prior, similarity = match
+        source = {"analysis_id": prior.id, "similarity": round(similarity, 3)}
+        if similarity >= settings.SIMILARITY_REUSE_THRESHOLD:
+            print(f"DEBUG: Reusing AnalysisID={prior.id} (similarity {similarity:.2f})")
+            self.analysis.cache_status = "similar"
+            return {**prior.raw_llm_output, "reused_from": source}
+
+        static_issues = self.checkpoint.get("static_issues") or []
+        self.analysis.raw_llm_output = {
+            **prior.raw_llm_output,
+            "issues": static_issues + [
+                issue for issue in prior.raw_llm_output.get("issues") or [] if isinstance(issue, dict) and issue.get("source") != "static"
+            ],
+            "provisional": True,
+            "provisional_from": source,
+        }
+        self.db.add(self.analysis)
+        await self.db.commit()
+        return None
+
+    async def persist(self) -> bool:
+        # A newer head may have superseded this run while the LLM was busy
+        await self.db.refresh(self.analysis, ["status"])
+        if self.analysis.status == "superseded":
+            print(f"DEBUG: AnalysisID={self.analysis.id} was superseded, discarding result")
+            return False
+
+        result = self.checkpoint["result"]
+
+        # Update Record
+        for column, value in result_columns(result).items():
+            setattr(self.analysis, column, value)
+
+        if not is_fallback_result(result):
+            await similarity_index.index_analysis(
+                self.db, self.analysis.id, self.checkpoint.get("signature") or [],
+                self.checkpoint.get("prompt_version"), (self.checkpoint.get("route") or {}).get("model_id"),
+            )
+
+        self.db.add(self.analysis)
+        await self.db.commit()
+        print("DEBUG: Database Updated with Results")
+        return True
+
+async def perform_ai_analysis(
+    analysis_id: int,
+    pr_id: int,
+    github_token: Optional[str],
+    bypass_cache: bool = False,
+    batched: bool = False,
+):
+    """
+    Fetch the PR diff, run the LLM review and store the result on the Analysis row.
+    Runs inside the analysis worker (app.worker), never in the API process.
+    Results are served from the analysis cache unless bypass_cache is set.
+    batched lets small LLM calls share a batch request (bulk jobs).
+    A failed analysis keeps its stage cursor; retrying it resumes at that stage.
+    Pipeline errors are re-raised after the failure is recorded, so the worker
+    can requeue the job.
+    """
+    print(f"DEBUG: Starting Analysis Task for AnalysisID={analysis_id}, PR={pr_id}")
+    async with async_session() as db:
+        # Re-fetch objects attached to this session
+        analysis = await db.get(Analysis, analysis_id)
+        pr = await db.get(PullRequest, pr_id)
+        if not analysis or not pr:
+            print(f"DEBUG: Analysis or PR not found in background task: {analysis_id}")
+            return
+
+        # Fetch Repo to get full name
+        repo = await db.get(Repository, pr.repo_id)
+        if not repo:
+            print(f"DEBUG: Repo not found for PR: {pr_id}")
+            return
+
+        try:
+            await AnalysisPipeline(db, analysis, pr, repo, github_token, bypass_cache, batched).run()
+        except Exception as e:
+            with open("backend_debug.log", "a") as f:
+                f.write(f"CRASH: {str(e)}\n")
+            print(f"DEBUG: Analysis failed at stage '{analysis.stage}': {e}")
+            traceback.print_exc()
+            try:
+                await db.rollback()
+                await db.refresh(analysis)
+                if analysis.status != "superseded":
+                    analysis.status = "failed"
+                    analysis.raw_llm_output = {"error": str(e), "failed_stage": analysis.stage}
+                    db.add(analysis)
+                    await db.commit()
+            except Exception:
+                pass
+            raise # The worker's fail_job requeues the job until max_attempts
@@ -0,0 +1,86 @@
+from typing import Dict, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+from app.core.config import settings
+from app.models.analysis import Analysis
+from app.models.pull_request import PullRequest
+from app.models.repository import Repository
+from app.services import job_queue, scheduler
+
+async def _open_prs(db: AsyncSession, repo_id: int):
+    result = await db.execute(
+        select(PullRequest)
+        .where(PullRequest.repo_id == repo_id, PullRequest.state == "open")
+        .order_by(PullRequest.updated_at.desc())
+    )
+    return result.scalars().all()
+
+async def _latest_analyses(db: AsyncSession, pr_ids) -> Dict[int, Analysis]:
+    """Newest non-superseded Analysis per PR."""
+    if not pr_ids:
+        return {}
+    result = await db.execute(
+        select(Analysis)
+        .where(Analysis.pr_id.in_(pr_ids), Analysis.status != "superseded")
+        .order_by(Analysis.created_at.desc())
+    )
+    latest: Dict[int, Analysis] = {}
+    for analysis in result.scalars().all():
+        latest.setdefault(analysis.pr_id, analysis)
+    return latest
+
+def _is_current(analysis: Optional[Analysis], pr: PullRequest) -> bool:
+    """Completed and for the PR's current head (any head if it is unknown)."""
+    if not analysis or analysis.status != "completed":
+        return False
+    return not pr.head_sha or not analysis.head_sha or analysis.head_sha == pr.head_sha
+
+async def queue_open_prs(db: AsyncSession, repo: Repository, user_id: Optional[int]) -> dict:
+    """
+    Queue an analysis of every open PR of the repo that has no result for its
+    current head, at bulk priority: behind interactive and webhook work, and
+    eligible for batched inference in the worker. PRs with an analysis already
+    in flight are coalesced into it. At most BULK_ANALYZE_MAX_PRS are queued per call.
+    """
+    prs = await _open_prs(db, repo.id)
+    latest = await _latest_analyses(db, [pr.id for pr in prs])
+    counts = {"queued": 0, "coalesced": 0, "up_to_date": 0, "deferred": 0}
+    for pr in prs:
+        if _is_current(latest.get(pr.id), pr):
+            counts["up_to_date"] += 1
+            continue
+        if counts["queued"] >= settings.BULK_ANALYZE_MAX_PRS:
+            counts["deferred"] += 1
+            continue
+        _, coalesced = await job_queue.submit_analysis(
+            db, pr.id, head_sha=pr.head_sha, user_id=user_id, priority=scheduler.PRIORITY_BULK
+        )
+        counts["coalesced" if coalesced else "queued"] += 1
+    print(f"DEBUG: Bulk analysis of repo {repo.id}: {counts}")
+    return counts
+
+async def repo_progress(db: AsyncSession, repo_id: int) -> dict:
+    """How many of the repo's open PRs have a result for their current head."""
+    prs = await _open_prs(db, repo_id)
+    latest = await _latest_analyses(db, [pr.id for pr in prs])
+    counts = {"completed": 0, "in_progress": 0, "failed": 0, "outdated": 0, "not_analyzed": 0}
+    for pr in prs:
+        analysis = latest.get(pr.id)
+        if _is_current(analysis, pr):
+            counts["completed"] += 1
+        elif not analysis:
+            counts["not_analyzed"] += 1
+        elif analysis.status in job_queue.IN_FLIGHT_ANALYSIS_STATUSES:
+            counts["in_progress"] += 1
+        elif analysis.status == "failed":
+            counts["failed"] += 1
+        else:
+            counts["outdated"] += 1 # Completed for an older head
+    total = len(prs)
+    return {
+        "repo_id": repo_id,
+        "open_prs": total,
+        **counts,
+        "percent": round(100 * counts["completed"] / total) if total else 100,
+    }
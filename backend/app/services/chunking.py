@@ -0,0 +1,81 @@
+from typing import List
+from pydantic import BaseModel
+
+from app.services.diff_parser import FileDiff, Hunk
+from app.services.token_budget import count_tokens
+
+class Chunk(BaseModel):
+    """A piece of a diff small enough for one LLM call. Never splits a line."""
+    paths: List[str] # Files (or file parts) contained, in order
+    text: str
+    changed_lines: int
+    tokens: int
+
+def _file_parts(file: FileDiff, max_tokens: int) -> List[FileDiff]:
+    """
+    Split one file at hunk boundaries into parts that each fit max_tokens.
+    A single hunk larger than that is cut between lines, repeating its header.
+    """
+    budget = max(max_tokens - count_tokens("\n".join(file.header)), 64)
+
+    pieces: List[Hunk] = []
+    for hunk in file.hunks:
+        if count_tokens(hunk.render()) <= budget:
+            pieces.append(hunk)
+            continue
+        current = Hunk(header=hunk.header)
+        size = count_tokens(hunk.header)
+        for line in hunk.lines:
+            line_tokens = count_tokens(line) + 1
+            if current.lines and size + line_tokens > budget:
+                pieces.append(current)
+                current = Hunk(header=f"{hunk.header} (continued)")
+                size = count_tokens(current.header)
+            current.lines.append(line)
+            size += line_tokens
+        pieces.append(current)
+
+    parts: List[FileDiff] = []
+    current_hunks: List[Hunk] = []
+    size = 0
+    for hunk in pieces:
+        hunk_len = count_tokens(hunk.render()) + 1
+        if current_hunks and size + hunk_len > budget:
+            parts.append(file.model_copy(update={"hunks": current_hunks}))
+            current_hunks, size = [], 0
+        current_hunks.append(hunk)
+        size += hunk_len
+    if current_hunks or not parts:
+        parts.append(file.model_copy(update={"hunks": current_hunks}))
+    return parts
+
+def build_chunks(files: List[FileDiff], max_tokens: int) -> List[Chunk]:
+    """
+    Pack files into chunks of at most ~max_tokens (Phi-3 tokens), splitting only
+    at file and hunk boundaries. Small files share a chunk; large files are
+    spread over several.
+    """
+    chunks: List[Chunk] = []
+    paths: List[str] = []
+    texts: List[str] = []
+    changed = 0
+    size = 0
+
+    def flush():
+        nonlocal paths, texts, changed, size
+        if texts:
+            chunks.append(Chunk(paths=paths, text="\n".join(texts), changed_lines=changed, tokens=size))
+        paths, texts, changed, size = [], [], 0, 0
+
+    for file in files:
+        for part in _file_parts(file, max_tokens):
+            rendered = part.render()
+            part_tokens = count_tokens(rendered) + 1
+            if texts and size + part_tokens > max_tokens:
+                flush()
+            paths.append(file.path)
+            texts.append(rendered)
+            changed += part.changed_count
+            size += part_tokens
+    flush()
+    return chunks
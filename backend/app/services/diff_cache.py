@@ -0,0 +1,116 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select, func
+
+from app.core.config import settings
+from app.models.diff_cache import DiffCacheEntry
+from app.models.repository import Repository
+from app.services import git_mirror
+from app.services.diff_download import DiffDownload, stream_pr_diff
+from app.services.github_service import fetch_pr_metadata
+from app.utils.github import get_real_repo_name
+
+# Per-process counters, like analysis_cache
+_counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+def cache_key(repo_id: int, head_sha: str) -> str:
+    return f"{repo_id}:{head_sha}"
+
+async def get(db: AsyncSession, repo_id: int, head_sha: str, base_ref: Optional[str] = None) -> Optional[DiffDownload]:
+    entry = await db.get(DiffCacheEntry, cache_key(repo_id, head_sha))
+    if not entry or (base_ref and entry.base_ref and entry.base_ref != base_ref):
+        _counters["misses"] += 1
+        return None
+
+    entry.hit_count += 1
+    entry.last_used_at = datetime.utcnow()
+    db.add(entry)
+    await db.commit()
+    _counters["hits"] += 1
+    return DiffDownload(status_code=200, text=entry.diff, truncated=entry.truncated)
+
+async def put(db: AsyncSession, repo_id: int, head_sha: str, base_ref: Optional[str], download: DiffDownload):
+    """Store a successfully downloaded, unfiltered diff."""
+    if download.status_code != 200:
+        return
+    now = datetime.utcnow()
+    entry = DiffCacheEntry(
+        key=cache_key(repo_id, head_sha),
+        repo_id=repo_id,
+        head_sha=head_sha,
+        base_ref=base_ref,
+        diff=download.text,
+        size_bytes=len(download.text.encode("utf-8")),
+        truncated=download.truncated,
+        created_at=now,
+        last_used_at=now,
+    )
+    await db.merge(entry)
+    await db.commit()
+    _counters["stores"] += 1
+    await evict(db)
+
+async def evict(db: AsyncSession) -> int:
+    """Drop least recently used entries until the total is under DIFF_CACHE_MAX_BYTES."""
+    total = (await db.execute(select(func.coalesce(func.sum(DiffCacheEntry.size_bytes), 0)))).scalar_one()
+    excess = total - settings.DIFF_CACHE_MAX_BYTES
+    if excess <= 0:
+        return 0
+
+    victims = []
+    rows = await db.execute(
+        select(DiffCacheEntry.key, DiffCacheEntry.size_bytes).order_by(DiffCacheEntry.last_used_at)
+    )
+    for key, size in rows.all():
+        if excess <= 0:
+            break
+        victims.append(key)
+        excess -= size
+
+    await db.execute(delete(DiffCacheEntry).where(DiffCacheEntry.key.in_(victims)))
+    await db.commit()
+    _counters["evictions"] += len(victims)
+    return len(victims)
+
+async def fetch_pr_diff(
+    db: AsyncSession,
+    repo: Repository,
+    pr_number: int,
+    token: Optional[str],
+    head_sha: Optional[str] = None,
+    base_ref: Optional[str] = None,
+) -> DiffDownload:
+    """
+    Unfiltered PR diff, read through the cache when the head SHA is known:
+    the diff viewer and the analysis pipeline share one download per commit.
+    Misses come from the local mirror (git_mirror) or else the GitHub API.
+    A diff is only cached under head_sha if it is known to be that commit's:
+    the mirror and the compare endpoint (with base_ref) diff head_sha itself,
+    but without base_ref the API serves whatever the PR's head is by then.
+    """
+    use_cache = settings.DIFF_CACHE_ENABLED and bool(head_sha)
+    if use_cache:
+        cached = await get(db, repo.id, head_sha, base_ref)
+        if cached:
+            print(f"DEBUG: Diff cache hit for repo {repo.id} @ {head_sha[:10]}")
+            return cached
+
+    full_name = get_real_repo_name(repo)
+    download = await git_mirror.pr_diff(full_name, pr_number, token, head_sha=head_sha, base_ref=base_ref)
+    exact = download is not None or bool(base_ref)
+    if download is None:
+        download = await stream_pr_diff(full_name, pr_number, token, head_sha=head_sha, base_ref=base_ref)
+    if use_cache and download.status_code == 200 and not exact:
+        # Still head_sha after the download, so (short of a push and force-push back) the download saw it too
+        metadata = await fetch_pr_metadata(full_name, pr_number, token)
+        exact = ((metadata or {}).get("head") or {}).get("sha") == head_sha
+        if not exact:
+            print(f"DEBUG: PR #{pr_number} head moved off {head_sha[:10]} during the download, not caching")
+    if use_cache and exact:
+        await put(db, repo.id, head_sha, base_ref, download)
+    return download
+
+def process_stats() -> dict:
+    return dict(_counters)
@@ -0,0 +1,165 @@
+import re
+from typing import List, Optional
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.services import http_clients
+from app.services.diff_filter import SkippedFile, classify_path
+
+_DIFF_GIT = re.compile(rb"^diff --git a/(.*) b/(.*)$")
+_DIFF_GIT_TEXT = re.compile(r"^diff --git a/(.*) b/(.*)$", re.MULTILINE)
+
+class DiffDownload(BaseModel):
+    status_code: int
+    text: str = "" # Diff (status 200) or the start of the error body
+    truncated: bool = False # Stopped at the byte budget; only whole files were kept
+    bytes_read: int = 0 # Bytes received from GitHub
+    skipped: List[SkippedFile] = [] # Files dropped by path rules while streaming
+
+def byte_budget() -> int:
+    """DIFF_MAX_BYTES, tightened by DIFF_MAX_TOKENS (estimated at ~3 bytes per Phi-3 token) when set."""
+    budget = settings.DIFF_MAX_BYTES
+    if settings.DIFF_MAX_TOKENS:
+        budget = min(budget, settings.DIFF_MAX_TOKENS * 3)
+    return budget
+
+class DiffCollector:
+    """
+    Accumulates a unified diff fed in byte chunks (HTTP body, `git diff` stdout)
+    into one buffer, never holding more than max_bytes of kept diff.
+    feed() returns False once the budget is exhausted; the caller stops reading
+    and finish() cuts the buffer back to the last file boundary (a single
+    oversized file is cut at a line boundary instead).
+    With apply_filters, files skipped by path rules (lockfiles, vendored,
+    generated, see diff_filter) are dropped as they stream past and reported.
+    """
+    def __init__(self, max_bytes: Optional[int] = None, repo_rules: Optional[List[str]] = None, apply_filters: bool = False):
+        self.max_bytes = max_bytes or byte_budget()
+        self.repo_rules = repo_rules
+        self.apply_filters = apply_filters
+        self.out = bytearray()
+        self.skipped: List[SkippedFile] = []
+        self.bytes_read = 0
+        self.truncated = False
+        self._file_start = 0 # Offset in out of the current file section
+        self._dropping = False # Current file section is being skipped
+        self._pending = b""
+
+    def _take(self, line: bytes, newline: bool = True) -> bool:
+        match = _DIFF_GIT.match(line.rstrip(b"\r"))
+        if match:
+            path = match.group(2).decode("utf-8", errors="replace")
+            reason = classify_path(path, self.repo_rules) if self.apply_filters else None
+            self._dropping = bool(reason)
+            if self._dropping:
+                self.skipped.append(SkippedFile(file=path, reason=reason))
+                return True
+            self._file_start = len(self.out)
+        if self._dropping:
+            return True
+        self.out.extend(line)
+        if newline:
+            self.out.extend(b"\n")
+        return len(self.out) <= self.max_bytes
+
+    def feed(self, chunk: bytes) -> bool:
+        self.bytes_read += len(chunk)
+        lines = (self._pending + chunk).split(b"\n")
+        self._pending = lines.pop()
+        for line in lines:
+            if not self._take(line):
+                self.truncated = True
+                return False
+        if len(self._pending) > 4096:
+            # One enormous line (minified bundle): bound it instead of growing the buffer
+            if self._dropping:
+                self._pending = self._pending[:4096] # Only needed to spot the next "diff --git"
+            elif len(self.out) + len(self._pending) > self.max_bytes:
+                self.truncated = True
+                return False
+        return True
+
+    def finish(self, status_code: int = 200) -> DiffDownload:
+        if self._pending and not self.truncated:
+            self.truncated = not self._take(self._pending, newline=False)
+        if self.truncated:
+            if self._file_start > 0:
+                del self.out[self._file_start:] # Drop the partial file
+            else:
+                del self.out[self.out.rfind(b"\n", 0, self.max_bytes) + 1:] # A single huge file: keep whole lines
+            print(f"DEBUG: Diff exceeded {self.max_bytes} bytes, kept {len(self.out)}")
+
+        # Decode once, straight from the buffer
+        return DiffDownload(
+            status_code=status_code,
+            text=str(memoryview(self.out), "utf-8", "replace"),
+            truncated=self.truncated,
+            bytes_read=self.bytes_read,
+            skipped=self.skipped,
+        )
+
+async def stream_pr_diff(
+    full_name: str,
+    pr_number: int,
+    token: Optional[str],
+    max_bytes: Optional[int] = None,
+    repo_rules: Optional[List[str]] = None,
+    apply_filters: bool = False,
+    head_sha: Optional[str] = None,
+    base_ref: Optional[str] = None,
+) -> DiffDownload:
+    """
+    Download a PR's unified diff from the GitHub API without holding more than
+    the budget in memory (see DiffCollector). Stops the download early once the
+    budget is reached.
+    With head_sha and base_ref, the compare endpoint is used instead, so the
+    diff is exactly that commit's even if the PR was pushed to since.
+    """
+    headers = {"Accept": "application/vnd.github.v3.diff"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    if head_sha and base_ref:
+        url = f"https://api.github.com/repos/{full_name}/compare/{base_ref}...{head_sha}"
+    else:
+        url = f"https://api.github.com/repos/{full_name}/pulls/{pr_number}"
+    collector = DiffCollector(max_bytes, repo_rules, apply_filters)
+
+    client = http_clients.github()
+    async with client.stream("GET", url, headers=headers, timeout=60) as response:
+        if response.status_code != 200:
+            body = await response.aread()
+            return DiffDownload(status_code=response.status_code, text=body[:500].decode("utf-8", errors="replace"))
+
+        async for chunk in response.aiter_bytes():
+            if not collector.feed(chunk):
+                break # Leaving the block closes the connection; the rest is never downloaded
+
+    return collector.finish()
+
+def apply_path_filters(download: DiffDownload, repo_rules: Optional[List[str]] = None) -> DiffDownload:
+    """
+    Drop files skipped by path rules from an already downloaded (e.g. cached)
+    diff. Works on the text's file boundaries: the diff is returned as is when
+    nothing is skipped, and otherwise copied once, into the result.
+    """
+    text = download.text
+    starts = [match.start() for match in _DIFF_GIT_TEXT.finditer(text)]
+    skipped: List[SkippedFile] = []
+    kept = [] # (start, end) of kept ranges, adjacent sections merged
+    for start, end in zip([0] + starts, starts + [len(text)]):
+        if start == end:
+            continue
+        match = _DIFF_GIT_TEXT.match(text, start)
+        reason = classify_path(match.group(2).rstrip("\r"), repo_rules) if match else None # None: preamble
+        if reason:
+            skipped.append(SkippedFile(file=match.group(2).rstrip("\r"), reason=reason))
+        elif kept and kept[-1][1] == start:
+            kept[-1] = (kept[-1][0], end)
+        else:
+            kept.append((start, end))
+    if not skipped:
+        return download
+    return download.model_copy(update={
+        "text": "".join(text[start:end] for start, end in kept),
+        "skipped": download.skipped + skipped,
+    })
@@ -0,0 +1,128 @@
+import posixpath
+from fnmatch import fnmatch
+from typing import List, Optional, Tuple
+from pydantic import BaseModel
+
+from app.services.diff_parser import FileDiff
+
+# (glob, reason). Globs without "/" match the file name anywhere in the tree,
+# others match the path from the repo root ("*" also crosses directories,
+# a leading "**/" lets the pattern start in any directory).
+DEFAULT_RULES: List[Tuple[str, str]] = [
+    # Lockfiles
+    ("package-lock.json", "lockfile"),
+    ("npm-shrinkwrap.json", "lockfile"),
+    ("yarn.lock", "lockfile"),
+    ("pnpm-lock.yaml", "lockfile"),
+    ("bun.lockb", "lockfile"),
+    ("poetry.lock", "lockfile"),
+    ("Pipfile.lock", "lockfile"),
+    ("uv.lock", "lockfile"),
+    ("Cargo.lock", "lockfile"),
+    ("Gemfile.lock", "lockfile"),
+    ("composer.lock", "lockfile"),
+    ("go.sum", "lockfile"),
+    # Vendored dependencies
+    ("**/vendor/*", "vendored"),
+    ("**/node_modules/*", "vendored"),
+    ("**/third_party/*", "vendored"),
+    ("**/bower_components/*", "vendored"),
+    # Generated / build output
+    ("*.min.js", "generated"),
+    ("*.min.css", "generated"),
+    ("*.map", "generated"),
+    ("*.pb.go", "generated"),
+    ("*_pb2.py", "generated"),
+    ("*_pb2_grpc.py", "generated"),
+    ("*.generated.*", "generated"),
+    ("*.snap", "generated"),
+    ("**/__snapshots__/*", "generated"),
+    ("**/dist/*", "generated"),
+    ("build/*", "generated"),
+    ("**/.next/*", "generated"),
+    ("*.ipynb", "generated"), # Mostly serialized outputs
+    # Binary assets GitHub may still render as text hunks
+    ("*.svg", "binary"),
+    ("*.pdf", "binary"),
+]
+
+_GENERATED_MARKERS = ("@generated", "DO NOT EDIT", "Code generated by", "auto-generated", "autogenerated")
+_MINIFIED_LINE_CHARS = 1000
+
+class SkippedFile(BaseModel):
+    file: str
+    reason: str # lockfile | vendored | generated | binary | repo rule
+
+def path_matches(path: str, pattern: str) -> bool:
+    """gitignore-style glob match (see DEFAULT_RULES)."""
+    pattern = pattern.strip().lstrip("/")
+    if "/" not in pattern:
+        return fnmatch(posixpath.basename(path), pattern)
+    if pattern.startswith("**/"):
+        pattern = pattern[3:]
+        return fnmatch(path, pattern) or fnmatch(path, "*/" + pattern)
+    return fnmatch(path, pattern)
+
+def _looks_generated(file: FileDiff) -> Optional[str]:
+    added = [line[1:] for hunk in file.hunks for line in hunk.lines if line.startswith("+")]
+    if any(len(line) > _MINIFIED_LINE_CHARS for line in added):
+        return "generated"
+    head = "\n".join(added[:5])
+    if any(marker in head for marker in _GENERATED_MARKERS):
+        return "generated"
+    return None
+
+def classify_path(path: str, repo_rules: Optional[List[str]] = None) -> Optional[str]:
+    """
+    Skip reason from the path alone (repo rules, then DEFAULT_RULES), "" if a
+    repo rule forces the file in, None if no rule applies.
+    repo_rules are extra globs; "!glob" re-includes files a default rule would skip.
+    """
+    repo_rules = repo_rules or []
+    if any(rule.startswith("!") and path_matches(path, rule[1:]) for rule in repo_rules):
+        return ""
+    if any(not rule.startswith("!") and path_matches(path, rule) for rule in repo_rules):
+        return "repo rule"
+    for pattern, reason in DEFAULT_RULES:
+        if path_matches(path, pattern):
+            return reason
+    return None
+
+def classify(file: FileDiff, repo_rules: Optional[List[str]] = None) -> Optional[str]:
+    """Reason to leave a file out of the review, or None to review it."""
+    if file.is_binary:
+        return "binary"
+    reason = classify_path(file.path, repo_rules)
+    if reason is not None:
+        return reason or None
+    if file.is_deleted:
+        return None # Deleted code is worth a look even if it was generated
+    return _looks_generated(file)
+
+def filter_files(files: List[FileDiff], repo_rules: Optional[List[str]] = None) -> Tuple[List[FileDiff], List[SkippedFile]]:
+    """Split parsed diff files into (to review, skipped)."""
+    kept, skipped = [], []
+    for file in files:
+        reason = classify(file, repo_rules)
+        if reason:
+            skipped.append(SkippedFile(file=file.path, reason=reason))
+        else:
+            kept.append(file)
+    return kept, skipped
+
+def nothing_to_review_result(skipped: List[dict]) -> dict:
+    """Result for a PR with nothing left to review after filtering and minimizing; no LLM call is made."""
+    reasons = sorted({entry["reason"] for entry in skipped})
+    if reasons:
+        summary = f"Only {', '.join(reasons)} files changed ({len(skipped)} skipped); nothing to review."
+    else:
+        summary = "Only whitespace, renames or moved code changed; nothing to review."
+    return {
+        "summary": summary,
+        "security_score": 100,
+        "performance_score": 100,
+        "reliability_score": 100,
+        "maintainability_score": 100,
+        "merge_confidence": 100,
+        "issues": [],
+    }
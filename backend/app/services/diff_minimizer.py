@@ -0,0 +1,233 @@
+import re
+from typing import Dict, List, Optional, Tuple
+from pydantic import BaseModel
+
+from app.services.diff_parser import FileDiff, Hunk
+
+_HUNK = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@ ?(.*)$")
+
+MIN_MOVED_LINES = 4
+# Languages where leading whitespace is syntax; only trailing/inner whitespace is ignored there
+_INDENT_SENSITIVE = re.compile(r"\.(py|pyi|yaml|yml|coffee|haml|slim|pug|nim)$|(^|/)Makefile$", re.IGNORECASE)
+
+class MinimizeStats(BaseModel):
+    whitespace_folded: int = 0 # Changed lines turned into context (whitespace-only edits)
+    hunks_folded: int = 0 # Hunks dropped because nothing but whitespace changed
+    moved_blocks: int = 0
+    moved_lines: int = 0
+    renames: int = 0 # Pure renames reduced to a note
+
+class MinimizeResult(BaseModel):
+    files: List[FileDiff]
+    notes: List[str] = [] # One-line notes for what was removed (renames, moves)
+    stats: MinimizeStats = MinimizeStats()
+
+class _Line(BaseModel):
+    kind: str # " ", "+", "-", "\\"
+    text: str # Without the kind prefix
+    old_no: int
+    new_no: int
+    elided: bool = False # Moved code, replaced by a note
+
+def _normalize(path: str, text: str) -> str:
+    """Line with whitespace removed, like `git diff -w`, but keeping indentation where it is syntax."""
+    if _INDENT_SENSITIVE.search(path):
+        stripped = text.lstrip()
+        return text[:len(text) - len(stripped)] + "".join(stripped.split())
+    return "".join(text.split())
+
+def _numbered(hunk: Hunk) -> Tuple[List[_Line], str]:
+    match = _HUNK.match(hunk.header)
+    old_no, new_no = (int(match.group(1)), int(match.group(3))) if match else (0, 0)
+    section = match.group(5) if match else ""
+    lines = []
+    for raw in hunk.lines:
+        kind, text = (raw[:1] or " "), raw[1:]
+        lines.append(_Line(kind=kind if kind in "+-\\" else " ", text=text, old_no=old_no, new_no=new_no))
+        if kind == "+":
+            new_no += 1
+        elif kind == "-":
+            old_no += 1
+        elif kind != "\\":
+            old_no += 1
+            new_no += 1
+    return lines, section
+
+def _runs(lines: List[_Line]) -> List[Tuple[int, int, int]]:
+    """(start, end_of_dels, end) of each change run: consecutive "-" lines followed by "+" lines."""
+    runs = []
+    i = 0
+    while i < len(lines):
+        if lines[i].kind not in "+-":
+            i += 1
+            continue
+        start = i
+        while i < len(lines) and lines[i].kind in ("-", "\\"):
+            i += 1
+        mid = i
+        while i < len(lines) and lines[i].kind in ("+", "\\"):
+            i += 1
+        runs.append((start, mid, i))
+    return runs
+
+def _fold_whitespace(path: str, lines: List[_Line]) -> Tuple[List[_Line], int]:
+    """Turn change runs that differ only in whitespace into context lines (new text)."""
+    out: List[_Line] = []
+    folded = 0
+    cursor = 0
+    for start, mid, end in _runs(lines):
+        out.extend(lines[cursor:start])
+        removed = [l for l in lines[start:mid] if l.kind == "-"]
+        added = [l for l in lines[mid:end] if l.kind == "+"]
+        if removed and len(removed) == len(added) and \
+                [_normalize(path, l.text) for l in removed] == [_normalize(path, l.text) for l in added]:
+            out.extend(
+                _Line(kind=" ", text=a.text, old_no=r.old_no, new_no=a.new_no)
+                for r, a in zip(removed, added)
+            )
+            folded += len(removed) + len(added)
+        else:
+            out.extend(lines[start:end])
+        cursor = end
+    out.extend(lines[cursor:])
+    return out, folded
+
+def _context_for(changed: int) -> int:
+    """Adaptive context: small edits need surroundings to be understood, big ones carry their own."""
+    if changed <= 4:
+        return 3
+    if changed <= 20:
+        return 2
+    return 1
+
+def _emit(lines: List[_Line], section: str) -> List[Hunk]:
+    """Re-cut numbered lines into hunks with adaptive context and exact headers; elided lines split hunks."""
+    changed = sum(1 for l in lines if l.kind in "+-" and not l.elided)
+    if not changed:
+        return []
+    context = _context_for(changed)
+
+    visible = [False] * len(lines)
+    for i, line in enumerate(lines):
+        if line.kind in "+-" and not line.elided:
+            for j in range(max(0, i - context), min(len(lines), i + context + 1)):
+                visible[j] = True
+    for i, line in enumerate(lines):
+        if line.elided:
+            visible[i] = False
+        elif line.kind == "\\":
+            visible[i] = i > 0 and visible[i - 1]
+
+    hunks: List[Hunk] = []
+    group: List[_Line] = []
+    for i, line in enumerate(lines + [None]):
+        if line is not None and visible[i]:
+            group.append(line)
+            continue
+        if group and any(l.kind in "+-" for l in group):
+            old_count = sum(1 for l in group if l.kind in " -")
+            new_count = sum(1 for l in group if l.kind in " +")
+            old_start = group[0].old_no - (1 if old_count == 0 else 0)
+            new_start = group[0].new_no - (1 if new_count == 0 else 0)
+            header = f"@@ -{old_start},{old_count} +{new_start},{new_count} @@"
+            hunks.append(Hunk(
+                header=f"{header} {section}" if section else header,
+                lines=[l.kind + l.text for l in group],
+            ))
+        group = []
+    return hunks
+
+def _find_moves(path_lines: Dict[str, List[List[_Line]]]) -> List[Tuple[str, str, int]]:
+    """
+    Mark removed blocks that reappear verbatim (modulo whitespace) as an added
+    block elsewhere in the diff. Returns (from_path, to_path, lines) per move.
+    """
+    removed: Dict[str, Tuple[str, List[_Line]]] = {}
+    added: List[Tuple[str, str, List[_Line]]] = []
+    for path, hunks in path_lines.items():
+        for lines in hunks:
+            for start, mid, end in _runs(lines):
+                dels = [l for l in lines[start:mid] if l.kind == "-"]
+                adds = [l for l in lines[mid:end] if l.kind == "+"]
+                for block, sink in ((dels, "-"), (adds, "+")):
+                    texts = [_normalize(path, l.text).strip() for l in block]
+                    if sum(1 for t in texts if t) < MIN_MOVED_LINES:
+                        continue
+                    key = "\n".join(t for t in texts if t)
+                    if sink == "-":
+                        removed.setdefault(key, (path, block))
+                    else:
+                        added.append((key, path, block))
+
+    moves = []
+    for key, to_path, block in added:
+        match = removed.pop(key, None)
+        if not match:
+            continue
+        from_path, source = match
+        for line in source + block:
+            line.elided = True
+        moves.append((from_path, to_path, len(block)))
+    return moves
+
+def minimize(files: List[FileDiff]) -> MinimizeResult:
+    """
+    Shrink a parsed diff before it is sent to the LLM:
+    whitespace-only edits become context (hunks with nothing else are dropped),
+    pure renames and code moved verbatim become one-line notes, and context is
+    trimmed to 1-3 lines depending on the size of the change.
+    """
+    stats = MinimizeStats()
+    notes: List[str] = []
+
+    numbered: Dict[str, List[List[_Line]]] = {}
+    sections: Dict[str, List[str]] = {}
+    for file in files:
+        hunks, secs = [], []
+        for hunk in file.hunks:
+            lines, section = _numbered(hunk)
+            lines, folded = _fold_whitespace(file.path, lines)
+            stats.whitespace_folded += folded
+            if not any(l.kind in "+-" for l in lines):
+                stats.hunks_folded += 1
+                continue
+            hunks.append(lines)
+            secs.append(section)
+        numbered[file.path] = hunks
+        sections[file.path] = secs
+
+    for from_path, to_path, count in _find_moves(numbered):
+        stats.moved_blocks += 1
+        stats.moved_lines += count
+        if from_path == to_path:
+            notes.append(f"Moved {count} unchanged lines within {from_path}")
+        else:
+            notes.append(f"Moved {count} unchanged lines from {from_path} to {to_path}")
+
+    result: List[FileDiff] = []
+    for file in files:
+        if file.is_rename and not file.hunks:
+            stats.renames += 1
+            notes.append(f"Renamed {file.old_path} to {file.path} (no content change)")
+            continue
+        hunks = [
+            hunk
+            for lines, section in zip(numbered[file.path], sections[file.path])
+            for hunk in _emit(lines, section)
+        ]
+        if file.hunks and not hunks:
+            if file.is_rename:
+                stats.renames += 1
+                notes.append(f"Renamed {file.old_path} to {file.path} (whitespace/moved lines only)")
+            continue # Nothing left worth reviewing
+        result.append(file.model_copy(update={"hunks": hunks}))
+    return MinimizeResult(files=result, notes=notes, stats=stats)
+
+def notes_text(notes: List[str], limit: int = 10) -> Optional[str]:
+    """Notes block appended to the PR context so the model still knows about folded changes."""
+    if not notes:
+        return None
+    lines = [f"- {note}" for note in notes[:limit]]
+    if len(notes) > limit:
+        lines.append(f"- ...and {len(notes) - limit} more")
+    return "Changes not shown:\n" + "\n".join(lines)
@@ -0,0 +1,105 @@
+import re
+from typing import List, Optional
+from pydantic import BaseModel
+
+_DIFF_GIT = re.compile(r"^diff --git a/(.*) b/(.*)$")
+_INDEX = re.compile(r"^index ([0-9a-f]+)\.\.([0-9a-f]+)")
+_HUNK = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+class Hunk(BaseModel):
+    header: str # "@@ -a,b +c,d @@ optional section"
+    lines: List[str] = [] # " context", "+added", "-removed", "\ No newline at end of file"
+
+    @property
+    def old_start(self) -> int:
+        match = _HUNK.match(self.header)
+        return int(match.group(1)) if match else 0
+
+    @property
+    def new_start(self) -> int:
+        match = _HUNK.match(self.header)
+        return int(match.group(3)) if match else 0
+
+    @property
+    def added(self) -> List[str]:
+        return [line[1:] for line in self.lines if line.startswith("+")]
+
+    @property
+    def removed(self) -> List[str]:
+        return [line[1:] for line in self.lines if line.startswith("-")]
+
+    @property
+    def changed_count(self) -> int:
+        return sum(1 for line in self.lines if line[:1] in ("+", "-"))
+
+    def render(self) -> str:
+        return "\n".join([self.header, *self.lines])
+
+class FileDiff(BaseModel):
+    """One file section of a unified git diff."""
+    path: str
+    old_path: str
+    header: List[str] = [] # "diff --git", "index", mode and "---"/"+++" lines
+    hunks: List[Hunk] = []
+    base_blob: Optional[str] = None
+    head_blob: Optional[str] = None
+    is_binary: bool = False
+    is_new: bool = False
+    is_deleted: bool = False
+    is_rename: bool = False
+
+    @property
+    def changed_count(self) -> int:
+        return sum(hunk.changed_count for hunk in self.hunks)
+
+    def render(self) -> str:
+        return "\n".join([*self.header, *(hunk.render() for hunk in self.hunks)])
+
+def parse_diff(diff_content: str) -> List[FileDiff]:
+    """
+    Split a `git diff` / GitHub .diff into files and hunks.
+    Text before the first "diff --git" line (if any) is ignored.
+    """
+    files: List[FileDiff] = []
+    current: Optional[FileDiff] = None
+    hunk: Optional[Hunk] = None
+
+    for line in diff_content.splitlines():
+        match = _DIFF_GIT.match(line)
+        if match:
+            current = FileDiff(old_path=match.group(1), path=match.group(2), header=[line])
+            files.append(current)
+            hunk = None
+            continue
+        if current is None:
+            continue
+
+        if line.startswith("@@"):
+            hunk = Hunk(header=line)
+            current.hunks.append(hunk)
+            continue
+
+        if hunk is not None:
+            hunk.lines.append(line)
+            continue
+
+        current.header.append(line)
+        index = _INDEX.match(line)
+        if index:
+            current.base_blob, current.head_blob = index.group(1), index.group(2)
+        elif line.startswith("new file mode"):
+            current.is_new = True
+        elif line.startswith("deleted file mode"):
+            current.is_deleted = True
+        elif line.startswith("rename from "):
+            current.is_rename = True
+            current.old_path = line[len("rename from "):]
+        elif line.startswith("rename to "):
+            current.path = line[len("rename to "):]
+        elif line.startswith("Binary files ") or line == "GIT binary patch":
+            current.is_binary = True
+
+    return files
+
+def render_diff(files: List[FileDiff]) -> str:
+    return "\n".join(f.render() for f in files)
@@ -0,0 +1,146 @@
+import hashlib
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+from app.models.file_review import FileReview
+from app.services.ai_service import MODEL_ID, PROMPT_VERSION, is_fallback_result
+from app.services import git_mirror
+from app.services.diff_parser import FileDiff
+
+SCORE_FIELDS = (
+    "security_score",
+    "performance_score",
+    "reliability_score",
+    "maintainability_score",
+    "merge_confidence",
+)
+
+def review_key(file: FileDiff, repo_id: int, model_id: str = MODEL_ID) -> Optional[str]:
+    """
+    Memo key for a file's change in one repository; None when the diff has no
+    blob SHAs to key on. Abbreviated SHAs the mirror couldn't expand (see
+    expand_blobs) key separately from full ones rather than being truncated:
+    a short prefix is only unique within one repository's objects.
+    """
+    if not file.base_blob or not file.head_blob:
+        return None
+    raw = f"{repo_id}\0{file.path}\0{file.base_blob}\0{file.head_blob}\0{PROMPT_VERSION}\0{model_id}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+def _full_sha(sha: str, expanded: Dict[str, str]) -> str:
+    if sha and set(sha) == {"0"}:
+        return "0" * 40 # Added / deleted file
+    return expanded.get(sha, sha)
+
+async def expand_blobs(full_name: str, files: List[FileDiff]) -> List[FileDiff]:
+    """Files with their abbreviated blob SHAs (diff API) replaced by full ones from the mirror, where it has them."""
+    expanded = await git_mirror.expand_blobs(
+        full_name, [sha for f in files for sha in (f.base_blob, f.head_blob) if sha and set(sha) != {"0"}]
+    )
+    return [
+        f.model_copy(update={"base_blob": _full_sha(f.base_blob, expanded), "head_blob": _full_sha(f.head_blob, expanded)})
+        if f.base_blob and f.head_blob else f
+        for f in files
+    ]
+
+async def get_many(db: AsyncSession, files: List[FileDiff], repo_id: int, model_id: str = MODEL_ID) -> Dict[str, dict]:
+    """Memoized reviews for the given files, by review_key."""
+    keys = [key for key in (review_key(f, repo_id, model_id) for f in files) if key]
+    if not keys:
+        return {}
+    result = await db.execute(select(FileReview).where(FileReview.key.in_(keys)))
+    return {entry.key: dict(entry.result) for entry in result.scalars().all()}
+
+async def put(db: AsyncSession, file: FileDiff, result: dict, repo_id: int, model_id: str = MODEL_ID):
+    """Memoize a file review. Caller commits."""
+    key = review_key(file, repo_id, model_id)
+    if not key or is_fallback_result(result):
+        return
+    await db.merge(FileReview(
+        key=key,
+        path=file.path,
+        base_blob=file.base_blob,
+        head_blob=file.head_blob,
+        prompt_version=PROMPT_VERSION,
+        changed_lines=file.changed_count,
+        result=result,
+    ))
+
+def _weighted_scores(items: List[Tuple[dict, int]]) -> dict:
+    """Score fields averaged over (result, weight) pairs; fields nobody reported are left out."""
+    scores = {}
+    for field in SCORE_FIELDS:
+        values = [
+            (result[field], max(weight, 1))
+            for result, weight in items
+            if isinstance(result.get(field), (int, float))
+        ]
+        if values:
+            mean = sum(v * w for v, w in values) / sum(w for _, w in values)
+            scores[field] = round(mean) if all(isinstance(v, int) for v, _ in values) else round(mean, 2)
+    return scores
+
+def split_chunk_result(paths: List[str], result: dict) -> Dict[str, dict]:
+    """
+    Attribute one LLM result covering several files to each file.
+    Issues go to the file they name (the service is asked for a "file" field);
+    unattributed issues go to the first file. Scores apply to every file in the chunk.
+    """
+    unique = list(dict.fromkeys(paths))
+    scores = {field: result[field] for field in SCORE_FIELDS if field in result}
+    per_file = {
+        path: {**scores, "summary": result.get("summary", ""), "issues": []}
+        for path in unique
+    }
+    for issue in result.get("issues") or []:
+        if not isinstance(issue, dict):
+            continue
+        named = str(issue.get("file") or issue.get("location") or "")
+        target = next(
+            (path for path in unique if named and (named == path or named.endswith("/" + path) or path.endswith("/" + named))),
+            unique[0],
+        )
+        per_file[target]["issues"].append(issue)
+    return per_file
+
+def combine_parts(parts: List[Tuple[dict, int]]) -> dict:
+    """Merge results for the parts of one file that was split across chunks."""
+    if len(parts) == 1:
+        return parts[0][0]
+    summaries = list(dict.fromkeys(r.get("summary", "") for r, _ in parts if r.get("summary")))
+    return {
+        **_weighted_scores(parts),
+        "summary": " ".join(summaries),
+        "issues": [issue for r, _ in parts for issue in r.get("issues") or []],
+    }
+
+def merge_results(reviews: List[Tuple[FileDiff, dict, bool]]) -> dict:
+    """
+    Combine per-file results (file, result, reused) into the single
+    raw_llm_output shape the frontend reads. Scores are averaged weighted by
+    changed lines; issues are concatenated and tagged with their file.
+    """
+    merged: dict = {"issues": []}
+    merged.update(_weighted_scores([(result, file.changed_count) for file, result, _ in reviews]))
+
+    for file, result, _ in reviews:
+        for issue in result.get("issues") or []:
+            if not isinstance(issue, dict):
+                continue
+            issue = dict(issue)
+            issue.setdefault("file", file.path)
+            if not issue.get("location") or issue.get("location") == "System":
+                issue["location"] = file.path
+            merged["issues"].append(issue)
+
+    reused = sum(1 for _, _, was_reused in reviews if was_reused)
+    if len(reviews) == 1:
+        merged["summary"] = reviews[0][1].get("summary", "")
+    else:
+        lines = [f"Reviewed {len(reviews)} files ({reused} unchanged since an earlier review)."]
+        lines += [f"- {file.path}: {result.get('summary', '')}" for file, result, _ in reviews]
+        merged["summary"] = "\n".join(lines)
+
+    merged["file_reviews"] = {"reviewed": len(reviews) - reused, "reused": reused}
+    return merged
@@ -0,0 +1,224 @@
+import asyncio
+import base64
+import os
+import shutil
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.diff_download import DiffCollector, DiffDownload
+
+# Bare mirrors (`git clone --mirror`) of active repositories, kept current with
+# `git fetch`. A mirror also carries GitHub's refs/pull/<n>/head refs, so PR
+# diffs are computed locally instead of downloaded from the diff API.
+# Every function returns None/False when the mirror can't answer; callers then
+# fall back to the API.
+
+_READ_CHUNK = 64 * 1024
+
+_locks: Dict[str, asyncio.Lock] = {}
+
+def enabled() -> bool:
+    return bool(settings.GIT_MIRROR_DIR) and shutil.which("git") is not None
+
+def mirror_path(full_name: str) -> str:
+    owner, _, name = full_name.partition("/")
+    return os.path.join(settings.GIT_MIRROR_DIR, owner, f"{name}.git")
+
+def remote_url(full_name: str) -> str:
+    return settings.GIT_MIRROR_REMOTE_TEMPLATE.format(full_name=full_name)
+
+def _lock(full_name: str) -> asyncio.Lock:
+    if full_name not in _locks:
+        _locks[full_name] = asyncio.Lock()
+    return _locks[full_name]
+
+def _auth_env(full_name: str, token: Optional[str]) -> Dict[str, str]:
+    """
+    Token as an http.extraHeader passed in git's environment (GIT_CONFIG_*):
+    never written to the mirror's config, and not on the command line, so
+    `ps` doesn't show it.
+    """
+    if not token or not remote_url(full_name).startswith("https://"):
+        return {}
+    basic = base64.b64encode(f"x-access-token:{token}".encode()).decode()
+    return {
+        "GIT_CONFIG_COUNT": "1",
+        "GIT_CONFIG_KEY_0": "http.extraHeader",
+        "GIT_CONFIG_VALUE_0": f"Authorization: Basic {basic}",
+    }
+
+async def _git(*args: str, cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None) -> Tuple[int, str]:
+    """Run git, return (exit code, stderr). Output is discarded."""
+    process = await asyncio.create_subprocess_exec(
+        "git", *args,
+        cwd=cwd,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+        env={**os.environ, "GIT_TERMINAL_PROMPT": "0", **(env or {})},
+    )
+    try:
+        _, stderr = await asyncio.wait_for(process.communicate(), timeout=settings.GIT_MIRROR_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        return -1, "timed out"
+    return process.returncode, stderr.decode("utf-8", errors="replace").strip()
+
+async def _clone(full_name: str, token: Optional[str]) -> bool:
+    path = mirror_path(full_name)
+    # Clone next to the final path and rename, so a half-finished clone is never used
+    staging = f"{path}.tmp-{uuid.uuid4().hex[:8]}"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    code, error = await _git(
+        "clone", "--mirror", "--quiet", remote_url(full_name), staging, env=_auth_env(full_name, token)
+    )
+    if code != 0:
+        print(f"DEBUG: Mirror clone of {full_name} failed: {error[:300]}")
+        shutil.rmtree(staging, ignore_errors=True)
+        return False
+    try:
+        os.rename(staging, path)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True) # Another process got there first
+    return True
+
+async def _fetch(full_name: str, token: Optional[str]) -> bool:
+    code, error = await _git(
+        "fetch", "--prune", "--quiet", remote_url(full_name), "+refs/*:refs/*",
+        cwd=mirror_path(full_name), env=_auth_env(full_name, token),
+    )
+    if code != 0:
+        print(f"DEBUG: Mirror fetch of {full_name} failed: {error[:300]}")
+    return code == 0
+
+def _last_fetch(full_name: str) -> float:
+    """mtime of FETCH_HEAD (or of the clone); shared by the API and every worker on this disk."""
+    path = mirror_path(full_name)
+    for candidate in (os.path.join(path, "FETCH_HEAD"), path):
+        try:
+            return os.path.getmtime(candidate)
+        except OSError:
+            continue
+    return 0.0
+
+async def sync(full_name: str, token: Optional[str], force: bool = False) -> bool:
+    """
+    Clone the mirror if it is missing, otherwise fetch unless it was fetched
+    less than GIT_MIRROR_REFRESH_SECONDS ago (or force).
+    """
+    if not enabled():
+        return False
+    async with _lock(full_name):
+        if not os.path.isdir(mirror_path(full_name)):
+            return await _clone(full_name, token)
+        if not force and time.time() - _last_fetch(full_name) < settings.GIT_MIRROR_REFRESH_SECONDS:
+            return True
+        return await _fetch(full_name, token)
+
+async def _has_commit(full_name: str, rev: str) -> bool:
+    code, _ = await _git("cat-file", "-e", f"{rev}^{{commit}}", cwd=mirror_path(full_name))
+    return code == 0
+
+async def _resolve(full_name: str, token: Optional[str], revs: List[str]) -> bool:
+    """True once every rev exists in the mirror, fetching once if one is missing (new push)."""
+    missing = [rev for rev in revs if not await _has_commit(full_name, rev)]
+    if not missing:
+        return True
+    async with _lock(full_name):
+        if not await _fetch(full_name, token):
+            return False
+    return all([await _has_commit(full_name, rev) for rev in missing])
+
+async def expand_blobs(full_name: str, shas: List[str]) -> Dict[str, str]:
+    """
+    Full 40-character SHAs for abbreviated blob SHAs (as in diff API index
+    lines), looked up in the mirror. SHAs the mirror can't resolve uniquely
+    are left out; so is everything when there is no mirror.
+    """
+    abbreviated = list(dict.fromkeys(sha for sha in shas if sha and len(sha) < 40))
+    if not abbreviated or not enabled() or not os.path.isdir(mirror_path(full_name)):
+        return {}
+    process = await asyncio.create_subprocess_exec(
+        "git", "cat-file", "--batch-check=%(objectname) %(objecttype)",
+        cwd=mirror_path(full_name),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        stdout, _ = await asyncio.wait_for(
+            process.communicate("\n".join(abbreviated).encode() + b"\n"), timeout=settings.GIT_MIRROR_TIMEOUT_SECONDS
+        )
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        return {}
+    expanded = {}
+    # One output line per input line, in order: "<sha> blob", or "<input> missing/ambiguous"
+    for sha, line in zip(abbreviated, stdout.decode("utf-8", errors="replace").splitlines()):
+        full, _, kind = line.partition(" ")
+        if kind == "blob" and full.startswith(sha):
+            expanded[sha] = full
+    return expanded
+
+async def pr_diff(
+    full_name: str,
+    pr_number: int,
+    token: Optional[str],
+    head_sha: Optional[str] = None,
+    base_ref: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+    repo_rules: Optional[List[str]] = None,
+    apply_filters: bool = False,
+) -> Optional[DiffDownload]:
+    """
+    The PR diff computed from the local mirror: `git diff base...head`, which
+    is what GitHub's diff API returns (changes since the merge base). Output is
+    streamed through the same DiffCollector as the API download, so budget and
+    path filters behave identically; --full-index puts full blob SHAs in the
+    "index" lines for the per-file memo.
+
+    Returns None (caller uses the API) if mirrors are disabled, this repo has
+    no mirror yet, or the commits can't be found.
+    """
+    if not enabled() or not os.path.isdir(mirror_path(full_name)):
+        return None
+    head = head_sha or f"refs/pull/{pr_number}/head"
+    base = f"refs/heads/{base_ref}" if base_ref else "HEAD"
+    if not await _resolve(full_name, token, [base, head]):
+        print(f"DEBUG: Mirror of {full_name} has no {base}...{head}, falling back to the API")
+        return None
+
+    collector = DiffCollector(max_bytes, repo_rules, apply_filters)
+    process = await asyncio.create_subprocess_exec(
+        "git", "diff", "--no-color", "--no-ext-diff", "--full-index", "-M",
+        "--src-prefix=a/", "--dst-prefix=b/", f"{base}...{head}",
+        cwd=mirror_path(full_name),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    stopped = False
+    try:
+        while True:
+            chunk = await process.stdout.read(_READ_CHUNK)
+            if not chunk:
+                break
+            if not collector.feed(chunk):
+                stopped = True
+                if process.returncode is None:
+                    process.kill() # Over budget: git stops producing the rest
+                break
+    except BaseException:
+        if process.returncode is None:
+            process.kill() # Cancelled (superseded job): don't leave git running
+        await process.wait()
+        raise
+    await process.wait()
+
+    if not stopped and process.returncode != 0:
+        print(f"DEBUG: git diff failed for {full_name} PR #{pr_number} (exit {process.returncode})")
+        return None
+    print(f"DEBUG: Diff for {full_name} PR #{pr_number} computed from the local mirror")
+    return collector.finish()
@@ -0,0 +1,273 @@
+import hashlib
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+import httpx
+from pydantic import BaseModel
+from sqlalchemy import delete, update
+from sqlmodel import select, func
+
+from app.core.config import settings
+from app.models.github_cache import GitHubResponseCacheEntry
+
+# Conditional requests for the GitHub REST API. Every cacheable GET is sent
+# with the stored validator (If-None-Match / If-Modified-Since); a 304 costs
+# no rate limit and is answered from the stored body. Entries live in a
+# per-process LRU (GITHUB_CACHE_MAX_BYTES) backed by an optional database tier
+# (GITHUB_CACHE_PERSIST) so restarts keep their validators.
+# Plugged into http_clients.github() as a transport, so callers don't change.
+
+# Kept with the body: what the caller needs to decode and paginate it
+_STORED_HEADERS = ("content-type", "content-encoding", "link")
+
+_counters = {"revalidated": 0, "stale": 0, "misses": 0, "stores": 0, "evictions": 0, "persisted_loads": 0}
+
+class CachedResponse(BaseModel):
+    url: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    headers: Dict[str, str] = {}
+    body: bytes
+
+    @property
+    def size(self) -> int:
+        return len(self.body)
+
+_memory: "OrderedDict[str, CachedResponse]" = OrderedDict()
+_memory_bytes = 0
+_persist_retry_at = 0.0 # Database tier is skipped until then after an error
+# Database tier bookkeeping: rows written since the last measurement are added
+# to _persisted_bytes, and the table is only summed and evicted once that
+# crosses GITHUB_CACHE_PERSIST_MAX_BYTES (or by maintain()). last_used_at is
+# written in batches of the keys touched since the last flush.
+_persisted_bytes: Optional[int] = None # Unknown until first measured
+_touched: Set[str] = set()
+_touches_flushed_at = 0.0
+
+def cache_key(request: httpx.Request) -> str:
+    # Token and Accept both change the body (GitHub answers with Vary: Accept, Authorization)
+    parts = (request.headers.get("authorization", ""), request.headers.get("accept", ""), str(request.url))
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+def is_cacheable(request: httpx.Request) -> bool:
+    if not settings.GITHUB_CACHE_ENABLED or request.method != "GET":
+        return False
+    if request.url.host != "api.github.com":
+        return False
+    if "if-none-match" in request.headers or "if-modified-since" in request.headers:
+        return False # Caller does its own revalidation
+    accept = request.headers.get("accept", "")
+    return "diff" not in accept and "patch" not in accept # Diffs are streamed and cached by head SHA (diff_cache)
+
+def _remember(key: str, entry: CachedResponse):
+    global _memory_bytes
+    old = _memory.pop(key, None)
+    if old:
+        _memory_bytes -= old.size
+    if entry.size > settings.GITHUB_CACHE_MAX_BYTES // 8:
+        return # One huge listing must not flush everything else
+    _memory[key] = entry
+    _memory_bytes += entry.size
+    while _memory_bytes > settings.GITHUB_CACHE_MAX_BYTES and _memory:
+        _, victim = _memory.popitem(last=False)
+        _memory_bytes -= victim.size
+        _counters["evictions"] += 1
+
+def _persist_available() -> bool:
+    return settings.GITHUB_CACHE_PERSIST and time.monotonic() >= _persist_retry_at
+
+def _persist_failed(e: Exception):
+    global _persist_retry_at
+    _persist_retry_at = time.monotonic() + 60
+    print(f"DEBUG: GitHub cache database tier unavailable for 60s: {e}")
+
+async def _load(key: str) -> Optional[CachedResponse]:
+    entry = _memory.get(key)
+    if entry:
+        _memory.move_to_end(key)
+        await _touch(key)
+        return entry
+    if not _persist_available():
+        return None
+
+    from app.db.session import async_session
+    try:
+        async with async_session() as db:
+            row = await db.get(GitHubResponseCacheEntry, key)
+            if not row:
+                return None
+            entry = CachedResponse(
+                url=row.url, etag=row.etag, last_modified=row.last_modified, headers=row.headers or {}, body=row.body
+            )
+    except Exception as e:
+        _persist_failed(e)
+        return None
+    _counters["persisted_loads"] += 1
+    _remember(key, entry)
+    await _touch(key)
+    return entry
+
+async def _touch(key: str):
+    """Mark a key used; the database sees it with the next batch (GITHUB_CACHE_TOUCH_FLUSH_SECONDS)."""
+    if not _persist_available():
+        return
+    _touched.add(key)
+    if time.monotonic() - _touches_flushed_at >= settings.GITHUB_CACHE_TOUCH_FLUSH_SECONDS:
+        await _flush_touches()
+
+async def _flush_touches():
+    global _touches_flushed_at
+    _touches_flushed_at = time.monotonic()
+    if not _touched:
+        return
+    keys = list(_touched)
+    _touched.clear()
+    from app.db.session import async_session
+    try:
+        async with async_session() as db:
+            await db.execute(
+                update(GitHubResponseCacheEntry)
+                .where(GitHubResponseCacheEntry.key.in_(keys))
+                .values(last_used_at=datetime.utcnow())
+            )
+            await db.commit()
+    except Exception as e:
+        _persist_failed(e)
+
+async def _store(key: str, entry: CachedResponse):
+    global _persisted_bytes
+    _remember(key, entry)
+    _counters["stores"] += 1
+    if not _persist_available():
+        return
+
+    from app.db.session import async_session
+    try:
+        async with async_session() as db:
+            if _persisted_bytes is None:
+                _persisted_bytes = await _persisted_total(db)
+            await db.merge(GitHubResponseCacheEntry(
+                key=key,
+                url=entry.url,
+                etag=entry.etag,
+                last_modified=entry.last_modified,
+                headers=entry.headers,
+                body=entry.body,
+                size_bytes=entry.size,
+            ))
+            await db.commit()
+            # Overwrites count twice; that only brings the next real measurement forward
+            _persisted_bytes += entry.size
+            if _persisted_bytes > settings.GITHUB_CACHE_PERSIST_MAX_BYTES:
+                await _evict_persisted(db)
+    except Exception as e:
+        _persist_failed(e)
+
+async def _persisted_total(db) -> int:
+    return (await db.execute(
+        select(func.coalesce(func.sum(GitHubResponseCacheEntry.size_bytes), 0))
+    )).scalar_one()
+
+async def _evict_persisted(db) -> int:
+    """Drop least recently used rows until the total is under GITHUB_CACHE_PERSIST_MAX_BYTES."""
+    global _persisted_bytes
+    total = await _persisted_total(db)
+    _persisted_bytes = total
+    excess = total - settings.GITHUB_CACHE_PERSIST_MAX_BYTES
+    if excess <= 0:
+        return 0
+
+    victims = []
+    rows = await db.execute(
+        select(GitHubResponseCacheEntry.key, GitHubResponseCacheEntry.size_bytes)
+        .order_by(GitHubResponseCacheEntry.last_used_at)
+    )
+    for key, size in rows.all():
+        if excess <= 0:
+            break
+        victims.append(key)
+        excess -= size
+        _persisted_bytes -= size
+
+    await db.execute(delete(GitHubResponseCacheEntry).where(GitHubResponseCacheEntry.key.in_(victims)))
+    await db.commit()
+    _counters["evictions"] += len(victims)
+    return len(victims)
+
+async def maintain(db) -> int:
+    """
+    Periodic upkeep of the database tier (worker): writes pending last_used_at
+    touches and evicts down to GITHUB_CACHE_PERSIST_MAX_BYTES, covering rows
+    other processes added. Returns the number of rows evicted.
+    """
+    if not settings.GITHUB_CACHE_PERSIST:
+        return 0
+    await _flush_touches()
+    return await _evict_persisted(db)
+
+class ConditionalCacheTransport(httpx.AsyncBaseTransport):
+    """
+    Adds validators to cacheable GitHub GETs and turns a 304 back into the
+    stored 200, with the 304's fresh headers (rate limit, date) on top.
+    Responses served from the cache carry X-Prism-Cache: revalidated, or
+    stale when github_scheduler held the request back.
+    """
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if not is_cacheable(request):
+            return await self._transport.handle_async_request(request)
+
+        key = cache_key(request)
+        cached = await _load(key)
+        if cached:
+            if cached.etag:
+                request.headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                request.headers["If-Modified-Since"] = cached.last_modified
+
+        response = await self._transport.handle_async_request(request)
+
+        if response.status_code == 304 and cached:
+            await response.aclose()
+            _counters["revalidated"] += 1
+            headers = dict(cached.headers)
+            for name, value in response.headers.items():
+                if name.lower() not in ("content-length", "transfer-encoding"):
+                    headers[name] = value
+            headers["X-Prism-Cache"] = "revalidated"
+            return httpx.Response(200, headers=headers, content=cached.body, extensions=response.extensions)
+
+        if cached and response.headers.get("x-prism-rate-limited"):
+            # Held back by github_scheduler: a stale answer beats an error
+            _counters["stale"] += 1
+            return httpx.Response(200, headers={**cached.headers, "X-Prism-Cache": "stale"}, content=cached.body)
+
+        _counters["misses"] += 1
+        etag = response.headers.get("etag")
+        last_modified = response.headers.get("last-modified")
+        if response.status_code != 200 or not (etag or last_modified):
+            return response
+
+        # Read the (still encoded) body once, keep it, and hand the caller a copy
+        try:
+            raw = b"".join([part async for part in response.stream])
+        finally:
+            await response.aclose()
+        await _store(key, CachedResponse(
+            url=str(request.url),
+            etag=etag,
+            last_modified=last_modified,
+            headers={name: response.headers[name] for name in _STORED_HEADERS if name in response.headers},
+            body=raw,
+        ))
+        return httpx.Response(200, headers=response.headers, content=raw, extensions=response.extensions)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+def process_stats() -> dict:
+    return {**_counters, "memory_entries": len(_memory), "memory_bytes": _memory_bytes}
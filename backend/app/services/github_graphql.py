@@ -0,0 +1,143 @@
+import math
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.repository import Repository
+from app.services import http_clients
+from app.services.github_service import close_unlisted_pull_requests, upsert_pull_requests
+from app.utils.github import get_real_repo_name
+
+# Open-PR sync for many repositories at once through the GraphQL API: one
+# aliased query covers GITHUB_GRAPHQL_REPOS_PER_QUERY repositories and asks
+# only for the fields the PR list uses. A dashboard with N active repos costs
+# ceil(N / REPOS_PER_QUERY) calls (plus one per 100 extra PRs in a busy repo)
+# instead of N REST calls, and about one GraphQL point each.
+# GITHUB_GRAPHQL_URL can point at a local stub (python -m app.cli stub-github).
+
+# GitHub rejects queries that could return more nodes than this
+MAX_NODES_PER_QUERY = 500_000
+
+PR_FIELDS = """
+      totalCount
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        number title body url updatedAt
+        headRefOid baseRefOid baseRefName
+        author { login avatarUrl }
+      }"""
+
+def build_query(count: int, per_repo: int) -> str:
+    """Aliased query for `count` repositories: r<i> takes variables $o<i>, $n<i> and cursor $a<i>."""
+    params = ", ".join(f"$o{i}: String!, $n{i}: String!, $a{i}: String" for i in range(count))
+    parts = [
+        f"  r{i}: repository(owner: $o{i}, name: $n{i}) {{\n"
+        f"    pullRequests(states: OPEN, first: {per_repo}, after: $a{i}, orderBy: {{field: UPDATED_AT, direction: DESC}}) {{"
+        f"{PR_FIELDS}\n    }}\n  }}"
+        for i in range(count)
+    ]
+    return f"query({params}) {{\n" + "\n".join(parts) + "\n  rateLimit { cost remaining resetAt }\n}"
+
+def estimate_cost(count: int, per_repo: int) -> int:
+    """
+    GitHub's formula: one request per connection (each repository's
+    pullRequests), divided by 100, at least 1. Also checks the node limit.
+    """
+    if count * per_repo > MAX_NODES_PER_QUERY:
+        raise ValueError(f"{count} repositories x {per_repo} PRs exceeds the GraphQL node limit")
+    return max(1, math.ceil(count / 100))
+
+def to_rest(node: dict) -> dict:
+    """A GraphQL PR node in the REST shape upsert_pull_requests and update_pr_refs read."""
+    author = node.get("author") or {} # null for deleted accounts
+    return {
+        "number": node["number"],
+        "title": node["title"],
+        "body": node.get("body"),
+        "state": "open",
+        "html_url": node["url"],
+        "updated_at": node["updatedAt"],
+        "user": {"login": author.get("login") or "ghost", "avatar_url": author.get("avatarUrl")},
+        "head": {"sha": node.get("headRefOid")},
+        "base": {"sha": node.get("baseRefOid"), "ref": node.get("baseRefName")},
+    }
+
+async def _query(token: str, query: str, variables: dict) -> dict:
+    response = await http_clients.github().post(
+        settings.GITHUB_GRAPHQL_URL,
+        json={"query": query, "variables": variables},
+        headers={"Authorization": f"Bearer {token}"},
+        timeout=60,
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f"GraphQL request failed: {response.status_code} {response.text[:200]}")
+    return response.json()
+
+async def fetch_open_prs(
+    token: str, repos: List[Repository], per_repo: Optional[int] = None
+) -> Tuple[Dict[int, List[dict]], dict]:
+    """
+    Open PRs (REST-shaped) per repository id. Repositories with more open PRs
+    than per_repo are paged in follow-up queries together with each other.
+    Repositories GitHub can't resolve (renamed, no access) are left out, and
+    so are the rest once the GraphQL budget is below what the next query costs.
+    Returns the PRs and a report.
+    """
+    per_repo = min(per_repo or settings.GITHUB_GRAPHQL_PRS_PER_REPO, 100)
+    batch_size = max(1, settings.GITHUB_GRAPHQL_REPOS_PER_QUERY)
+    report = {"queries": 0, "cost": 0, "remaining": None, "failed": [], "deferred": []}
+    prs: Dict[int, List[dict]] = {}
+
+    # (repo, cursor): cursor None = first page
+    pending: List[Tuple[Repository, Optional[str]]] = [(repo, None) for repo in repos]
+    while pending:
+        batch, pending = pending[:batch_size], pending[batch_size:]
+        cost = estimate_cost(len(batch), per_repo)
+        if report["remaining"] is not None and report["remaining"] < cost:
+            report["deferred"] = sorted({repo.id for repo, _ in batch + pending})
+            print(f"DEBUG: GraphQL budget exhausted, {len(report['deferred'])} repos not synced")
+            break
+
+        variables = {}
+        for i, (repo, cursor) in enumerate(batch):
+            owner, _, name = get_real_repo_name(repo).partition("/")
+            variables.update({f"o{i}": owner, f"n{i}": name, f"a{i}": cursor})
+        payload = await _query(token, build_query(len(batch), per_repo), variables)
+        data = payload.get("data") or {}
+        report["queries"] += 1
+        rate = data.get("rateLimit") or {}
+        report["cost"] += rate.get("cost") or cost
+        report["remaining"] = rate.get("remaining", report["remaining"])
+
+        for i, (repo, _) in enumerate(batch):
+            connection = (data.get(f"r{i}") or {}).get("pullRequests")
+            if connection is None:
+                # Per-alias errors (NOT_FOUND, FORBIDDEN) come back next to the other aliases' data
+                report["failed"].append(repo.id)
+                prs.pop(repo.id, None)
+                continue
+            prs.setdefault(repo.id, []).extend(to_rest(node) for node in connection.get("nodes") or [])
+            page = connection.get("pageInfo") or {}
+            if page.get("hasNextPage"):
+                pending.append((repo, page.get("endCursor")))
+
+    for repo_id in report["deferred"]:
+        prs.pop(repo_id, None) # Incomplete listings would close PRs that are still open
+    return prs, report
+
+async def sync_open_prs(db: AsyncSession, repos: List[Repository], token: str) -> dict:
+    """
+    Refresh the open PRs of all given repositories (see fetch_open_prs) and
+    mark PRs that are no longer open as closed.
+    """
+    if not repos:
+        return {"repos": 0, "prs": 0, "queries": 0, "cost": 0, "failed": [], "deferred": []}
+    by_id = {repo.id: repo for repo in repos}
+    prs, report = await fetch_open_prs(token, repos)
+    written = 0
+    for repo_id, prs_data in prs.items():
+        written += await upsert_pull_requests(db, by_id[repo_id], prs_data)
+        await close_unlisted_pull_requests(db, by_id[repo_id], {pr_data["number"] for pr_data in prs_data})
+    print(f"DEBUG: GraphQL sync of {len(prs)} repos: {written} open PRs in {report['queries']} queries (cost {report['cost']})")
+    return {"repos": len(prs), "prs": written, **report}
@@ -0,0 +1,257 @@
+import asyncio
+import hashlib
+import json
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+from app.core.config import settings
+from app.services import scheduler
+
+# Rate-limit-aware pacing of every GitHub API call (a transport on
+# http_clients.github()). A budget per token and resource (core, graphql,
+# search) is kept from X-RateLimit-* response headers. Requests wait, in
+# priority order, when the budget left is reserved for more urgent work, when
+# the token is over its concurrency cap, or while GitHub asked us to back off
+# (secondary/abuse limits, Retry-After).
+# Priorities are the job classes from scheduler: interactive requests can
+# spend the whole budget; webhook and bulk work (syncs, analyze-all,
+# backfills) stop GITHUB_RATE_LIMIT_RESERVE earlier per class.
+
+current_priority: ContextVar[int] = ContextVar("github_priority", default=scheduler.PRIORITY_INTERACTIVE)
+
+@contextmanager
+def priority(value: int):
+    """GitHub calls made inside the block (and tasks started from it) use this priority."""
+    token = current_priority.set(value)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+def token_key(token: Optional[str]) -> str:
+    """Budgets are per token; only a hash is kept. Unauthenticated calls share the per-IP budget."""
+    if not token:
+        return "anonymous"
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+
+def _request_token(request: httpx.Request) -> Optional[str]:
+    header = request.headers.get("authorization")
+    return header.split()[-1] if header else None
+
+def _resource(request: httpx.Request) -> str:
+    path = request.url.path
+    if path.startswith("/graphql"):
+        return "graphql"
+    if path.startswith("/search"):
+        return "search"
+    return "core"
+
+class TokenBudget:
+    """What we know about one token's budget for one resource, plus its waiting requests."""
+    def __init__(self):
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None # Optimistically decremented per request sent
+        self.reset_at = 0.0 # Epoch seconds
+        self.blocked_until = 0.0 # Secondary limit / Retry-After
+        self.backoff = 0.0 # Next back-off without Retry-After (doubles, capped)
+        self.in_flight = 0
+        self.waiting: Dict[int, int] = {}
+        self.condition = asyncio.Condition()
+
+    def delay(self, priority: int) -> Optional[float]:
+        """0 if a request of this priority may go now, else seconds to wait (None: until woken)."""
+        now = time.time()
+        if self.blocked_until > now:
+            return self.blocked_until - now
+        if self.reset_at and self.reset_at <= now:
+            self.remaining = None # New window; the next response tells us the real numbers
+        if any(count for p, count in self.waiting.items() if p < priority):
+            return None # More urgent requests go first
+        if self.in_flight >= settings.GITHUB_MAX_CONCURRENT_PER_TOKEN:
+            return None
+        if self.remaining is not None and self.remaining <= priority * settings.GITHUB_RATE_LIMIT_RESERVE:
+            return max(self.reset_at - now, 1.0)
+        return 0
+
+    def update(self, response: httpx.Response):
+        headers = response.headers
+        if "x-ratelimit-remaining" in headers:
+            try:
+                remaining = int(headers["x-ratelimit-remaining"])
+                reset_at = float(headers.get("x-ratelimit-reset", 0))
+                self.limit = int(headers.get("x-ratelimit-limit", self.limit or 0)) or self.limit
+            except ValueError:
+                return
+            if reset_at != self.reset_at or self.remaining is None:
+                self.reset_at = reset_at
+                self.remaining = remaining
+            else:
+                # Responses arrive out of order; the lowest count is the newest
+                self.remaining = min(self.remaining, remaining)
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.time() + seconds)
+
+    def stats(self) -> dict:
+        now = time.time()
+        return {
+            "limit": self.limit,
+            "remaining": self.remaining,
+            "reset_at": datetime.utcfromtimestamp(self.reset_at).isoformat() if self.reset_at else None,
+            "blocked_for_seconds": round(self.blocked_until - now, 1) if self.blocked_until > now else 0,
+            "in_flight": self.in_flight,
+            "queued": sum(self.waiting.values()),
+        }
+
+_budgets: Dict[Tuple[str, str], TokenBudget] = {}
+
+def _budget(key: str, resource: str) -> TokenBudget:
+    budget = _budgets.get((key, resource))
+    if budget is None:
+        budget = _budgets[(key, resource)] = TokenBudget()
+    return budget
+
+def _max_wait(priority: int) -> float:
+    if priority == scheduler.PRIORITY_INTERACTIVE:
+        return settings.GITHUB_INTERACTIVE_MAX_WAIT_SECONDS
+    return settings.GITHUB_BACKGROUND_MAX_WAIT_SECONDS
+
+async def _acquire(budget: TokenBudget, priority: int, deadline: float) -> Optional[float]:
+    """Wait for a turn. None when acquired, else the seconds after which a retry may succeed."""
+    async with budget.condition:
+        budget.waiting[priority] = budget.waiting.get(priority, 0) + 1
+        try:
+            while True:
+                delay = budget.delay(priority)
+                if delay == 0:
+                    budget.in_flight += 1
+                    if budget.remaining is not None:
+                        budget.remaining -= 1
+                    return None
+                left = deadline - time.monotonic()
+                if delay is not None and delay > left:
+                    return delay
+                if left <= 0:
+                    return 1.0
+                try:
+                    # Woken by a finished request; time-bound so resets and unblocks are noticed
+                    await asyncio.wait_for(budget.condition.wait(), timeout=min(delay or left, left, 5.0))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            budget.waiting[priority] -= 1
+            budget.condition.notify_all()
+
+async def _release(budget: TokenBudget):
+    async with budget.condition:
+        budget.in_flight -= 1
+        budget.condition.notify_all()
+
+def _retry_after(response: httpx.Response, body: bytes, budget: TokenBudget) -> Optional[float]:
+    """Seconds GitHub wants us to wait, if this response is a rate-limit rejection."""
+    if response.status_code not in (403, 429):
+        return None
+    if "retry-after" in response.headers:
+        try:
+            return float(response.headers["retry-after"])
+        except ValueError:
+            pass
+    if response.headers.get("x-ratelimit-remaining") == "0":
+        return max(budget.reset_at - time.time(), 1.0)
+    try:
+        message = (json.loads(body) or {}).get("message", "")
+    except ValueError:
+        message = ""
+    if "rate limit" in message.lower():
+        # Secondary limit without Retry-After: wait at least a minute, doubling on repeats
+        budget.backoff = min(max(budget.backoff * 2, 60.0), 900.0)
+        return budget.backoff
+    return None
+
+def _rejected(retry_after: float) -> httpx.Response:
+    seconds = max(int(retry_after + 0.999), 1)
+    return httpx.Response(
+        429,
+        headers={"Retry-After": str(seconds), "X-Prism-Rate-Limited": "1"},
+        json={"message": f"GitHub rate limit for this token is exhausted; retry in {seconds}s"},
+    )
+
+class RateLimitTransport(httpx.AsyncBaseTransport):
+    """
+    Paces GitHub requests per token (see module comment). A request that can't
+    get a turn within its priority's max wait gets a local 429 with Retry-After
+    instead of spending budget GitHub would reject anyway. A GET rejected by a
+    secondary limit is retried once if the back-off fits in its max wait.
+    """
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.host != "api.github.com":
+            return await self._transport.handle_async_request(request) # OAuth on github.com
+
+        budget = _budget(token_key(_request_token(request)), _resource(request))
+        prio = current_priority.get()
+        deadline = time.monotonic() + _max_wait(prio)
+        retried = False
+        while True:
+            wait = await _acquire(budget, prio, deadline)
+            if wait is not None:
+                print(f"DEBUG: GitHub request {request.url.path} deferred by rate limit ({wait:.0f}s)")
+                return _rejected(wait)
+            try:
+                response = await self._transport.handle_async_request(request)
+                budget.update(response)
+                body = b""
+                if response.status_code in (403, 429):
+                    # Small error body: read it to tell rate limits from permission errors
+                    try:
+                        body = b"".join([part async for part in response.stream])
+                    finally:
+                        await response.aclose()
+                    response = httpx.Response(
+                        response.status_code, headers=response.headers, content=body, extensions=response.extensions
+                    )
+            finally:
+                await _release(budget)
+
+            retry_after = _retry_after(response, body, budget)
+            if retry_after is None:
+                if response.status_code < 400:
+                    budget.backoff = 0.0
+                return response
+            budget.block(retry_after)
+            print(f"DEBUG: GitHub rate limit hit ({response.status_code}), backing off {retry_after:.0f}s")
+            if retried or request.method != "GET" or time.monotonic() + retry_after > deadline:
+                return response
+            retried = True
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+async def budget_for(token: Optional[str]) -> Dict[str, dict]:
+    """Known budgets of a token per resource; seeded from /rate_limit (free) if nothing is known yet."""
+    key = token_key(token)
+    if not any(k == key for k, _ in _budgets):
+        from app.services import http_clients
+        headers = {"Accept": "application/vnd.github.v3+json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        try:
+            response = await http_clients.github().get("https://api.github.com/rate_limit", headers=headers)
+            if response.status_code == 200:
+                for resource, data in (response.json().get("resources") or {}).items():
+                    if resource not in ("core", "graphql", "search"):
+                        continue
+                    budget = _budget(key, resource)
+                    budget.limit = data.get("limit")
+                    budget.remaining = data.get("remaining")
+                    budget.reset_at = float(data.get("reset") or 0)
+        except Exception as e:
+            print(f"DEBUG: Could not read GitHub rate limit: {e}")
+    return {resource: budget.stats() for (k, resource), budget in _budgets.items() if k == key}
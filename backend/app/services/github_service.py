@@ -1,22 +1,22 @@
+import asyncio
 from app.core.config import settings
 from app.models.repository import Repository
 from app.models.pull_request import PullRequest
-from app.models.analysis import Analysis
+from app.models.user import User
+from app.services import http_clients, job_queue, scheduler
 from sqlmodel import select
+from typing import AsyncIterator, List, Optional, Set, Tuple
 import httpx
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncSession
 
-# Duplicate engine creation for now to avoid circular imports or pass it in
-# Ideally, import `async_session` factory
-from app.db.session import engine
+from app.db.session import async_session
 
 async def process_pull_request(payload: dict):
     """
     Handles PR events.
     1. Extract PR details.
     2. Store Repo/PR in DB.
-    3. Trigger Analysis.
+    3. Queue Analysis.
     """
     pr_data = payload.get("pull_request")
     repo_data = payload.get("repository")
@@ -26,10 +26,6 @@ async def process_pull_request(payload: dict):
 
     print(f"Processing PR #{pr_data['number']} in {repo_data['full_name']}")
     
-    async_session = sessionmaker(
-        engine, class_=AsyncSession, expire_on_commit=False
-    )
-    
     async with async_session() as session:
         # 1. Get or Create Repository
         statement = select(Repository).where(Repository.github_repo_id == repo_data["id"])
@@ -62,32 +58,179 @@ async def process_pull_request(payload: dict):
                 author_login=pr_data["user"]["login"],
                 html_url=pr_data["html_url"],
             )
+            update_pr_refs(pr, pr_data)
             session.add(pr)
             await session.commit()
             await session.refresh(pr)
-            
-        # 3. Create Analysis
-        analysis = Analysis(pr_id=pr.id, status="pending")
-        session.add(analysis)
-        await session.commit()
-        await session.refresh(analysis)
-        
-        # 4. Trigger Analysis Logic
-        from app.services import ai_service
-        analysis_result = await ai_service.analyze_pr_content(pr.id, "diff_placeholder")
-        
-        # 5. Update Analysis Record
-        if analysis_result:
-            analysis.status = "completed"
-            analysis.security_score = analysis_result.get("security_score", 0)
-            analysis.performance_score = analysis_result.get("performance_score", 0)
-            analysis.readability_score = analysis_result.get("readability_score", 0)
-            analysis.merge_confidence_score = analysis_result.get("merge_confidence", 0)
-            analysis.raw_llm_output = analysis_result
-            
-            session.add(analysis)
+        elif update_pr_refs(pr, pr_data):
+            session.add(pr)
             await session.commit()
-            await session.refresh(analysis)
+            
+        # 3. Create + Enqueue Analysis (same single-flight queue as the manual triggers)
+        token_owner = await _resolve_token_owner(session, repo)
+        analysis, coalesced = await job_queue.submit_analysis(
+            session,
+            pr.id,
+            head_sha=(pr_data.get("head") or {}).get("sha"),
+            user_id=token_owner.id if token_owner else None,
+            priority=scheduler.PRIORITY_WEBHOOK,
+        )
         
-        print(f"Completed Analysis ID: {analysis.id}")
+        print(f"{'Attached to' if coalesced else 'Queued'} Analysis ID: {analysis.id}")
+
+def update_pr_refs(pr: PullRequest, pr_data: dict) -> bool:
+    """Copy base branch and head/base SHAs from GitHub PR JSON onto the row. True if anything changed."""
+    head = pr_data.get("head") or {}
+    base = pr_data.get("base") or {}
+    changed = False
+    for field, value in (("head_sha", head.get("sha")), ("base_sha", base.get("sha")), ("base_ref", base.get("ref"))):
+        if value and getattr(pr, field) != value:
+            setattr(pr, field, value)
+            changed = True
+    return changed
+
+async def upsert_pull_requests(db: AsyncSession, repo: Repository, prs_data: List[dict]) -> int:
+    """
+    Insert or update PR rows from GitHub PR JSON (REST shape; github_graphql
+    converts its nodes to it). Called once per page while a listing streams in.
+    Commits; returns the number of PRs written.
+    """
+    from dateutil import parser
+
+    if not prs_data:
+        return 0
+    result = await db.execute(select(PullRequest).where(
+        PullRequest.repo_id == repo.id,
+        PullRequest.github_pr_number.in_([pr_data["number"] for pr_data in prs_data]),
+    ))
+    existing = {pr.github_pr_number: pr for pr in result.scalars().all()}
+
+    for pr_data in prs_data:
+        updated_at_dt = parser.parse(pr_data["updated_at"]).replace(tzinfo=None)
+        pr = existing.get(pr_data["number"])
+        if pr:
+            pr.title = pr_data["title"]
+            pr.state = pr_data["state"]
+            pr.body = pr_data.get("body")
+            pr.author_avatar_url = pr_data["user"].get("avatar_url")
+        else:
+            pr = PullRequest(
+                repo_id=repo.id,
+                github_pr_number=pr_data["number"],
+                title=pr_data["title"],
+                state=pr_data["state"],
+                author_login=pr_data["user"]["login"],
+                author_avatar_url=pr_data["user"].get("avatar_url"),
+                html_url=pr_data["html_url"],
+                body=pr_data.get("body"),
+            )
+        update_pr_refs(pr, pr_data)
+        pr.updated_at = updated_at_dt # GitHub's update time, so lists sort by activity
+        db.add(pr)
 
+    await db.commit()
+    return len(prs_data)
+
+async def close_unlisted_pull_requests(db: AsyncSession, repo: Repository, open_numbers: Set[int]) -> int:
+    """
+    Mark the repo's open PRs that a complete listing of open PRs did not
+    include as closed (closed or merged while no webhook reached us).
+    """
+    result = await db.execute(select(PullRequest).where(PullRequest.repo_id == repo.id, PullRequest.state == "open"))
+    closed = 0
+    for pr in result.scalars().all():
+        if pr.github_pr_number not in open_numbers:
+            pr.state = "closed"
+            db.add(pr)
+            closed += 1
+    if closed:
+        await db.commit()
+    return closed
+
+class GitHubAPIError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"GitHub returned {status_code}: {message}")
+        self.status_code = status_code
+
+async def _get_page(url: str, headers: dict, semaphore: Optional[asyncio.Semaphore] = None) -> httpx.Response:
+    if semaphore:
+        async with semaphore:
+            return await _get_page(url, headers)
+    response = await http_clients.github().get(url, headers=headers)
+    if response.status_code != 200:
+        raise GitHubAPIError(response.status_code, response.text[:200])
+    return response
+
+async def fetch_pages(url: str, headers: dict) -> AsyncIterator[Tuple[int, list]]:
+    """
+    Every page of a paginated REST listing, as (page number, items), in
+    arrival order. The first page's Link header tells the last page; the
+    rest are then requested concurrently (GITHUB_PAGINATION_CONCURRENCY at a
+    time), so a listing of any size takes about two round trips. Listings
+    without a last link are followed via next. Raises GitHubAPIError if any
+    page fails: a partial listing must not pass for a complete one.
+    """
+    first = await _get_page(url, headers)
+    yield 1, first.json()
+
+    last = first.links.get("last", {}).get("url")
+    if not last:
+        next_url = first.links.get("next", {}).get("url")
+        page = 1
+        while next_url:
+            page += 1
+            response = await _get_page(next_url, headers)
+            yield page, response.json()
+            next_url = response.links.get("next", {}).get("url")
+        return
+
+    last_url = httpx.URL(last)
+    last_page = int(last_url.params.get("page", 1))
+    if last_page > settings.GITHUB_PAGINATION_MAX_PAGES:
+        raise GitHubAPIError(413, f"{last_page} pages is over GITHUB_PAGINATION_MAX_PAGES")
+
+    semaphore = asyncio.Semaphore(max(1, settings.GITHUB_PAGINATION_CONCURRENCY))
+
+    async def fetch(page: int) -> Tuple[int, list]:
+        response = await _get_page(str(last_url.copy_set_param("page", page)), headers, semaphore)
+        return page, response.json()
+
+    tasks = [asyncio.ensure_future(fetch(page)) for page in range(2, last_page + 1)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def fetch_pr_metadata(full_name: str, pr_number: int, token: Optional[str]) -> Optional[dict]:
+    """
+    PR JSON from GitHub. Triggers use head.sha as the single-flight key and
+    additions + deletions to predict LLM latency.
+    Returns None if GitHub can't be reached; callers then coalesce per PR.
+    """
+    headers = {"Accept": "application/vnd.github.v3+json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    try:
+        client = http_clients.github()
+        response = await client.get(
+            f"https://api.github.com/repos/{full_name}/pulls/{pr_number}",
+            headers=headers,
+            timeout=10,
+        )
+        if response.status_code == 200:
+            return response.json()
+        print(f"DEBUG: Could not fetch PR metadata: {response.status_code}")
+    except Exception as e:
+        print(f"DEBUG: Error fetching PR metadata: {e}")
+    return None
+
+async def _resolve_token_owner(session: AsyncSession, repo: Repository) -> Optional[User]:
+    """
+    Webhooks carry no user token. Use the token of the user who owns the repo, if known.
+    Without one the worker fetches the diff unauthenticated (public repos only).
+    """
+    statement = select(User).where(User.email == repo.owner_login, User.github_token != None)
+    result = await session.execute(statement)
+    return result.scalars().first()
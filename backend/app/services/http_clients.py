@@ -0,0 +1,153 @@
+import time
+from typing import Dict
+
+import httpx
+
+from app.core.config import settings
+from app.services.github_cache import ConditionalCacheTransport
+from app.services.github_scheduler import RateLimitTransport
+
+# Long-lived, pooled HTTP clients shared by every request handler and the
+# worker: keep-alive (and HTTP/2 multiplexing when the h2 package is
+# installed) instead of a TCP + TLS handshake per call.
+# The API creates them in its lifespan hook; the worker and CLI on first use.
+
+GITHUB = "github"
+LLM = "llm"
+
+try:
+    import h2 # noqa: F401 (httpx needs it for http2=True)
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+class _CountedStream(httpx.AsyncByteStream):
+    """Response body that tells the pool meter when the connection is handed back."""
+    def __init__(self, stream: httpx.AsyncByteStream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._on_close:
+                self._on_close()
+                self._on_close = None
+
+class _MeteredTransport(httpx.AsyncBaseTransport):
+    """
+    Pool metrics for one client. Wait time is measured from the request
+    entering the pool to the first connection-level trace event, i.e. the
+    time spent waiting for a free connection (plus connecting, on a miss).
+    """
+    def __init__(self, transport: httpx.AsyncHTTPTransport):
+        self._transport = transport
+        self.requests = 0
+        self.errors = 0
+        self.in_use = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.monotonic()
+        acquired = []
+        inner_trace = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: dict):
+            if not acquired:
+                acquired.append(time.monotonic())
+            if inner_trace:
+                await inner_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        self.requests += 1
+        self.in_use += 1
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            self.errors += 1
+            self.in_use -= 1
+            raise
+
+        wait = (acquired[0] if acquired else time.monotonic()) - started
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+        def release():
+            self.in_use -= 1
+        response.stream = _CountedStream(response.stream, release)
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+    def stats(self) -> dict:
+        connections = list(getattr(getattr(self._transport, "_pool", None), "connections", []))
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_use": self.in_use,
+            "connections": len(connections),
+            "idle": sum(1 for c in connections if c.is_idle()),
+            "avg_wait_ms": round(1000 * self.wait_total / self.requests, 1) if self.requests else 0.0,
+            "max_wait_ms": round(1000 * self.wait_max, 1),
+        }
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+_meters: Dict[str, _MeteredTransport] = {}
+
+def _create(name: str) -> httpx.AsyncClient:
+    http2 = _HTTP2 and settings.HTTP2_ENABLED
+    if name == GITHUB:
+        limits = httpx.Limits(
+            max_connections=settings.GITHUB_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.GITHUB_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_SECONDS,
+        )
+        timeout = httpx.Timeout(settings.GITHUB_HTTP_TIMEOUT_SECONDS, connect=5.0)
+    else:
+        # Few, long requests: inference on CPU takes minutes
+        limits = httpx.Limits(
+            max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_SECONDS,
+        )
+        timeout = httpx.Timeout(settings.LLM_HTTP_TIMEOUT_SECONDS, connect=10.0)
+    meter = _MeteredTransport(httpx.AsyncHTTPTransport(http2=http2, limits=limits, retries=1))
+    _meters[name] = meter
+    # GitHub GETs revalidate with ETags (a 304 is served from github_cache and costs
+    # no rate limit); what does go out is paced per token by github_scheduler
+    transport = ConditionalCacheTransport(RateLimitTransport(meter)) if name == GITHUB else meter
+    return httpx.AsyncClient(transport=transport, timeout=timeout)
+
+def get(name: str) -> httpx.AsyncClient:
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _clients[name] = _create(name)
+    return client
+
+def github() -> httpx.AsyncClient:
+    """Client for api.github.com and github.com (OAuth)."""
+    return get(GITHUB)
+
+def llm() -> httpx.AsyncClient:
+    """Client for the LLM service(s) (HF_LLM_URL, HF_LLM_FAST_URL)."""
+    return get(LLM)
+
+async def startup():
+    for name in (GITHUB, LLM):
+        get(name)
+    print(f"DEBUG: HTTP client pools ready (http2={'on' if _HTTP2 and settings.HTTP2_ENABLED else 'off'})")
+
+async def shutdown():
+    for client in list(_clients.values()):
+        await client.aclose()
+    _clients.clear()
+
+def metrics() -> dict:
+    return {name: meter.stats() for name, meter in _meters.items() if name in _clients}
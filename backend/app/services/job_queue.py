@@ -0,0 +1,355 @@
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+from sqlalchemy import update, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select, or_, and_
+
+from app.core.config import settings
+from app.models.analysis import Analysis
+from app.models.analysis_job import AnalysisJob
+from app.models.pull_request import PullRequest
+from app.services import scheduler
+
+IN_FLIGHT_ANALYSIS_STATUSES = ("pending", "processing")
+IN_FLIGHT_JOB_STATUSES = ("queued", "running")
+
+class RetryRefused(Exception):
+    """resubmit_failed_analysis found the analysis not (or no longer) retryable."""
+
+async def _lock_pr(db: AsyncSession, pr_id: int):
+    """Transaction-scoped advisory lock serializing submits and retries of one PR."""
+    await db.execute(
+        text("SELECT pg_advisory_xact_lock(hashtext('prism-analysis'), :pr_id)"),
+        {"pr_id": pr_id},
+    )
+
+async def submit_analysis(
+    db: AsyncSession,
+    pr_id: int,
+    head_sha: Optional[str] = None,
+    user_id: Optional[int] = None,
+    bypass_cache: bool = False,
+    priority: int = scheduler.PRIORITY_INTERACTIVE,
+) -> Tuple[Analysis, bool]:
+    """
+    Single-flight entry point for every trigger path.
+    If an analysis for the same (PR, head SHA) is already queued or running, return
+    it instead of starting a second LLM run. A transaction-scoped advisory lock on
+    the PR serializes concurrent submits across all API workers and processes.
+    Any in-flight analysis of an older head is superseded by the new one.
+    Returns (analysis, coalesced).
+    """
+    await _lock_pr(db, pr_id)
+
+    in_flight = await find_in_flight_analysis(db, pr_id, head_sha)
+    if in_flight:
+        await db.commit() # Release the advisory lock
+        print(f"DEBUG: Coalesced trigger for PR={pr_id} head={head_sha} into AnalysisID={in_flight.id}")
+        return in_flight, True
+
+    analysis = Analysis(pr_id=pr_id, status="processing", head_sha=head_sha)
+    db.add(analysis)
+    await db.flush()
+    db.add(AnalysisJob(
+        analysis_id=analysis.id,
+        pr_id=pr_id,
+        user_id=user_id,
+        bypass_cache=bypass_cache,
+        priority=priority,
+        virtual_finish=await scheduler.assign_virtual_finish(db, user_id, priority),
+        max_attempts=settings.ANALYSIS_JOB_MAX_ATTEMPTS,
+    ))
+    if head_sha:
+        await supersede_stale_analyses(db, pr_id, head_sha, analysis.id)
+    await db.commit()
+    await db.refresh(analysis)
+    print(f"DEBUG: Enqueued AnalysisID={analysis.id} for PR={pr_id} head={head_sha}")
+    return analysis, False
+
+async def supersede_stale_analyses(
+    db: AsyncSession, pr_id: int, head_sha: str, new_analysis_id: int
+) -> int:
+    """
+    Mark in-flight analyses of older heads as superseded and cancel their jobs.
+    Queued jobs are simply never claimed; running ones are cancelled by their
+    worker, which polls job status (see app.worker) and aborts the in-flight
+    HTTP call to the LLM service. Caller commits.
+    """
+    result = await db.execute(
+        select(Analysis, AnalysisJob)
+        .join(AnalysisJob, AnalysisJob.analysis_id == Analysis.id)
+        .where(
+            Analysis.pr_id == pr_id,
+            Analysis.id != new_analysis_id,
+            Analysis.status.in_(IN_FLIGHT_ANALYSIS_STATUSES),
+            AnalysisJob.status.in_(IN_FLIGHT_JOB_STATUSES),
+            or_(Analysis.head_sha == None, Analysis.head_sha != head_sha),
+        )
+    )
+    now = datetime.utcnow()
+    superseded = 0
+    for stale, job in result.all():
+        stale.status = "superseded"
+        stale.superseded_by = new_analysis_id
+        job.status = "cancelled"
+        job.lease_expires_at = None
+        job.updated_at = now
+        db.add(stale)
+        db.add(job)
+        superseded += 1
+    if superseded:
+        print(f"DEBUG: Superseded {superseded} stale analysis(es) of PR={pr_id} by AnalysisID={new_analysis_id}")
+    return superseded
+
+async def get_job_status(db: AsyncSession, job_id: int) -> Optional[str]:
+    result = await db.execute(select(AnalysisJob.status).where(AnalysisJob.id == job_id))
+    return result.scalar_one_or_none()
+
+async def find_in_flight_analysis(
+    db: AsyncSession, pr_id: int, head_sha: Optional[str] = None
+) -> Optional[Analysis]:
+    """
+    Analysis for this PR head whose job is still queued or running.
+    Requiring a live job means rows orphaned before the queue existed never block new runs.
+    With no head SHA known, any in-flight analysis of the PR matches.
+    """
+    stmt = (
+        select(Analysis)
+        .join(AnalysisJob, AnalysisJob.analysis_id == Analysis.id)
+        .where(
+            Analysis.pr_id == pr_id,
+            Analysis.status.in_(IN_FLIGHT_ANALYSIS_STATUSES),
+            AnalysisJob.status.in_(IN_FLIGHT_JOB_STATUSES),
+        )
+        .order_by(Analysis.created_at.desc())
+    )
+    if head_sha:
+        stmt = stmt.where(Analysis.head_sha == head_sha)
+    result = await db.execute(stmt)
+    return result.scalars().first()
+
+async def enqueue_analysis(
+    db: AsyncSession,
+    analysis_id: int,
+    pr_id: int,
+    user_id: Optional[int] = None,
+    bypass_cache: bool = False,
+    priority: int = scheduler.PRIORITY_INTERACTIVE,
+) -> AnalysisJob:
+    """
+    Persist a job for an existing Analysis row. Any worker process can pick it up.
+    """
+    job = AnalysisJob(
+        analysis_id=analysis_id,
+        pr_id=pr_id,
+        user_id=user_id,
+        bypass_cache=bypass_cache,
+        priority=priority,
+        virtual_finish=await scheduler.assign_virtual_finish(db, user_id, priority),
+        max_attempts=settings.ANALYSIS_JOB_MAX_ATTEMPTS,
+    )
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    print(f"DEBUG: Enqueued Job {job.id} for AnalysisID={analysis_id}")
+    return job
+
+async def resubmit_failed_analysis(
+    db: AsyncSession,
+    analysis_id: int,
+    user_id: Optional[int] = None,
+    priority: int = scheduler.PRIORITY_INTERACTIVE,
+) -> Tuple[Analysis, AnalysisJob]:
+    """
+    Requeue a failed analysis so its next run resumes at the failed stage.
+    Under the same PR lock as submit_analysis, so concurrent retries enqueue
+    one job. Raises RetryRefused if the analysis is not failed (superseded
+    ones included), still has a queued or running job, or reviews a head the
+    PR has since moved past.
+    """
+    analysis = await db.get(Analysis, analysis_id)
+    if not analysis:
+        raise RetryRefused("Analysis not found")
+    await _lock_pr(db, analysis.pr_id)
+    await db.refresh(analysis) # Another retry may have requeued it while we waited
+
+    if analysis.status != "failed":
+        raise RetryRefused(f"Only failed analyses can be retried (status: {analysis.status})")
+    live_job = await db.execute(
+        select(AnalysisJob.id)
+        .where(AnalysisJob.analysis_id == analysis.id, AnalysisJob.status.in_(IN_FLIGHT_JOB_STATUSES))
+        .limit(1)
+    )
+    if live_job.first() is not None:
+        raise RetryRefused("A job for this analysis is already queued or running")
+    pr = await db.get(PullRequest, analysis.pr_id)
+    if pr and pr.head_sha and analysis.head_sha and pr.head_sha != analysis.head_sha:
+        raise RetryRefused("The pull request has a newer head; trigger a new analysis instead")
+
+    analysis.status = "processing"
+    analysis.raw_llm_output = None
+    db.add(analysis)
+    job = AnalysisJob(
+        analysis_id=analysis.id,
+        pr_id=analysis.pr_id,
+        user_id=user_id,
+        priority=priority,
+        virtual_finish=await scheduler.assign_virtual_finish(db, user_id, priority),
+        max_attempts=settings.ANALYSIS_JOB_MAX_ATTEMPTS,
+    )
+    db.add(job)
+    await db.commit() # Releases the lock
+    await db.refresh(job)
+    print(f"DEBUG: Requeued failed AnalysisID={analysis.id} as Job {job.id} (stage {analysis.stage})")
+    return analysis, job
+
+def _runnable(now: datetime):
+    return or_(
+        AnalysisJob.status == "queued",
+        and_(
+            AnalysisJob.status == "running",
+            AnalysisJob.lease_expires_at < now,
+            AnalysisJob.attempts < AnalysisJob.max_attempts,
+        ),
+    )
+
+async def has_runnable_job(db: AsyncSession, below_priority: int) -> bool:
+    """True if a job more urgent than below_priority (a lower number) is waiting to be claimed."""
+    result = await db.execute(
+        select(AnalysisJob.id)
+        .where(_runnable(datetime.utcnow()), AnalysisJob.priority < below_priority)
+        .limit(1)
+    )
+    return result.first() is not None
+
+async def claim_next_job(db: AsyncSession, worker_id: str, priority: Optional[int] = None) -> Optional[AnalysisJob]:
+    """
+    Atomically claim the next runnable job in scheduler order
+    (priority class, then weighted fair share across users, then FIFO).
+    A job is runnable if it is queued, or if it is running but its lease expired
+    (the worker holding it died). SKIP LOCKED lets concurrent workers claim
+    different rows without blocking on each other.
+    priority restricts the claim to one class (the worker fills bulk batches this way).
+    """
+    now = datetime.utcnow()
+    stmt = (
+        select(AnalysisJob)
+        .where(_runnable(now))
+        .order_by(*scheduler.claim_order())
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    if priority is not None:
+        stmt = stmt.where(AnalysisJob.priority == priority)
+    result = await db.execute(stmt)
+    job = result.scalars().first()
+    if not job:
+        await db.rollback()
+        return None
+
+    job.status = "running"
+    job.attempts += 1
+    job.locked_by = worker_id
+    job.started_at = now
+    job.heartbeat_at = now
+    job.lease_expires_at = now + timedelta(seconds=settings.ANALYSIS_JOB_LEASE_SECONDS)
+    job.updated_at = now
+    db.add(job)
+    await scheduler.advance_clock(db, job)
+    await db.commit()
+    await db.refresh(job)
+    return job
+
+async def heartbeat(db: AsyncSession, job_id: int, worker_id: str) -> bool:
+    """
+    Extend the lease of a running job. Returns False if this worker no longer owns it.
+    """
+    now = datetime.utcnow()
+    result = await db.execute(
+        update(AnalysisJob)
+        .where(
+            AnalysisJob.id == job_id,
+            AnalysisJob.locked_by == worker_id,
+            AnalysisJob.status == "running",
+        )
+        .values(
+            heartbeat_at=now,
+            lease_expires_at=now + timedelta(seconds=settings.ANALYSIS_JOB_LEASE_SECONDS),
+            updated_at=now,
+        )
+    )
+    await db.commit()
+    return result.rowcount > 0
+
+async def complete_job(db: AsyncSession, job_id: int, worker_id: str):
+    await db.execute(
+        update(AnalysisJob)
+        .where(
+            AnalysisJob.id == job_id,
+            AnalysisJob.locked_by == worker_id,
+            AnalysisJob.status == "running",
+        )
+        .values(status="completed", lease_expires_at=None, updated_at=datetime.utcnow())
+    )
+    await db.commit()
+
+async def fail_job(db: AsyncSession, job_id: int, worker_id: str, error: str):
+    """
+    Record a crash. The job goes back to the queue until max_attempts is reached,
+    after which the Analysis is marked failed so the UI stops polling.
+    """
+    job = await db.get(AnalysisJob, job_id)
+    if not job or job.locked_by != worker_id or job.status != "running":
+        return
+
+    job.last_error = error[:2000]
+    job.lease_expires_at = None
+    job.updated_at = datetime.utcnow()
+    if job.attempts < job.max_attempts:
+        job.status = "queued"
+        await _mark_analysis_requeued(db, job.analysis_id)
+    else:
+        job.status = "failed"
+        await _mark_analysis_failed(db, job.analysis_id, error)
+    db.add(job)
+    await db.commit()
+
+async def reap_expired_jobs(db: AsyncSession) -> int:
+    """
+    Fail jobs whose lease expired after their last allowed attempt.
+    Jobs with attempts left are re-claimed directly by claim_next_job.
+    """
+    now = datetime.utcnow()
+    result = await db.execute(
+        select(AnalysisJob)
+        .where(
+            AnalysisJob.status == "running",
+            AnalysisJob.lease_expires_at < now,
+            AnalysisJob.attempts >= AnalysisJob.max_attempts,
+        )
+        .with_for_update(skip_locked=True)
+    )
+    jobs = result.scalars().all()
+    for job in jobs:
+        job.status = "failed"
+        job.last_error = job.last_error or "Lease expired (worker lost)"
+        job.updated_at = now
+        db.add(job)
+        await _mark_analysis_failed(db, job.analysis_id, job.last_error)
+    await db.commit()
+    return len(jobs)
+
+async def _mark_analysis_requeued(db: AsyncSession, analysis_id: int):
+    """Undo the pipeline's "failed" while attempts are left: the next run resumes at the failed stage."""
+    analysis = await db.get(Analysis, analysis_id)
+    if analysis and analysis.status == "failed":
+        analysis.status = "processing"
+        analysis.raw_llm_output = None
+        db.add(analysis)
+
+async def _mark_analysis_failed(db: AsyncSession, analysis_id: int, error: str):
+    analysis = await db.get(Analysis, analysis_id)
+    if analysis and analysis.status not in ("completed", "failed"):
+        analysis.status = "failed"
+        analysis.raw_llm_output = {"error": error}
+        db.add(analysis)
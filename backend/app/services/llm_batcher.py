@@ -0,0 +1,59 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.ai_service import LLMServiceError, analyze_pr_batch, analyze_pr_content, is_fallback_result
+
+# Micro-batching of small bulk reviews. Concurrent review() calls for the same
+# endpoint are collected for up to LLM_BATCH_WINDOW_MS (or until
+# LLM_BATCH_MAX_SIZE are waiting) and sent as one /review/batch request.
+
+_pending: Dict[str, List[Tuple[int, str, asyncio.Future]]] = {}
+_timers: Dict[str, asyncio.TimerHandle] = {}
+
+async def review(pr_id: int, diff_content: str, endpoint: Optional[str] = None) -> dict:
+    """
+    Same contract as analyze_pr_content(raise_errors=True), but batched with
+    other callers. Meant for bulk analyses of small diffs: the window adds
+    latency no interactive caller should pay.
+    """
+    endpoint = endpoint or settings.HF_LLM_URL
+    if settings.LLM_BATCH_MAX_SIZE <= 1 or not endpoint:
+        return await analyze_pr_content(pr_id, diff_content, raise_errors=True, endpoint=endpoint)
+
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    batch = _pending.setdefault(endpoint, [])
+    batch.append((pr_id, diff_content, future))
+    if len(batch) >= settings.LLM_BATCH_MAX_SIZE:
+        _flush(endpoint)
+    elif endpoint not in _timers:
+        _timers[endpoint] = loop.call_later(settings.LLM_BATCH_WINDOW_MS / 1000, _flush, endpoint)
+    return await future
+
+def _flush(endpoint: str):
+    timer = _timers.pop(endpoint, None)
+    if timer:
+        timer.cancel()
+    batch = [entry for entry in _pending.pop(endpoint, []) if not entry[2].done()] # Skip cancelled callers
+    if batch:
+        asyncio.ensure_future(_send(endpoint, batch))
+
+async def _send(endpoint: str, batch: List[Tuple[int, str, asyncio.Future]]):
+    try:
+        results = await analyze_pr_batch([(pr_id, diff) for pr_id, diff, _ in batch], endpoint=endpoint)
+    except Exception as e:
+        for _, _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+        return
+
+    print(f"DEBUG: Batched review of {len(batch)} diffs on {endpoint}")
+    for (_, _, future), result in zip(batch, results):
+        if future.done():
+            continue
+        if is_fallback_result(result):
+            # Per-item failure: the caller's stage retry policy handles it like a failed single call
+            future.set_exception(LLMServiceError(result["issues"][0]["description"], retryable=True))
+        else:
+            future.set_result(result)
@@ -0,0 +1,78 @@
+from typing import List, Optional
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.services.ai_service import MODEL_ID
+from app.services.diff_filter import path_matches
+from app.services.diff_parser import FileDiff
+from app.services.token_budget import is_sensitive
+
+TIER_NONE = "none" # Answered without the LLM
+TIER_FAST = "fast" # HF_LLM_FAST_URL
+TIER_FULL = "full" # HF_LLM_URL (Phi-3)
+
+class Route(BaseModel):
+    tier: str
+    reason: str # docs_only, config_only, tiny, sensitive, static_findings, large, medium, unparsed, disabled
+    endpoint: Optional[str] = None # LLM base URL; None for TIER_NONE
+    model_id: Optional[str] = None # Part of cache / memo keys, so tiers never share results
+
+def _full(reason: str) -> Route:
+    return Route(tier=TIER_FULL, reason=reason, endpoint=settings.HF_LLM_URL, model_id=MODEL_ID)
+
+def _kind(file: FileDiff) -> str:
+    if any(path_matches(file.path, glob) for glob in settings.ROUTING_BUILD_GLOBS):
+        return "build"
+    if any(path_matches(file.path, glob) for glob in settings.ROUTING_DOCS_GLOBS):
+        return "docs"
+    if any(path_matches(file.path, glob) for glob in settings.ROUTING_CONFIG_GLOBS):
+        return "config"
+    return "code"
+
+def route(files: List[FileDiff], flagged: bool = False) -> Route:
+    """
+    Pick the cheapest tier that can review the (filtered, minimized) diff.
+    Anything security-sensitive, or flagged by the static scan, goes to the
+    full model regardless of size.
+    """
+    if not settings.ROUTING_ENABLED:
+        return _full("disabled")
+    if not files:
+        return _full("unparsed") # Fallback text, not a diff
+    if flagged:
+        return _full("static_findings")
+
+    if any(is_sensitive(file, hunk) for file in files for hunk in file.hunks):
+        return _full("sensitive")
+
+    changed = sum(file.changed_count for file in files)
+    kinds = {_kind(file) for file in files if file.hunks}
+    if kinds == {"docs"}:
+        return Route(tier=TIER_NONE, reason="docs_only")
+    if kinds <= {"docs", "config"}:
+        return Route(tier=TIER_NONE, reason="config_only")
+    if changed <= settings.ROUTING_TINY_MAX_LINES and "build" not in kinds:
+        return Route(tier=TIER_NONE, reason="tiny")
+
+    if changed >= settings.ROUTING_FULL_MIN_LINES or not settings.HF_LLM_FAST_URL:
+        return _full("large" if changed >= settings.ROUTING_FULL_MIN_LINES else "medium")
+    return Route(tier=TIER_FAST, reason="medium", endpoint=settings.HF_LLM_FAST_URL, model_id=settings.HF_LLM_FAST_MODEL_ID)
+
+_SUMMARIES = {
+    "docs_only": "Documentation-only change. No code was modified, so no code review was needed.",
+    "config_only": "Configuration/data-only change with no security-relevant settings. Reviewed without the LLM.",
+    "tiny": "Small change with no security-sensitive code. Reviewed without the LLM.",
+}
+
+def fast_path_result(reason: str) -> dict:
+    """Result for TIER_NONE: the same defaults analyze_pr_content applies to docs/config diffs, minus the LLM call."""
+    return {
+        "summary": _SUMMARIES.get(reason, _SUMMARIES["tiny"]),
+        "security_score": 85,
+        "performance_score": 88,
+        "reliability_score": 90,
+        "maintainability_score": 87,
+        "merge_confidence": 85,
+        "issues": [],
+        "tier": TIER_NONE,
+    }
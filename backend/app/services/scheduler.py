@@ -0,0 +1,102 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select, func, or_, and_
+
+from app.core.config import settings
+from app.models.analysis_job import AnalysisJob
+from app.models.scheduler import SchedulerAccount
+from app.models.user import User
+
+# Priority classes: lower runs first. Fair sharing only happens within a class.
+PRIORITY_INTERACTIVE = 0 # Someone clicked "Analyze" and is waiting
+PRIORITY_WEBHOOK = 1     # Pushed commits
+PRIORITY_BULK = 2        # Backfills / analyze-all
+
+GLOBAL_KEY = "__global__"
+
+async def user_weight(db: AsyncSession, user_id: Optional[int]) -> float:
+    """Share of LLM time per user, from their plan tier (see PLAN_TIER_WEIGHTS)."""
+    tier = "free"
+    if user_id:
+        user = await db.get(User, user_id)
+        if user and user.plan_tier:
+            tier = user.plan_tier
+    weights = settings.PLAN_TIER_WEIGHTS
+    return max(weights.get(tier, weights.get("free", 1.0)), 0.01)
+
+async def assign_virtual_finish(
+    db: AsyncSession, user_id: Optional[int], priority: int, cost: float = 1.0
+) -> float:
+    """
+    Start-time fair queuing: a job's finish tag is
+        max(user's last finish tag, class virtual time) + cost / weight
+    Jobs are then claimed in finish-tag order, so a user who queues 100 jobs
+    gets their weighted share instead of blocking everyone behind them, and an
+    idle user's first job is not penalized for history. Caller commits.
+    """
+    weight = await user_weight(db, user_id)
+    user_key = f"{priority}:{user_id or 'anon'}"
+    global_key = f"{priority}:{GLOBAL_KEY}"
+
+    await db.execute(
+        insert(SchedulerAccount)
+        .values([{"key": user_key, "virtual_time": 0.0}, {"key": global_key, "virtual_time": 0.0}])
+        .on_conflict_do_nothing(index_elements=["key"])
+    )
+    accounts = await db.execute(
+        select(SchedulerAccount)
+        .where(SchedulerAccount.key.in_([user_key, global_key]))
+        .order_by(SchedulerAccount.key) # Stable lock order
+        .with_for_update()
+    )
+    by_key = {a.key: a for a in accounts.scalars().all()}
+    account, clock = by_key[user_key], by_key[global_key]
+
+    finish = max(account.virtual_time, clock.virtual_time) + cost / weight
+    account.virtual_time = finish
+    account.updated_at = datetime.utcnow()
+    db.add(account)
+    return finish
+
+async def advance_clock(db: AsyncSession, job: AnalysisJob):
+    """Move the class virtual time forward to the finish tag of the job just claimed. Caller commits."""
+    clock = await db.get(SchedulerAccount, f"{job.priority}:{GLOBAL_KEY}", with_for_update=True)
+    if clock and job.virtual_finish > clock.virtual_time:
+        clock.virtual_time = job.virtual_finish
+        clock.updated_at = datetime.utcnow()
+        db.add(clock)
+
+def claim_order():
+    """ORDER BY used when claiming: priority class, then fair-share finish tag, then FIFO."""
+    return (AnalysisJob.priority, AnalysisJob.virtual_finish, AnalysisJob.id)
+
+async def queue_position(db: AsyncSession, analysis_id: int) -> Optional[int]:
+    """
+    1-based position of the analysis among queued jobs, or None if it is not waiting.
+    """
+    result = await db.execute(
+        select(AnalysisJob)
+        .where(AnalysisJob.analysis_id == analysis_id, AnalysisJob.status == "queued")
+        .order_by(AnalysisJob.id.desc())
+    )
+    job = result.scalars().first()
+    if not job:
+        return None
+
+    ahead = await db.execute(
+        select(func.count(AnalysisJob.id)).where(
+            AnalysisJob.status == "queued",
+            or_(
+                AnalysisJob.priority < job.priority,
+                and_(AnalysisJob.priority == job.priority, AnalysisJob.virtual_finish < job.virtual_finish),
+                and_(
+                    AnalysisJob.priority == job.priority,
+                    AnalysisJob.virtual_finish == job.virtual_finish,
+                    AnalysisJob.id < job.id,
+                ),
+            ),
+        )
+    )
+    return ahead.scalar_one() + 1
@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import random
+import re
+from typing import List, Optional, Set, Tuple
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+from app.models.analysis import Analysis
+from app.models.pull_request import PullRequest
+from app.models.similarity import DiffSignature, DiffSignatureBand
+from app.services.ai_service import PROMPT_VERSION, is_fallback_result
+
+# 32 bands x 4 rows: pairs at ~0.7 Jaccard become candidates with high probability,
+# pairs below ~0.4 almost never do.
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(0x5052534D) # Fixed seed: signatures must match across processes
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+_WHITESPACE = re.compile(r"\s+")
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8", errors="replace"), digest_size=8).digest(), "big")
+
+def shingles(diff_content: str) -> Set[int]:
+    """
+    Shingle set of a diff: every changed line and every pair of consecutive changed
+    lines, whitespace-collapsed. Context lines, hunk offsets and blob SHAs are
+    ignored, so cherry-picks, backports and rebases of a change look alike.
+    """
+    changed = []
+    for line in diff_content.splitlines():
+        if line[:1] in ("+", "-") and not line.startswith(("+++", "---")):
+            normalized = _WHITESPACE.sub(" ", line[1:]).strip()
+            if normalized:
+                changed.append(line[0] + normalized)
+
+    result = {_hash(line) for line in changed}
+    result.update(_hash(a + "\n" + b) for a, b in zip(changed, changed[1:]))
+    return result
+
+def minhash(shingle_set: Set[int]) -> List[int]:
+    if not shingle_set:
+        return []
+    return [min((a * h + b) % _PRIME for h in shingle_set) for a, b in _PERMUTATIONS]
+
+def band_keys(signature: List[int]) -> List[str]:
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        keys.append(f"{band}:{hashlib.md5(repr(rows).encode()).hexdigest()[:16]}")
+    return keys
+
+def estimate_similarity(a: List[int], b: List[int]) -> float:
+    """Estimated Jaccard similarity of the two shingle sets."""
+    if not a or len(a) != len(b):
+        return 0.0
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+def signature_for(diff_content: str) -> List[int]:
+    return minhash(shingles(diff_content))
+
+async def compute_signature(diff_content: str) -> List[int]:
+    """signature_for in a thread: 128 permutations over every shingle is seconds of CPU for a large diff."""
+    return await asyncio.to_thread(signature_for, diff_content)
+
+def is_reusable(result) -> bool:
+    """
+    A stored result that may stand in for a new review. Failed LLM calls from
+    before results carried the fallback flag were stored as completed with this
+    placeholder, so they are recognized by shape.
+    """
+    if not isinstance(result, dict) or is_fallback_result(result):
+        return False
+    return not (result.get("summary") == "Analysis failed." and not result.get("score"))
+
+async def index_analysis(
+    db: AsyncSession, analysis_id: int, signature: List[int], prompt_version: Optional[str], model_id: Optional[str]
+):
+    """
+    Add (or replace) an analysis in the index, under the prompt version and
+    model its result was produced with. Results without them (answered without
+    the LLM, or from before they were recorded) are not indexed. Caller commits.
+    """
+    if not signature or not prompt_version or not model_id:
+        return
+    await db.execute(delete(DiffSignatureBand).where(DiffSignatureBand.analysis_id == analysis_id))
+    await db.merge(DiffSignature(
+        analysis_id=analysis_id, prompt_version=prompt_version, model_id=model_id, signature=signature
+    ))
+    for key in band_keys(signature):
+        db.add(DiffSignatureBand(band_key=key, analysis_id=analysis_id))
+
+async def find_similar(
+    db: AsyncSession,
+    signature: List[int],
+    min_similarity: float,
+    repo_id: int,
+    model_id: Optional[str],
+    exclude_analysis_id: Optional[int] = None,
+) -> Optional[Tuple[Analysis, float]]:
+    """
+    Most similar completed analysis (same prompt version and model) of the same
+    repository at or above min_similarity. Other repositories' results are
+    never candidates: reusing or showing them would leak another tenant's review.
+    LSH narrows the search to analyses sharing a band; signatures then rank them.
+    """
+    if not signature or not model_id:
+        return None
+
+    candidates = await db.execute(
+        select(DiffSignature)
+        .join(Analysis, Analysis.id == DiffSignature.analysis_id)
+        .join(PullRequest, PullRequest.id == Analysis.pr_id)
+        .where(
+            DiffSignature.analysis_id.in_(
+                select(DiffSignatureBand.analysis_id).where(DiffSignatureBand.band_key.in_(band_keys(signature)))
+            ),
+            DiffSignature.prompt_version == PROMPT_VERSION,
+            DiffSignature.model_id == model_id,
+            PullRequest.repo_id == repo_id,
+        )
+    )
+    ranked = sorted(
+        (
+            (estimate_similarity(signature, candidate.signature), candidate.analysis_id)
+            for candidate in candidates.scalars().all()
+            if candidate.analysis_id != exclude_analysis_id
+        ),
+        reverse=True,
+    )
+    for similarity, analysis_id in ranked:
+        if similarity < min_similarity:
+            break
+        analysis = await db.get(Analysis, analysis_id)
+        if analysis and analysis.status == "completed" and is_reusable(analysis.raw_llm_output):
+            return analysis, similarity
+    return None
+
+def _prepared_diff(analysis: Analysis, repo_rules: Optional[List[str]]) -> str:
+    """The text the pipeline signs: the prepared (filtered, minimized) diff, not the raw snapshot."""
+    from app.services.analysis_service import prepare_diff
+    from app.services.diff_filter import SkippedFile
+
+    checkpoint = analysis.checkpoint or {}
+    if checkpoint.get("prepared_diff") is not None:
+        return checkpoint["prepared_diff"]
+    skipped = [SkippedFile(**entry) for entry in checkpoint.get("stream_skipped") or []]
+    return prepare_diff(analysis.diff_snapshot, checkpoint.get("diff_fetched", True), repo_rules, skipped).diff
+
+def _backfill_signature(analysis: Analysis, repo_rules: Optional[List[str]]) -> List[int]:
+    return signature_for(_prepared_diff(analysis, repo_rules))
+
+async def backfill(db: AsyncSession, limit: int = 500) -> int:
+    """
+    Index completed analyses that predate the index, newest first. Only those
+    whose checkpoint records the prompt version and model of their result.
+    """
+    from app.models.repository import Repository
+
+    indexed = select(DiffSignature.analysis_id)
+    result = await db.execute(
+        select(Analysis, Repository.review_ignore)
+        .join(PullRequest, PullRequest.id == Analysis.pr_id)
+        .join(Repository, Repository.id == PullRequest.repo_id)
+        .where(
+            Analysis.status == "completed",
+            Analysis.diff_snapshot != None,
+            Analysis.id.not_in(indexed),
+        )
+        .order_by(Analysis.id.desc())
+        .limit(limit)
+    )
+    count = 0
+    for analysis, repo_rules in result.all():
+        checkpoint = analysis.checkpoint or {}
+        prompt_version = checkpoint.get("prompt_version")
+        model_id = (checkpoint.get("route") or {}).get("model_id")
+        if not prompt_version or not model_id or not is_reusable(analysis.raw_llm_output):
+            continue
+        signature = await asyncio.to_thread(_backfill_signature, analysis, repo_rules)
+        await index_analysis(db, analysis.id, signature, prompt_version, model_id)
+        count += 1
+    await db.commit()
+    return count
@@ -0,0 +1,249 @@
+import ast
+import asyncio
+import multiprocessing
+import re
+import textwrap
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.diff_filter import filter_files
+from app.services.diff_parser import FileDiff, parse_diff
+
+# Deterministic checks on added lines. Runs before the LLM, in a process pool,
+# so results are on the Analysis within seconds of the diff being fetched.
+
+_SECRET_PATTERNS: List[Tuple[str, re.Pattern, str]] = [
+    ("aws-access-key", re.compile(r"\b(AKIA|ASIA)[0-9A-Z]{16}\b"), "AWS access key ID"),
+    ("github-token", re.compile(r"\b(ghp|gho|ghu|ghs|ghr)_[A-Za-z0-9]{36}\b|\bgithub_pat_[A-Za-z0-9_]{50,}"), "GitHub token"),
+    ("slack-token", re.compile(r"\bxox[abprs]-[A-Za-z0-9-]{10,}"), "Slack token"),
+    ("stripe-key", re.compile(r"\b(sk|rk)_live_[A-Za-z0-9]{20,}"), "Stripe live key"),
+    ("google-api-key", re.compile(r"\bAIza[0-9A-Za-z_\-]{35}\b"), "Google API key"),
+    ("private-key", re.compile(r"-----BEGIN (RSA |EC |OPENSSH |DSA |PGP )?PRIVATE KEY"), "Private key"),
+    ("hardcoded-credential", re.compile(
+        r"""(?i)\b(password|passwd|pwd|secret|api[_-]?key|access[_-]?token|auth[_-]?token|client[_-]?secret)\b"""
+        r"""["']?\s*[:=]\s*["']([^"'\s]{8,})["']"""
+    ), "Hard-coded credential"),
+]
+# Values that are clearly placeholders, not secrets
+_PLACEHOLDER = re.compile(r"(?i)^(x+|\*+|<.*>|\$\{.*\}|\{\{.*\}\}|changeme|your[_-].*|example.*|placeholder.*|dummy.*|test.*)$")
+
+_SQL = r"\b(select\s.+\sfrom|insert\s+into|update\s+\w+\s+set|delete\s+from)\b"
+_SQL_CONCAT = [
+    re.compile(p, re.IGNORECASE) for p in (
+        _SQL + r".*[\"']\s*(\+|%)\s*\w", # "... WHERE id=" + user_id  /  "..." % name
+        r"\bf[\"'].*" + _SQL + r".*\{", # f"SELECT ... {name}"
+        _SQL + r".*[\"']\s*\.format\(", # "SELECT ... {}".format(name)
+        _SQL + r".*\$\{", # `SELECT ... ${id}`
+    )
+]
+_EVAL = re.compile(r"(?<![\w.])(eval|exec)\s*\(|\bnew\s+Function\s*\(")
+
+_PY_DANGEROUS_CALLS = {
+    "eval": ("security", "high", "eval() on data that may be user-controlled allows code execution.", "Use ast.literal_eval or explicit parsing."),
+    "exec": ("security", "high", "exec() executes arbitrary code.", "Remove exec or restrict it to trusted constants."),
+    "pickle.loads": ("security", "high", "pickle.loads on untrusted data allows code execution.", "Use JSON or another safe format."),
+    "pickle.load": ("security", "high", "pickle.load on untrusted data allows code execution.", "Use JSON or another safe format."),
+    "marshal.loads": ("security", "medium", "marshal.loads is unsafe for untrusted data.", "Use a safe serialization format."),
+    "os.system": ("security", "medium", "os.system runs a shell command; injection risk if any part is user-controlled.", "Use subprocess.run with an argument list."),
+    "hashlib.md5": ("security", "low", "MD5 is broken for security purposes.", "Use hashlib.sha256, or pass usedforsecurity=False if it is not security-related."),
+    "hashlib.sha1": ("security", "low", "SHA-1 is weak for security purposes.", "Use hashlib.sha256."),
+}
+
+def _issue(rule: str, type_: str, severity: str, path: str, line: Optional[int], description: str, suggestion: str) -> dict:
+    return {
+        "type": type_,
+        "severity": severity,
+        "file": path,
+        "location": f"{path}:{line}" if line else path,
+        "description": description,
+        "suggestion": suggestion,
+        "rule": rule,
+        "source": "static",
+    }
+
+def _added_lines(file: FileDiff) -> List[Tuple[int, str]]:
+    """(new-side line number, text) of every added line."""
+    result = []
+    for hunk in file.hunks:
+        line_no = hunk.new_start
+        for line in hunk.lines:
+            if line.startswith("+"):
+                result.append((line_no, line[1:]))
+                line_no += 1
+            elif line.startswith(" ") or line == "":
+                line_no += 1
+    return result
+
+def _line_checks(file: FileDiff) -> List[dict]:
+    issues = []
+    for line_no, text in _added_lines(file):
+        for rule, pattern, label in _SECRET_PATTERNS:
+            match = pattern.search(text)
+            if not match:
+                continue
+            if rule == "hardcoded-credential" and _PLACEHOLDER.match(match.group(2)):
+                continue
+            issues.append(_issue(
+                rule, "security", "high", file.path, line_no,
+                f"{label} committed in source.",
+                "Remove it, rotate the credential and load it from the environment or a secret store.",
+            ))
+            break
+        if any(p.search(text) for p in _SQL_CONCAT):
+            issues.append(_issue(
+                "sql-concatenation", "security", "high", file.path, line_no,
+                "SQL query built by string concatenation/interpolation; possible SQL injection.",
+                "Use parameterized queries (placeholders + bound parameters).",
+            ))
+        if not file.path.endswith(".py") and _EVAL.search(text):
+            issues.append(_issue(
+                "eval", "security", "high", file.path, line_no,
+                "Dynamic code evaluation (eval/exec/new Function).",
+                "Avoid evaluating strings as code; parse the data explicitly.",
+            ))
+    return issues
+
+def _new_side_blocks(file: FileDiff) -> List[Tuple[str, Dict[int, Tuple[int, bool]]]]:
+    """
+    Per hunk: new-side source (context + added lines) and a map from its line
+    numbers to (file line number, was added).
+    """
+    blocks = []
+    for hunk in file.hunks:
+        lines, mapping = [], {}
+        line_no = hunk.new_start
+        for line in hunk.lines:
+            if line.startswith("-") or line.startswith("\\"):
+                continue
+            lines.append(line[1:])
+            mapping[len(lines)] = (line_no, line.startswith("+"))
+            line_no += 1
+        blocks.append(("\n".join(lines), mapping))
+    return blocks
+
+def _parse_fragment(source: str) -> Optional[ast.AST]:
+    """Parse a hunk's worth of Python; hunks often start mid-block, so retry dedented."""
+    for candidate in (source, textwrap.dedent(source)):
+        try:
+            return ast.parse(candidate)
+        except SyntaxError:
+            continue
+    return None
+
+def _call_name(node: ast.Call) -> str:
+    func = node.func
+    if isinstance(func, ast.Name):
+        return func.id
+    if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name):
+        return f"{func.value.id}.{func.attr}"
+    return ""
+
+def _python_checks(file: FileDiff) -> List[dict]:
+    issues = []
+    for source, mapping in _new_side_blocks(file):
+        tree = _parse_fragment(source)
+        if tree is None:
+            continue
+        for node in ast.walk(tree):
+            line = getattr(node, "lineno", None)
+            if line not in mapping or not mapping[line][1]:
+                continue # Only report on added lines
+            file_line = mapping[line][0]
+
+            if isinstance(node, ast.Call):
+                name = _call_name(node)
+                keywords = {kw.arg: kw.value for kw in node.keywords}
+                if name in _PY_DANGEROUS_CALLS:
+                    type_, severity, description, suggestion = _PY_DANGEROUS_CALLS[name]
+                    if name.startswith("hashlib.") and "usedforsecurity" in keywords:
+                        continue
+                    issues.append(_issue(f"py-{name}", type_, severity, file.path, file_line, description, suggestion))
+                elif name == "yaml.load" and "Loader" not in keywords:
+                    issues.append(_issue(
+                        "py-yaml-load", "security", "high", file.path, file_line,
+                        "yaml.load without a safe Loader can construct arbitrary objects.",
+                        "Use yaml.safe_load.",
+                    ))
+                shell = keywords.get("shell")
+                if name.startswith("subprocess.") and isinstance(shell, ast.Constant) and shell.value is True:
+                    issues.append(_issue(
+                        "py-shell-true", "security", "medium", file.path, file_line,
+                        "subprocess call with shell=True; injection risk if arguments are user-controlled.",
+                        "Pass an argument list and drop shell=True.",
+                    ))
+                verify = keywords.get("verify")
+                if isinstance(verify, ast.Constant) and verify.value is False:
+                    issues.append(_issue(
+                        "py-verify-false", "security", "medium", file.path, file_line,
+                        "TLS certificate verification disabled.",
+                        "Keep verify=True (or point it at a CA bundle).",
+                    ))
+            elif isinstance(node, ast.ExceptHandler) and node.type is None:
+                issues.append(_issue(
+                    "py-bare-except", "bug", "low", file.path, file_line,
+                    "Bare except also catches KeyboardInterrupt/SystemExit and hides errors.",
+                    "Catch specific exceptions (at least `except Exception`).",
+                ))
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                for default in node.args.defaults + node.args.kw_defaults:
+                    if isinstance(default, (ast.List, ast.Dict, ast.Set)):
+                        issues.append(_issue(
+                            "py-mutable-default", "bug", "low", file.path, file_line,
+                            f"Mutable default argument in {node.name}() is shared between calls.",
+                            "Default to None and create the object inside the function.",
+                        ))
+                        break
+    return issues
+
+def scan(diff_content: str, repo_rules: Optional[List[str]] = None) -> List[dict]:
+    """
+    Deterministic scan of the added lines of a diff. CPU-bound and picklable:
+    meant to run in the process pool (see run_scan).
+    """
+    files, _ = filter_files(parse_diff(diff_content), repo_rules)
+    issues = []
+    for file in files:
+        if file.is_deleted:
+            continue
+        issues.extend(_line_checks(file))
+        if file.path.endswith((".py", ".pyi")):
+            issues.extend(_python_checks(file))
+
+    # One finding per rule and line
+    seen = set()
+    unique = []
+    for issue in issues:
+        key = (issue["rule"], issue["location"])
+        if key not in seen:
+            seen.add(key)
+            unique.append(issue)
+    return unique[:settings.STATIC_ANALYSIS_MAX_ISSUES]
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn, not fork: the parent runs an event loop and DB connections
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.STATIC_ANALYSIS_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+async def run_scan(diff_content: str, repo_rules: Optional[List[str]] = None) -> List[dict]:
+    """scan() in the process pool, so parsing a large diff never blocks the event loop."""
+    loop = asyncio.get_running_loop()
+    return await asyncio.wait_for(
+        loop.run_in_executor(_get_executor(), scan, diff_content, repo_rules),
+        timeout=settings.STATIC_ANALYSIS_TIMEOUT_SECONDS,
+    )
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def count_vulnerabilities(issues: List[dict]) -> int:
+    return sum(1 for issue in issues if isinstance(issue, dict) and issue.get("type") == "security")
@@ -0,0 +1,143 @@
+import re
+from typing import List, Optional
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.services.ai_service import MODEL_ID
+from app.services.diff_parser import FileDiff, Hunk
+
+# Phi-3 (Llama tokenizer) averages ~3 characters per token on source code;
+# used only when the real tokenizer cannot be loaded.
+_CHARS_PER_TOKEN = 3.0
+
+_tokenizer = None
+_tokenizer_failed = False
+
+def get_tokenizer():
+    """
+    The Phi-3 tokenizer (HF `tokenizers`, no torch needed), loaded once.
+    Returns None if the package is missing or the download fails; counts then fall
+    back to a character estimate.
+    """
+    global _tokenizer, _tokenizer_failed
+    if _tokenizer is None and not _tokenizer_failed:
+        try:
+            from tokenizers import Tokenizer
+            _tokenizer = Tokenizer.from_pretrained(MODEL_ID)
+        except Exception as e:
+            print(f"DEBUG: Tokenizer for {MODEL_ID} unavailable ({e}); estimating token counts")
+            _tokenizer_failed = True
+    return _tokenizer
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return int(len(text) / _CHARS_PER_TOKEN) + 1
+    return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Prefix of text that fits max_tokens. Last-resort guard; the pipeline packs diffs instead."""
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return text[:int(max_tokens * _CHARS_PER_TOKEN)]
+    encoding = tokenizer.encode(text, add_special_tokens=False)
+    if len(encoding.ids) <= max_tokens:
+        return text
+    return text[:encoding.offsets[max_tokens][0]]
+
+# --- Risk ranking ---
+
+_HIGH_RISK_PATH = re.compile(
+    r"auth|login|logout|passw|secret|token|crypt|cipher|hash|jwt|oauth|session|permission|acl|"
+    r"security|sanitiz|csrf|cors|middleware|payment|billing",
+    re.IGNORECASE,
+)
+_LOW_RISK_PATH = re.compile(
+    r"(^|/)(tests?|__tests__|spec|docs?|examples?|fixtures)/|\.(md|rst|txt|snap)$|_test\.|\.test\.|\.spec\.",
+    re.IGNORECASE,
+)
+_SQL = re.compile(r"\b(select\s.+\sfrom|insert\s+into|update\s+\w+\s+set|delete\s+from|drop\s+table|"
+                  r"execute\(|executemany\(|raw\(|text\()", re.IGNORECASE)
+_DANGEROUS_CALL = re.compile(r"\b(eval|exec|pickle\.loads|yaml\.load|subprocess|os\.system|shell=True|"
+                             r"innerHTML|dangerouslySetInnerHTML|verify=False)\b")
+
+def hunk_risk(file: FileDiff, hunk: Hunk) -> float:
+    """
+    Heuristic review priority of a hunk: security-sensitive paths, SQL and
+    dangerous calls in changed lines, and the share of changed vs. context lines.
+    """
+    changed = [line for line in hunk.lines if line[:1] in ("+", "-")]
+    if not changed:
+        return 0.0
+
+    score = 1.0 + len(changed) / max(len(hunk.lines), 1)
+    if _HIGH_RISK_PATH.search(file.path):
+        score += 3.0
+    if _LOW_RISK_PATH.search(file.path):
+        score *= 0.3
+    if any(_SQL.search(line) for line in changed):
+        score += 2.0
+    if any(_DANGEROUS_CALL.search(line) for line in changed):
+        score += 2.0
+    if file.is_new:
+        score += 0.5
+    return round(score, 3)
+
+def is_sensitive(file: FileDiff, hunk: Hunk) -> bool:
+    """Security-relevant path, SQL or a dangerous call among the hunk's changed lines."""
+    if _HIGH_RISK_PATH.search(file.path) or file.path.startswith(".github/workflows/"):
+        return True
+    changed = [line for line in hunk.lines if line[:1] in ("+", "-")]
+    return any(_SQL.search(line) or _DANGEROUS_CALL.search(line) for line in changed)
+
+class OmittedHunk(BaseModel):
+    file: str
+    hunk: str # Hunk header
+    tokens: int
+    risk: float
+
+class PackResult(BaseModel):
+    files: List[FileDiff] # Kept hunks only, original order
+    omitted: List[OmittedHunk] = []
+    tokens: int = 0 # Diff tokens kept
+
+def pack(files: List[FileDiff], budget_tokens: int) -> PackResult:
+    """
+    Fill budget_tokens greedily with the riskiest hunks first. A file's header
+    is charged once, with its first kept hunk. Omitted hunks are reported.
+    """
+    candidates = []
+    for file_index, file in enumerate(files):
+        for hunk_index, hunk in enumerate(file.hunks):
+            candidates.append((hunk_risk(file, hunk), file_index, hunk_index, count_tokens(hunk.render())))
+    # Riskiest first; ties keep diff order
+    candidates.sort(key=lambda c: (-c[0], c[1], c[2]))
+
+    header_tokens = {}
+    kept = set()
+    used = 0
+    omitted: List[OmittedHunk] = []
+    for risk, file_index, hunk_index, tokens in candidates:
+        cost = tokens
+        if file_index not in header_tokens:
+            cost += count_tokens("\n".join(files[file_index].header))
+        if used + cost > budget_tokens:
+            file = files[file_index]
+            omitted.append(OmittedHunk(file=file.path, hunk=file.hunks[hunk_index].header, tokens=tokens, risk=risk))
+            continue
+        header_tokens.setdefault(file_index, cost - tokens)
+        kept.add((file_index, hunk_index))
+        used += cost
+
+    packed = []
+    for file_index, file in enumerate(files):
+        hunks = [hunk for hunk_index, hunk in enumerate(file.hunks) if (file_index, hunk_index) in kept]
+        if hunks:
+            packed.append(file.model_copy(update={"hunks": hunks}))
+    return PackResult(files=packed, omitted=omitted, tokens=used)
+
+def chunk_budget(context: Optional[str] = None) -> int:
+    """Diff tokens that fit in one LLM call next to the PR context."""
+    return max(settings.LLM_CHUNK_MAX_TOKENS - count_tokens(context or ""), 256)
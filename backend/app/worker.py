@@ -0,0 +1,231 @@
+"""
+Standalone analysis worker.
+
+    python -m app.worker --concurrency 4
+
+Claims AnalysisJob rows from Postgres and runs the LLM pipeline outside the API
+process. Any number of workers can run on any number of machines; they only
+share the database.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import traceback
+import uuid
+
+from app.core.config import settings
+from app.db.session import async_session
+from sqlmodel import select
+
+from app.models.analysis_job import AnalysisJob
+from app.models.repository import Repository
+from app.models.user import User
+from app.services import job_queue, similarity_index, token_budget, static_analysis, git_mirror, scheduler, http_clients, github_scheduler, github_cache
+from app.services.github_service import _resolve_token_owner
+from app.utils.github import get_real_repo_name
+from app.services.analysis_service import perform_ai_analysis
+
+async def _heartbeat_loop(job_id: int, worker_id: str, task: asyncio.Task):
+    """
+    Renew the lease while the job runs and watch for cancellation.
+    If the job was cancelled (superseded by a newer PR head) or the lease was lost
+    (another worker reclaimed it after a long stall), stop working on it.
+    Cancelling the task aborts the in-flight HTTP call to the LLM service.
+    """
+    since_beat = 0
+    while not task.done():
+        await asyncio.sleep(settings.ANALYSIS_JOB_CANCEL_POLL_SECONDS)
+        since_beat += settings.ANALYSIS_JOB_CANCEL_POLL_SECONDS
+        try:
+            async with async_session() as db:
+                if await job_queue.get_job_status(db, job_id) == "cancelled":
+                    print(f"WORKER: Job {job_id} was superseded, cancelling")
+                    task.cancel()
+                    return
+                if since_beat < settings.ANALYSIS_JOB_HEARTBEAT_SECONDS:
+                    continue
+                since_beat = 0
+                still_owned = await job_queue.heartbeat(db, job_id, worker_id)
+            if not still_owned:
+                print(f"WORKER: Lost lease on Job {job_id}, cancelling")
+                task.cancel()
+                return
+        except Exception as e:
+            # A transient DB error should not kill the job; the lease covers a few missed beats
+            print(f"WORKER: Heartbeat failed for Job {job_id}: {e}")
+
+async def run_job(job: AnalysisJob, worker_id: str, batched: bool = False):
+    github_token = None
+    if job.user_id:
+        async with async_session() as db:
+            user = await db.get(User, job.user_id)
+            github_token = user.github_token if user else None
+
+    print(f"WORKER: {worker_id} running Job {job.id} (attempt {job.attempts}/{job.max_attempts})")
+    github_scheduler.current_priority.set(job.priority) # Copied into the task: its GitHub calls queue by job class
+    task = asyncio.create_task(perform_ai_analysis(
+        job.analysis_id, job.pr_id, github_token, bypass_cache=job.bypass_cache, batched=batched
+    ))
+    beat = asyncio.create_task(_heartbeat_loop(job.id, worker_id, task))
+    try:
+        await task
+        async with async_session() as db:
+            await job_queue.complete_job(db, job.id, worker_id)
+    except asyncio.CancelledError:
+        # Superseded (nothing left to do) or lease lost (the new owner is responsible)
+        pass
+    except Exception as e:
+        traceback.print_exc()
+        async with async_session() as db:
+            await job_queue.fail_job(db, job.id, worker_id, str(e))
+    finally:
+        beat.cancel()
+
+async def worker_slot(slot: int, worker_id: str, stop: asyncio.Event, capacity: asyncio.Semaphore):
+    """
+    Claims and runs jobs. Every running job holds one unit of capacity (the
+    process's --concurrency), including the extra jobs of a bulk batch.
+    """
+    while not stop.is_set():
+        await capacity.acquire()
+        if stop.is_set():
+            capacity.release()
+            break
+        try:
+            async with async_session() as db:
+                job = await job_queue.claim_next_job(db, worker_id)
+        except Exception as e:
+            print(f"WORKER: Slot {slot} failed to claim a job: {e}")
+            job = None
+
+        if job and job.priority == scheduler.PRIORITY_BULK and settings.LLM_BATCH_MAX_SIZE > 1:
+            # Bulk jobs run in groups so their small LLM calls can share batch requests.
+            # The batch only grows with free capacity and while nothing more urgent is waiting.
+            jobs = [job]
+            held = 1 # Capacity units this batch holds
+            try:
+                async with async_session() as db:
+                    while len(jobs) < settings.LLM_BATCH_MAX_SIZE and not capacity.locked():
+                        if await job_queue.has_runnable_job(db, scheduler.PRIORITY_BULK):
+                            break
+                        if capacity.locked():
+                            break
+                        await capacity.acquire() # Not locked, so this returns at once
+                        held += 1
+                        extra = await job_queue.claim_next_job(db, worker_id, priority=scheduler.PRIORITY_BULK)
+                        if not extra:
+                            break
+                        jobs.append(extra)
+            except Exception as e:
+                print(f"WORKER: Slot {slot} failed to fill a bulk batch: {e}")
+            try:
+                await asyncio.gather(*(run_job(j, worker_id, batched=True) for j in jobs))
+            finally:
+                for _ in range(held):
+                    capacity.release()
+            continue
+        if job:
+            try:
+                await run_job(job, worker_id)
+            finally:
+                capacity.release()
+            continue
+
+        capacity.release()
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.ANALYSIS_WORKER_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+async def reaper(stop: asyncio.Event):
+    """Fail jobs that ran out of attempts while their worker was gone; trim the GitHub response cache."""
+    while not stop.is_set():
+        try:
+            async with async_session() as db:
+                reaped = await job_queue.reap_expired_jobs(db)
+            if reaped:
+                print(f"WORKER: Reaped {reaped} expired job(s)")
+        except Exception as e:
+            print(f"WORKER: Reaper error: {e}")
+        try:
+            async with async_session() as db:
+                evicted = await github_cache.maintain(db)
+            if evicted:
+                print(f"WORKER: Evicted {evicted} GitHub cache entries")
+        except Exception as e:
+            print(f"WORKER: GitHub cache maintenance error: {e}")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.ANALYSIS_JOB_LEASE_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+async def mirror_sync(stop: asyncio.Event):
+    """Clone missing mirrors of active repos and fetch the rest (GIT_MIRROR_DIR)."""
+    while not stop.is_set():
+        try:
+            async with async_session() as db:
+                result = await db.execute(select(Repository).where(Repository.is_active == True))
+                repos = result.scalars().all()
+                targets = []
+                for repo in repos:
+                    owner = await _resolve_token_owner(db, repo)
+                    targets.append((get_real_repo_name(repo), owner.github_token if owner else None))
+            for full_name, token in targets:
+                if stop.is_set():
+                    break
+                await git_mirror.sync(full_name, token)
+        except Exception as e:
+            print(f"WORKER: Mirror sync error: {e}")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.GIT_MIRROR_REFRESH_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+async def main(concurrency: int):
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    stop = asyncio.Event()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass # Windows
+
+    print(f"WORKER: {worker_id} started with concurrency={concurrency}")
+    try:
+        async with async_session() as db:
+            indexed = await similarity_index.backfill(db)
+        if indexed:
+            print(f"WORKER: Added {indexed} past analyses to the similarity index")
+    except Exception as e:
+        print(f"WORKER: Similarity index backfill failed: {e}")
+
+    # Load (and on first run download) the tokenizer before the first job needs it
+    await asyncio.to_thread(token_budget.get_tokenizer)
+
+    # In-flight jobs finish on shutdown; slots just stop claiming new ones
+    capacity = asyncio.Semaphore(concurrency)
+    background = [reaper(stop)]
+    if git_mirror.enabled():
+        background.append(mirror_sync(stop))
+    await asyncio.gather(
+        *background,
+        *(worker_slot(i, worker_id, stop, capacity) for i in range(concurrency)),
+    )
+    static_analysis.shutdown()
+    await http_clients.shutdown()
+    print(f"WORKER: {worker_id} stopped")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PRISM analysis worker")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=settings.ANALYSIS_WORKER_CONCURRENCY,
+        help="Number of analyses this process runs at the same time",
+    )
+    args = parser.parse_args()
+    asyncio.run(main(max(1, args.concurrency)))
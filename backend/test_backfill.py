@@ -0,0 +1,62 @@
+import argparse
+import asyncio
+import json
+
+import httpx
+
+from app import cli
+from app.core.config import settings
+from app.services import http_clients
+
+# backfill --diff-dir against the stub LLM (python -m app.cli stub-llm), served in-process
+
+SENSITIVE_DIFF = """diff --git a/app/auth.py b/app/auth.py
+index 1111111..2222222 100644
+--- a/app/auth.py
++++ b/app/auth.py
+@@ -1,3 +1,5 @@
+ def login(user):
+-    return check(user)
++    password = "hunter2"
++    result = eval(user.expression)
++    return check(user, password, result)
+"""
+
+def _args(tmp_path, **overrides) -> argparse.Namespace:
+    values = dict(
+        repo=None, diff_dir=str(tmp_path / "diffs"), token=None, limit=1000, since=None, merged_only=False,
+        concurrency=2, batch_size=1, checkpoint=str(tmp_path / "checkpoint.json"), llm_url=None,
+        output=str(tmp_path / "out.jsonl"), dry_run=True,
+    )
+    values.update(overrides)
+    return argparse.Namespace(**values)
+
+def _run(args: argparse.Namespace) -> cli.Backfill:
+    http_clients._clients[http_clients.LLM] = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=cli.stub_llm_app(latency_ms=0)), timeout=30
+    )
+    backfill = cli.Backfill(args)
+    asyncio.run(backfill.run())
+    return backfill
+
+def test_backfill_reviews_diff_files_and_resumes(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "HF_LLM_URL", "http://stub-llm")
+    monkeypatch.setattr(settings, "HF_LLM_FAST_URL", None)
+    (tmp_path / "diffs").mkdir()
+    for number in (101, 102, 103):
+        (tmp_path / "diffs" / f"{number}-auth.diff").write_text(SENSITIVE_DIFF)
+
+    first = _run(_args(tmp_path, limit=2))
+    assert (first.processed, first.failed, first.resumed) == (2, 0, 0)
+    state = json.loads((tmp_path / "checkpoint.json").read_text())
+    assert state["done"] == ["file:101-auth.diff", "file:102-auth.diff"]
+
+    # A second run skips what the state file lists and reviews the rest
+    second = _run(_args(tmp_path))
+    assert (second.processed, second.failed, second.resumed) == (1, 0, 2)
+    state = json.loads((tmp_path / "checkpoint.json").read_text())
+    assert len(state["done"]) == 3
+
+    rows = [json.loads(line) for line in (tmp_path / "out.jsonl").read_text().splitlines()]
+    assert sorted(row["number"] for row in rows) == [101, 102, 103]
+    assert all(row["tier"] == "full" and row["issues"] >= 2 for row in rows) # Stub flags eval and the password
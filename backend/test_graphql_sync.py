@@ -0,0 +1,49 @@
+import asyncio
+
+import httpx
+
+from app import cli
+from app.core.config import settings
+from app.models.repository import Repository
+from app.services import github_graphql, http_clients
+
+# github_graphql.fetch_open_prs against the GraphQL stub (python -m app.cli stub-github), served in-process
+
+def _repo(repo_id: int, name: str) -> Repository:
+    return Repository(
+        id=repo_id, github_repo_id=repo_id, name=name, full_name=f"octo/{name}",
+        owner_login="octo", html_url=f"https://github.com/octo/{name}",
+    )
+
+REPOS = [_repo(1, "alpha"), _repo(2, "beta"), _repo(3, "missing"), _repo(4, "gamma")]
+
+def _fetch(monkeypatch, rate_limit: int):
+    monkeypatch.setattr(settings, "GITHUB_GRAPHQL_URL", "http://stub-github/graphql")
+    monkeypatch.setattr(settings, "GITHUB_GRAPHQL_REPOS_PER_QUERY", 2)
+    http_clients._clients[http_clients.GITHUB] = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=cli.stub_github_app(prs_per_repo=5, rate_limit=rate_limit))
+    )
+
+    async def fetch():
+        try:
+            return await github_graphql.fetch_open_prs("token", REPOS, per_repo=2)
+        finally:
+            await http_clients.shutdown()
+    return asyncio.run(fetch())
+
+def test_pages_every_repository_and_reports_failed_aliases(monkeypatch):
+    prs, report = _fetch(monkeypatch, rate_limit=5000)
+    assert sorted(prs) == [1, 2, 4]
+    for repo_id in (1, 2, 4):
+        assert [pr["number"] for pr in prs[repo_id]] == [5, 4, 3, 2, 1] # Three pages of two
+        assert all(pr["state"] == "open" and pr["head"]["sha"] for pr in prs[repo_id])
+    assert report["failed"] == [3]
+    assert report["deferred"] == []
+    assert report["queries"] == 5
+
+def test_defers_incomplete_repositories_when_the_budget_runs_out(monkeypatch):
+    prs, report = _fetch(monkeypatch, rate_limit=2)
+    assert report["queries"] == 2
+    assert report["remaining"] == 0
+    assert report["deferred"] == [1, 2, 4]
+    assert prs == {} # Partial listings would close PRs that are still open
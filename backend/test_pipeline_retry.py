@@ -0,0 +1,90 @@
+import asyncio
+
+from app.services import analysis_service
+from app.services.ai_service import LLMServiceError
+from app.services.analysis_service import AnalysisPipeline, RetryPolicy
+
+class FakeSession:
+    """Stands in for AsyncSession: rollback expires loaded objects until they are refreshed."""
+    def __init__(self):
+        self.expired = set()
+        self.rollbacks = 0
+
+    async def rollback(self):
+        self.rollbacks += 1
+        self.expired = {"analysis", "pr", "repo"}
+
+    async def refresh(self, obj):
+        self.expired.discard(obj.kind)
+
+class Row:
+    def __init__(self, kind):
+        self.kind = kind
+
+def test_infer_retries_after_transient_llm_error(monkeypatch):
+    monkeypatch.setitem(
+        analysis_service.RETRY_POLICIES, "infer", RetryPolicy(max_attempts=3, base_delay=0.0, max_delay=0.0)
+    )
+    db = FakeSession()
+    pipeline = AnalysisPipeline(db, Row("analysis"), Row("pr"), Row("repo"), github_token=None)
+    attempts = []
+
+    async def infer():
+        # Touching an expired object on an AsyncSession raises MissingGreenlet
+        assert not db.expired, f"stage ran with expired objects: {db.expired}"
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise LLMServiceError("HF Space cold start (503)", retryable=True)
+        return True
+
+    assert asyncio.run(pipeline._run_stage("infer", infer)) is True
+    assert len(attempts) == 2
+    assert db.rollbacks == 1
+
+class Stored:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+class StoreSession(FakeSession):
+    """FakeSession that also serves rows by model and records commits."""
+    def __init__(self, rows):
+        super().__init__()
+        self.rows = rows
+        self.commits = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def get(self, model, key):
+        return self.rows.get(model.__name__)
+
+    def add(self, obj):
+        pass
+
+    async def commit(self):
+        self.commits += 1
+
+    async def refresh(self, obj, attribute_names=None):
+        pass
+
+def test_pipeline_error_reaches_the_worker(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path) # perform_ai_analysis appends to backend_debug.log
+    analysis = Stored(id=1, status="processing", stage="infer", raw_llm_output=None)
+    db = StoreSession({"Analysis": analysis, "PullRequest": Stored(id=2, repo_id=3), "Repository": Stored(id=3)})
+    monkeypatch.setattr(analysis_service, "async_session", lambda: db)
+
+    async def run(self):
+        raise LLMServiceError("model returned garbage")
+    monkeypatch.setattr(AnalysisPipeline, "run", run)
+
+    try:
+        asyncio.run(analysis_service.perform_ai_analysis(1, 2, github_token=None))
+    except LLMServiceError:
+        pass
+    else:
+        raise AssertionError("perform_ai_analysis swallowed the error; fail_job would never run")
+    assert analysis.status == "failed"
+    assert analysis.raw_llm_output["failed_stage"] == "infer"
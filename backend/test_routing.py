@@ -0,0 +1,26 @@
+from app.services import model_router
+from app.services.diff_parser import parse_diff
+
+def _diff(path: str, removed: str, added: str) -> str:
+    return (
+        f"diff --git a/{path} b/{path}\n"
+        f"index 1111111..2222222 100644\n"
+        f"--- a/{path}\n"
+        f"+++ b/{path}\n"
+        f"@@ -1,2 +1,2 @@\n"
+        f" flask==3.0.0\n"
+        f"-{removed}\n"
+        f"+{added}\n"
+    )
+
+def test_requirements_change_is_reviewed_by_the_llm():
+    route = model_router.route(parse_diff(_diff("requirements.txt", "requests==2.31.0", "requests==2.32.3")))
+    assert route.tier != model_router.TIER_NONE, route
+
+def test_build_file_change_is_reviewed_by_the_llm():
+    route = model_router.route(parse_diff(_diff("CMakeLists.txt", "set(CMAKE_CXX_STANDARD 17)", "set(CMAKE_CXX_STANDARD 20)")))
+    assert route.tier != model_router.TIER_NONE, route
+
+def test_docs_change_skips_the_llm():
+    route = model_router.route(parse_diff(_diff("docs/usage.md", "Run the server.", "Run the API server.")))
+    assert route.tier == model_router.TIER_NONE and route.reason == "docs_only", route
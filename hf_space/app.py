@@ -1,5 +1,6 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
+from typing import List
 import torch
 from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
 import json
@@ -17,11 +18,18 @@ tokenizer = None
 pipe = None
 
 MODEL_ID = "microsoft/Phi-3-mini-4k-instruct"
+CONTEXT_TOKENS = 4096
+MAX_NEW_TOKENS = 1024
+
+MAX_BATCH_SIZE = 8
 
 class ReviewRequest(BaseModel):
     diff: str
     truncated: bool = False
 
+class BatchReviewRequest(BaseModel):
+    items: List[ReviewRequest]
+
 @app.on_event("startup")
 async def load_model():
     global model, tokenizer, pipe
@@ -29,6 +37,10 @@ async def load_model():
     try:
         # Load model with optimizations for limited memory/CPU
         tokenizer = AutoTokenizer.from_pretrained(MODEL_ID, trust_remote_code=True)
+        # Batched generation pads prompts on the left so every sequence ends where decoding starts
+        tokenizer.padding_side = "left"
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
         model = AutoModelForCausalLM.from_pretrained(
             MODEL_ID,
             device_map="cpu", 
@@ -41,7 +53,7 @@ async def load_model():
             "text-generation",
             model=model,
             tokenizer=tokenizer,
-            max_new_tokens=1024,
+            max_new_tokens=MAX_NEW_TOKENS,
             return_full_text=False
         )
         logger.info("Model loaded successfully.")
@@ -49,65 +61,107 @@ async def load_model():
         logger.error(f"Failed to load model: {e}")
         raise RuntimeError(f"Model load failed: {e}")
 
-@app.post("/review")
-async def review_diff(request: ReviewRequest):
-    if not pipe:
-        raise HTTPException(status_code=503, detail="Model not initialized")
-
-    logger.info(f"Received review request. Length: {len(request.diff)}")
-    
-    # Construct prompt
-    system_prompt = """You are an expert Senior Code Reviewer. Analyze the git diff provided.
+SYSTEM_PROMPT = """You are an expert Senior Code Reviewer. Analyze the git diff provided.
     Identify: 
     1. Bugs 
     2. Security vulnerabilities 
     3. Performance Note
+    The diff may cover several files; each starts with a "diff --git a/<path> b/<path>" line.
     
     Output STRICT VALID JSON with this structure:
     {
       "summary": "Short summary",
-      "issues": [{"type": "bug|security|performance|code_quality", "severity": "low|medium|high", "description": "...", "suggestion": "..."}],
+      "issues": [{"file": "<path from the diff --git line>", "type": "bug|security|performance|code_quality", "severity": "low|medium|high", "description": "...", "suggestion": "..."}],
       "merge_confidence": <0-100>
     }
     """
+
+def build_messages(diff: str) -> list:
+    # Extra safeguard, in tokens: whatever the system prompt and the answer leave of the context
+    budget = CONTEXT_TOKENS - MAX_NEW_TOKENS - len(tokenizer.encode(SYSTEM_PROMPT)) - 64
+    diff_ids = tokenizer.encode(diff, add_special_tokens=False)
+    if len(diff_ids) > budget:
+        logger.info(f"Diff is {len(diff_ids)} tokens, trimming to {budget}")
+        diff = tokenizer.decode(diff_ids[:budget])
+    user_prompt = f"Review this code diff:\n\n{diff}"
     
-    user_prompt = f"Review this code diff:\n\n{request.diff[:8000]}" # Extra safeguard
-    
-    messages = [
-        {"role": "system", "content": system_prompt},
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "user", "content": user_prompt},
     ]
 
+def parse_output(generated_text: str) -> dict:
+    # Phi-3 often chats, we need to extract JSON
+    # It usually outputs clean text if instructed well, but let's try to parse
+    # Simple heuristic to find JSON start/end
+    json_start = generated_text.find('{')
+    json_end = generated_text.rfind('}') + 1
+    
+    if json_start != -1 and json_end != -1:
+        json_str = generated_text[json_start:json_end]
+        return json.loads(json_str)
+    else:
+        # Fallback if strict JSON fails
+        logger.warning("Could not find JSON brackets. Returning text wrapped.")
+        return {
+            "summary": "Model output was not valid JSON but here is the text.",
+            "issues": [],
+            "merge_confidence": 0,
+            "raw_text": generated_text
+        }
+
+@app.post("/review")
+async def review_diff(request: ReviewRequest):
+    if not pipe:
+        raise HTTPException(status_code=503, detail="Model not initialized")
+
+    logger.info(f"Received review request. Length: {len(request.diff)}")
+    messages = build_messages(request.diff)
+
     try:
         # Generate
-        output = pipe(messages, max_new_tokens=1024, do_sample=False, temperature=0.1)
+        output = pipe(messages, max_new_tokens=MAX_NEW_TOKENS, do_sample=False, temperature=0.1)
         generated_text = output[0]['generated_text']
-        
-        # Phi-3 often chats, we need to extract JSON
-        # It usually outputs clean text if instructed well, but let's try to parse
         logger.info("Generation complete. Parsing...")
-        
-        # Simple heuristic to find JSON start/end
-        json_start = generated_text.find('{')
-        json_end = generated_text.rfind('}') + 1
-        
-        if json_start != -1 and json_end != -1:
-            json_str = generated_text[json_start:json_end]
-            return json.loads(json_str)
-        else:
-            # Fallback if strict JSON fails
-            logger.warning("Could not find JSON brackets. Returning text wrapped.")
-            return {
-                "summary": "Model output was not valid JSON but here is the text.",
-                "issues": [],
-                "merge_confidence": 0,
-                "raw_text": generated_text
-            }
+        return parse_output(generated_text)
 
     except Exception as e:
         logger.error(f"Inference error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/review/batch")
+async def review_batch(request: BatchReviewRequest):
+    """
+    Several small diffs in one padded generation batch: on CPU this keeps the
+    matrix units busy instead of decoding one sequence at a time.
+    Results are returned in request order; an item that fails to parse gets
+    {"error": ...} without failing the others.
+    """
+    if not pipe:
+        raise HTTPException(status_code=503, detail="Model not initialized")
+    if not request.items:
+        return {"results": []}
+    if len(request.items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SIZE} items per batch")
+
+    logger.info(f"Received batch of {len(request.items)} reviews")
+    conversations = [build_messages(item.diff) for item in request.items]
+    try:
+        outputs = pipe(
+            conversations, batch_size=len(conversations), max_new_tokens=MAX_NEW_TOKENS, do_sample=False, temperature=0.1
+        )
+    except Exception as e:
+        logger.error(f"Batch inference error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    results = []
+    for output in outputs:
+        try:
+            results.append(parse_output(output[0]['generated_text']))
+        except Exception as e:
+            results.append({"error": f"Could not parse model output: {e}"})
+    return {"results": results}
+
 @app.get("/")
 def home():
     return {"status": "Model active", "model": MODEL_ID}